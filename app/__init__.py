@@ -2,19 +2,35 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 from flask_migrate import Migrate
+from reportlab import rl_config
 from config import Config
 
 db = SQLAlchemy()
 mail = Mail()
 migrate = Migrate()
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
     
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # Ticket PDFs: write binary streams instead of ASCII85 (a pure Python encoder that only makes the
+    # files bigger). reportlab reads this from rl_config whenever it writes a stream and has no
+    # per-canvas switch, so it is set once here for the process, where it is visible
+    rl_config.useA85 = 0
+    
+    # Per-show revenue totals follow every booking change
+    from app.utils.revenue import register_revenue_rollup
+    register_revenue_rollup()
+    
+    # Audit events are written in bulk when the request's transaction commits
+    from app.utils.audit import register_audit_writer
+    register_audit_writer()
+    
     # Initialize mail with default config first
     mail.init_app(app)
     
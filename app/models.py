@@ -1,8 +1,25 @@
 from datetime import datetime
-import random
+import os
+import secrets
 import string
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
 from app import db
 
+# Process-local copy of the Settings table, shared by all requests in a worker.
+# 'version' is the token read from the settings version file when 'values' was loaded.
+_settings_cache = {'version': None, 'values': None}
+
+BOOKING_REFERENCE_ALPHABET = string.ascii_uppercase + string.digits
+
+def upsert(model):
+    """INSERT for model that supports ON CONFLICT on this database (SQLite or PostgreSQL)"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
 class Show(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.String(50), nullable=False)
@@ -21,12 +38,6 @@ class Show(db.Model):
     @property
     def is_sold_out(self):
         return self.available_tickets <= 0
-    
-    def update_availability(self):
-        """Update available tickets count based on confirmed bookings"""
-        confirmed_bookings = Booking.query.filter_by(show_id=self.id, status='confirmed').all()
-        total_booked = sum(booking.adult_tickets + booking.student_tickets for booking in confirmed_bookings)
-        self.available_tickets = max(0, self.total_tickets - total_booked)
 
 class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,6 +58,13 @@ class Booking(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     confirmed_at = db.Column(db.DateTime)
     
+    # NOCASE indexes let SQLite answer prefix searches (LIKE 'abc%') from the index
+    __table_args__ = (
+        db.Index('ix_booking_reference_nocase', db.text('booking_reference COLLATE NOCASE')),
+        db.Index('ix_booking_first_name_nocase', db.text('first_name COLLATE NOCASE')),
+        db.Index('ix_booking_last_name_nocase', db.text('last_name COLLATE NOCASE')),
+    )
+    
     def __repr__(self):
         return f'<Booking {self.first_name} {self.last_name} - {self.show.start_time}>'
     
@@ -60,13 +78,24 @@ class Booking(db.Model):
     
     @staticmethod
     def generate_booking_reference():
-        """Generate a unique 5-character booking reference"""
-        while True:
-            # Generate 5-character alphanumeric string
-            ref = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
-            # Check if it's already used
-            if not Booking.query.filter_by(booking_reference=ref).first():
-                return ref
+        """Generate a random 5-character booking reference (uniqueness is enforced on insert)"""
+        return ''.join(secrets.choice(BOOKING_REFERENCE_ALPHABET) for _ in range(5))
+    
+    def add_with_unique_reference(self, max_attempts=10):
+        """Add the booking to the session, drawing a new reference if the unique constraint is hit"""
+        # No pre-check SELECT: the insert itself is the check, inside a savepoint so a
+        # collision only undoes this booking and not the caller's transaction
+        for attempt in range(max_attempts):
+            self.booking_reference = Booking.generate_booking_reference()
+            try:
+                with db.session.begin_nested():
+                    db.session.add(self)
+            except IntegrityError as e:
+                if 'booking_reference' not in str(e.orig):
+                    raise
+                continue
+            return self.booking_reference
+        raise RuntimeError(f"Could not find a free booking reference after {max_attempts} attempts")
 
 class Buyer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -104,6 +133,13 @@ class Ticket(db.Model):
     booking = db.relationship('Booking', backref='tickets', lazy=True)
     show = db.relationship('Show', backref='tickets', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_ticket_show_id', 'show_id'),
+        db.Index('ix_ticket_is_used', 'is_used'),
+        db.Index('ix_ticket_booking_id', 'booking_id'),
+        db.Index('ix_ticket_reference_nocase', db.text('ticket_reference COLLATE NOCASE')),
+    )
+    
     def __repr__(self):
         return f'<Ticket {self.ticket_reference} - {self.ticket_type}>'
     
@@ -124,10 +160,122 @@ class AuditLog(db.Model):
     details = db.Column(db.Text, nullable=True)  # JSON string for additional context
     old_value = db.Column(db.Text, nullable=True)  # JSON string for before state
     new_value = db.Column(db.Text, nullable=True)  # JSON string for after state
+    booking_reference = db.Column(db.String(10), nullable=True)  # Booking the event concerns, if any
+    ticket_reference = db.Column(db.String(20), nullable=True)  # Ticket the event concerns, if any
+    
+    __table_args__ = (
+        db.Index('ix_audit_log_timestamp', 'timestamp'),
+        db.Index('ix_audit_log_booking_reference_timestamp', 'booking_reference', 'timestamp'),
+        db.Index('ix_audit_log_ticket_reference', 'ticket_reference'),
+        db.Index('ix_audit_log_action_type_timestamp', 'action_type', 'timestamp'),
+        db.Index('ix_audit_log_user_identifier_timestamp', 'user_identifier', 'timestamp'),
+        db.Index('ix_audit_log_entity', 'entity_type', 'entity_id'),
+        # Ids of archived events must never be handed out again (segment names, keyset cursors, history)
+        {'sqlite_autoincrement': True},
+    )
     
     def __repr__(self):
         return f'<AuditLog {self.action_type} - {self.entity_type}:{self.entity_id}>'
 
+class AuditFacet(db.Model):
+    """Distinct audit log filter values with row counts, kept up to date by app.utils.audit"""
+    facet = db.Column(db.String(20), primary_key=True)  # action, entity, user
+    value = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AuditFacet {self.facet}={self.value}: {self.count}>'
+
+class AuditArchiveSegment(db.Model):
+    """One gzip JSONL file of archived audit events (written by app.utils.audit_archive)"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(100), unique=True, nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    facets = db.Column(db.Text, nullable=False)  # JSON {facet: {value: rows}} for skipping segments
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AuditArchiveSegment {self.filename} ({self.rows} rows)>'
+
+class AuditArchiveReference(db.Model):
+    """Which archive segments hold events of a booking, so a history lookup opens only those"""
+    booking_reference = db.Column(db.String(10), primary_key=True)
+    segment_id = db.Column(db.Integer, db.ForeignKey('audit_archive_segment.id'), primary_key=True)
+    
+    def __repr__(self):
+        return f'<AuditArchiveReference {self.booking_reference} -> {self.segment_id}>'
+
+class EmailJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # booking_confirmation, payment_confirmed, etc.
+    payload = db.Column(db.Text, nullable=False)  # JSON string with entity ids and arguments
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_email_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_email_job_status_finished_at', 'status', 'finished_at'),  # sending limits
+    )
+    
+    def __repr__(self):
+        return f'<EmailJob {self.id} {self.kind} - {self.status}>'
+
+class PdfExport(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    show_id = db.Column(db.Integer, db.ForeignKey('show.id'), nullable=True)  # None = whole event
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    parts_total = db.Column(db.Integer, nullable=False, default=0)
+    parts_done = db.Column(db.Integer, nullable=False, default=0)
+    tickets_total = db.Column(db.Integer, nullable=False, default=0)
+    tickets_done = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationship
+    show = db.relationship('Show', lazy=True)
+    
+    def __repr__(self):
+        return f'<PdfExport {self.id} - {self.status}>'
+    
+    @property
+    def progress(self):
+        """Share of tickets rendered, 0-100"""
+        if self.status == 'done':
+            return 100
+        if not self.tickets_total:
+            return 0
+        return int(self.tickets_done * 100 / self.tickets_total)
+
+class ShowRevenue(db.Model):
+    """Per-show booking totals, kept up to date by app.utils.revenue on every flush"""
+    show_id = db.Column(db.Integer, db.ForeignKey('show.id'), primary_key=True)
+    confirmed_revenue = db.Column(db.Integer, nullable=False, default=0)
+    potential_revenue = db.Column(db.Integer, nullable=False, default=0)  # Bookings not yet confirmed
+    confirmed_bookings = db.Column(db.Integer, nullable=False, default=0)
+    reserved_bookings = db.Column(db.Integer, nullable=False, default=0)
+    adult_tickets_sold = db.Column(db.Integer, nullable=False, default=0)  # Confirmed bookings only
+    student_tickets_sold = db.Column(db.Integer, nullable=False, default=0)
+    total_tickets = db.Column(db.Integer, nullable=False, default=0)  # All bookings
+    
+    # Relationship
+    show = db.relationship('Show', lazy=True)
+    
+    def __repr__(self):
+        return f'<ShowRevenue {self.show_id}: {self.confirmed_revenue} kr>'
+
 class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(50), unique=True, nullable=False)
@@ -137,10 +285,60 @@ class Settings(db.Model):
     def __repr__(self):
         return f'<Setting {self.key}: {self.value}>'
     
+    @staticmethod
+    def _version_file():
+        """Path of the file holding the settings version shared by all workers"""
+        path = current_app.config.get('SETTINGS_VERSION_FILE')
+        if not path:
+            path = os.path.join(current_app.instance_path, 'settings.version')
+        return path
+    
+    @staticmethod
+    def _read_version():
+        try:
+            with open(Settings._version_file()) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _bump_version():
+        """Bump the version counter so every worker reloads its cache on next read"""
+        path = Settings._version_file()
+        current = Settings._read_version()
+        try:
+            counter = int(current.split('-')[0]) if current else 0
+        except ValueError:
+            counter = 0
+        # The pid suffix keeps two workers bumping at the same time from writing the same token
+        version = f"{counter + 1}-{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(version)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write settings version file: {e}")
+        # Always drop our own copy, even if the file could not be written
+        _settings_cache['version'] = None
+        _settings_cache['values'] = None
+    
+    @staticmethod
+    def get_all():
+        """Return all settings as a dict, loading the table at most once per version"""
+        version = Settings._read_version()
+        values = _settings_cache['values']
+        if values is None or version != _settings_cache['version']:
+            # Read the version before loading so a concurrent write is picked up next time
+            values = {setting.key: setting.value for setting in Settings.query.all()}
+            _settings_cache['values'] = values
+            _settings_cache['version'] = version
+        return values
+    
     @staticmethod
     def get_value(key, default=None):
-        setting = Settings.query.filter_by(key=key).first()
-        return setting.value if setting else default
+        return Settings.get_all().get(key, default)
     
     @staticmethod
     def set_value(key, value):
@@ -151,4 +349,10 @@ class Settings(db.Model):
             setting = Settings(key=key, value=value)
             db.session.add(setting)
         db.session.commit()
+        Settings._bump_version()
         return setting
+    
+    @staticmethod
+    def invalidate_cache():
+        """Force all workers to reload settings (e.g. after editing the table directly)"""
+        Settings._bump_version()
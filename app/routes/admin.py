@@ -1,12 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, Response
 from werkzeug.security import check_password_hash, generate_password_hash
-from app.models import Show, Booking, Settings, Ticket, Buyer, AuditLog
+from app.models import Show, Booking, Settings, Ticket, Buyer, AuditLog, EmailJob, PdfExport
 from app import db
-from app.utils.email import send_payment_confirmed
-from app.utils.tickets import generate_tickets_for_booking, delete_ticket, mark_ticket_as_used
-from app.utils.audit import log_payment_confirmed, log_settings_changed
+from sqlalchemy.orm import joinedload
+from app.utils.tickets import confirm_bookings, store_booking_pdfs, delete_ticket, mark_ticket_as_used
+from app.utils.audit import log_settings_changed, audit_facets, booking_history
+from app.utils.audit_archive import archive_audit_log, archive_facets, query_archive
+from app.utils.jobs import enqueue_email, send_in_background, retry_job
+from app.utils.reservations import release_tickets, count_held_tickets
+from app.utils.logo_assets import store_logo
+from app.utils.media import store_image
+from app.utils.pdf_export import start_pdf_export, export_dir, export_files
+from app.utils.ticket_pdfs import invalidate_tickets_pdf
+from app.utils.checkins import checkin_stream
+from app.utils.revenue import revenue_summary
 from datetime import datetime
-import io
 import csv
 from openpyxl import Workbook
 
@@ -52,10 +60,13 @@ def logout():
     flash('Du har loggats ut.', 'info')
     return redirect(url_for('admin.login'))
 
+# Bookings shown per show on each dashboard page
+DASHBOARD_BOOKINGS_PER_PAGE = 50
+
 @admin_bp.route('/')
 @login_required
 def dashboard():
-    """Admin dashboard with all bookings"""
+    """Admin dashboard with bookings grouped by show, one page per show at a time"""
     # Get filter parameter
     filter_unconfirmed = request.args.get('unconfirmed', type=bool)
     
@@ -69,18 +80,66 @@ def dashboard():
             (Booking.buyer_confirmed_payment == True) & (Booking.status != 'confirmed')
         )
     
-    bookings = query.order_by(Booking.created_at.desc()).all()
+    # Per-show totals in one GROUP BY
+    totals = {
+        row.show_id: row for row in query.with_entities(
+            Booking.show_id,
+            db.func.count(Booking.id).label('count'),
+            db.func.sum(db.case((Booking.status == 'confirmed', Booking.total_amount), else_=0)).label('revenue'),
+            db.func.sum(db.case(((Booking.buyer_confirmed_payment == True) & (Booking.status != 'confirmed'), 1), else_=0)).label('pending')
+        ).group_by(Booking.show_id).all()
+    }
+    
+    # Requested page per show, from ?page_<show_id>=N
+    per_page = DASHBOARD_BOOKINGS_PER_PAGE
+    pages = {}
+    for show_id, row in totals.items():
+        last_page = max(1, -(-row.count // per_page))
+        pages[show_id] = min(max(1, request.args.get(f'page_{show_id}', 1, type=int)), last_page)
+    
+    # The requested page of every show in one query, numbering each show's bookings newest first
+    bookings = []
+    if totals:
+        row_number = db.func.row_number().over(
+            partition_by=Booking.show_id, order_by=(Booking.created_at.desc(), Booking.id.desc())
+        )
+        ranked = query.with_entities(Booking.id.label('id'), Booking.show_id.label('show_id'), row_number.label('rn')).subquery()
+        offset = db.case({show_id: (page - 1) * per_page for show_id, page in pages.items()}, value=ranked.c.show_id, else_=0)
+        bookings = Booking.query.join(ranked, Booking.id == ranked.c.id).filter(
+            ranked.c.rn > offset, ranked.c.rn <= offset + per_page
+        ).order_by(ranked.c.show_id, ranked.c.rn).all()
+    
+    # Ticket counts for the bookings on the page
+    ticket_counts = dict(db.session.query(Ticket.booking_id, db.func.count(Ticket.id)).filter(
+        Ticket.booking_id.in_([booking.id for booking in bookings])
+    ).group_by(Ticket.booking_id).all()) if bookings else {}
     
     # Group bookings by show
-    bookings_by_show = {}
+    bookings_by_show_id = {}
     for booking in bookings:
-        show_key = f"{booking.show.start_time}-{booking.show.end_time}"
-        if show_key not in bookings_by_show:
-            bookings_by_show[show_key] = []
-        bookings_by_show[show_key].append(booking)
+        bookings_by_show_id.setdefault(booking.show_id, []).append(booking)
+    
+    show_groups = []
+    for show in Show.query.filter(Show.id.in_(list(totals))).order_by(Show.start_time).all():
+        row = totals[show.id]
+        page = pages[show.id]
+        page_args = {key: value for key, value in request.args.items() if key != f'page_{show.id}'}
+        show_groups.append({
+            'show': show,
+            'label': f"{show.start_time}-{show.end_time}",
+            'bookings': bookings_by_show_id.get(show.id, []),
+            'count': row.count,
+            'revenue': row.revenue or 0,
+            'pending': row.pending or 0,
+            'prev_url': url_for('admin.dashboard', **page_args, **{f'page_{show.id}': page - 1}) + f'#show-{show.id}' if page > 1 else None,
+            'next_url': url_for('admin.dashboard', **page_args, **{f'page_{show.id}': page + 1}) + f'#show-{show.id}' if page * per_page < row.count else None,
+            'page': page,
+            'pages': max(1, -(-row.count // per_page))
+        })
     
     return render_template('admin/dashboard.html', 
-                         bookings_by_show=bookings_by_show,
+                         show_groups=show_groups,
+                         ticket_counts=ticket_counts,
                          filter_unconfirmed=filter_unconfirmed,
                          concert_name=get_concert_name())
 
@@ -111,6 +170,13 @@ def update_settings():
                     photo_data = photo_file.read()
                     photo_base64 = base64.b64encode(photo_data).decode('utf-8')
                     
+                    # Write the photo and its resized/WebP variants to the media store
+                    try:
+                        photo_digest, photo_ext = store_image(photo_data)
+                    except Exception as e:
+                        flash('Klassbilden kunde inte läsas som en bild.', 'error')
+                        return redirect(url_for('admin.settings'))
+                    
                     # Get file extension for content type
                     file_extension = photo_file.filename.rsplit('.', 1)[1].lower()
                     content_type = f"image/{file_extension}" if file_extension != 'jpg' else "image/jpeg"
@@ -118,6 +184,8 @@ def update_settings():
                     # Store base64 data and content type in database
                     Settings.set_value('class_photo_data', photo_base64)
                     Settings.set_value('class_photo_content_type', content_type)
+                    Settings.set_value('class_photo_digest', photo_digest)
+                    Settings.set_value('class_photo_ext', photo_ext)
                 else:
                     flash('Ogiltigt filformat för klassbild. Endast PNG, JPG och JPEG är tillåtna.', 'error')
                     return redirect(url_for('admin.settings'))
@@ -134,6 +202,13 @@ def update_settings():
                     logo_data = logo_file.read()
                     logo_base64 = base64.b64encode(logo_data).decode('utf-8')
                     
+                    # Decode, scale and mask the logo once, so ticket QR codes only paste it
+                    try:
+                        logo_digest = store_logo(logo_data)
+                    except Exception as e:
+                        flash('Logotypen kunde inte läsas som en bild.', 'error')
+                        return redirect(url_for('admin.settings'))
+                    
                     # Get file extension for content type
                     file_extension = logo_file.filename.rsplit('.', 1)[1].lower()
                     content_type = f"image/{file_extension}" if file_extension != 'jpg' else "image/jpeg"
@@ -141,6 +216,7 @@ def update_settings():
                     # Store base64 data and content type in database
                     Settings.set_value('qr_logo_data', logo_base64)
                     Settings.set_value('qr_logo_content_type', content_type)
+                    Settings.set_value('qr_logo_digest', logo_digest)
                 else:
                     flash('Ogiltigt filformat för logo. Endast PNG, JPG och JPEG är tillåtna.', 'error')
                     return redirect(url_for('admin.settings'))
@@ -166,34 +242,57 @@ def confirm_payment(booking_id):
         flash('Betalningen är redan bekräftad.', 'info')
         return redirect(url_for('admin.dashboard'))
     
-    booking.status = 'confirmed'
-    booking.confirmed_at = datetime.utcnow()
-    
-    # Update show availability
-    booking.show.update_availability()
-    
-    db.session.commit()
-    
-    # Generate individual tickets
+    # Status, buyer, tickets, audit events and the email job all go in one commit
     try:
-        tickets = generate_tickets_for_booking(booking)
+        tickets = confirm_bookings([booking], 'admin')
+        job = enqueue_email('payment_confirmed', commit=False, booking_id=booking.id)
+        db.session.commit()
         flash(f'Betalning bekräftad för {booking.full_name}! {len(tickets)} biljetter genererade.', 'success')
     except Exception as e:
-        flash(f'Betalning bekräftad men fel vid biljettgenerering: {str(e)}', 'warning')
+        db.session.rollback()
+        flash(f'Betalningen kunde inte bekräftas: {str(e)}', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    store_booking_pdfs([booking])
     
-    # Log payment confirmation
-    log_payment_confirmed(booking, 'admin')
+    # Send the confirmation email from a thread unless the email worker takes it
+    send_in_background([job])
+    flash(f'Biljetterna skickas till {booking.email} inom kort.', 'success')
     
-    # Send confirmation email to buyer
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/bookings/confirm-payments', methods=['POST'])
+@login_required
+def confirm_selected_payments():
+    """Admin confirms payment for the selected bookings at once (e.g. against a Swish statement)"""
+    booking_ids = request.form.getlist('booking_ids', type=int)
+    if not booking_ids:
+        flash('Inga bokningar valda.', 'info')
+        return redirect(url_for('admin.dashboard'))
+    
+    bookings = Booking.query.filter(Booking.id.in_(booking_ids), Booking.status != 'confirmed').order_by(Booking.id).all()
+    skipped = len(set(booking_ids)) - len(bookings)
+    
+    # All bookings, buyers, tickets, audit events and email jobs go in one commit, or none of them
     try:
-        from app.utils.email import send_payment_confirmed
-        email_sent = send_payment_confirmed(booking)
-        if email_sent:
-            flash(f'Biljetter skickade till {booking.email}!', 'success')
-        else:
-            flash('Biljetter genererade men e-post kunde inte skickas.', 'warning')
+        tickets = confirm_bookings(bookings, 'admin')
+        jobs = [enqueue_email('payment_confirmed', commit=False, booking_id=booking.id) for booking in bookings]
+        db.session.commit()
     except Exception as e:
-        flash(f'Biljetter genererade men fel vid e-postssändning: {str(e)}', 'warning')
+        db.session.rollback()
+        flash(f'Betalningarna kunde inte bekräftas: {str(e)}', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    if bookings:
+        flash(f'Betalning bekräftad för {len(bookings)} bokningar! {len(tickets)} biljetter genererade.', 'success')
+    if skipped:
+        flash(f'{skipped} bokningar var redan bekräftade eller finns inte längre.', 'info')
+    
+    # The worker (or without one, a background thread) sends the emails and renders the ticket PDFs
+    # they attach, so the request doesn't wait for dozens of SMTP sends and the sending limit
+    send_in_background(jobs)
+    if jobs:
+        flash('Biljetterna skickas till köparna inom kort. Se e-postkön för status.', 'success')
     
     return redirect(url_for('admin.dashboard'))
 
@@ -214,6 +313,7 @@ def edit_booking(booking_id):
             # as they cannot be changed after booking creation
             
             db.session.commit()
+            invalidate_tickets_pdf(booking.id)
             flash('Bokning uppdaterad!', 'success')
             return redirect(url_for('admin.dashboard'))
         except Exception as e:
@@ -228,13 +328,15 @@ def delete_booking(booking_id):
     booking = Booking.query.get_or_404(booking_id)
     
     try:
-        # Update show availability before deleting
-        booking.show.update_availability()
+        # Give the booking's tickets back to the show in the same transaction
+        release_tickets(booking.show_id, booking.total_tickets)
         
         db.session.delete(booking)
         db.session.commit()
+        invalidate_tickets_pdf(booking_id)
         flash(f'Bokning för {booking.full_name} har raderats.', 'success')
     except Exception as e:
+        db.session.rollback()
         flash('Ett fel uppstod vid radering.', 'error')
     
     return redirect(url_for('admin.dashboard'))
@@ -254,16 +356,9 @@ def resend_tickets(booking_id):
         return redirect(url_for('admin.dashboard'))
     
     try:
-        from app.utils.email import send_payment_confirmed
-        print(f"Attempting to resend tickets for booking {booking.booking_reference}")
-        success = send_payment_confirmed(booking)
-        
-        if success:
-            flash(f'Biljetter skickade om till {booking.full_name}!', 'success')
-            print(f"Successfully resent tickets for booking {booking.booking_reference}")
-        else:
-            flash('Ett fel uppstod vid omssändning av biljetter.', 'error')
-            print(f"Failed to resend tickets for booking {booking.booking_reference}")
+        print(f"Queueing ticket resend for booking {booking.booking_reference}")
+        enqueue_email('payment_confirmed', booking_id=booking.id)
+        flash(f'Biljetterna skickas om till {booking.full_name} inom kort.', 'success')
     except Exception as e:
         flash(f'Ett fel uppstod: {str(e)}', 'error')
         print(f"Exception when resending tickets for booking {booking.booking_reference}: {str(e)}")
@@ -272,167 +367,126 @@ def resend_tickets(booking_id):
     
     return redirect(url_for('admin.dashboard'))
 
+# Rows fetched per round trip when streaming bookings into a spreadsheet
+EXPORT_BATCH_SIZE = 1000
+
+def export_rows():
+    """Bookings with their show times in one joined query, newest first, fetched in batches"""
+    return db.session.query(
+        Booking.id, Booking.booking_reference, Booking.first_name, Booking.last_name, Booking.email,
+        Booking.phone, Booking.adult_tickets, Booking.student_tickets, Booking.total_amount,
+        Booking.status, Booking.buyer_confirmed_payment, Booking.created_at, Show.start_time, Show.end_time
+    ).join(Show, Booking.show_id == Show.id).order_by(Booking.created_at.desc()).yield_per(EXPORT_BATCH_SIZE)
+
+def send_workbook(wb, filename):
+    """Save a workbook to an anonymous temp file and stream it back in chunks"""
+    from flask import send_file
+    import tempfile
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     as_attachment=True, download_name=filename)
+
 @admin_bp.route('/export/excel')
 @login_required
 def export_excel():
     """Export all bookings to Excel"""
-    bookings = Booking.query.order_by(Booking.created_at.desc()).all()
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Biljettbokningar"
-    
-    # Headers
-    headers = ['ID', 'Namn', 'E-post', 'Telefon', 'Tid', 'Ordinariebiljetter', 'Studentbiljetter', 'Totalt', 'Status', 'Betalning bekräftad', 'Datum']
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-    
-    # Data
-    for row, booking in enumerate(bookings, 2):
-        ws.cell(row=row, column=1, value=booking.id)
-        ws.cell(row=row, column=2, value=booking.full_name)
-        ws.cell(row=row, column=3, value=booking.email)
-        ws.cell(row=row, column=4, value=booking.phone)
-        ws.cell(row=row, column=5, value=f"{booking.show.start_time}-{booking.show.end_time}")
-        ws.cell(row=row, column=6, value=booking.adult_tickets)
-        ws.cell(row=row, column=7, value=booking.student_tickets)
-        ws.cell(row=row, column=8, value=booking.total_amount)
-        ws.cell(row=row, column=9, value=booking.status)
-        ws.cell(row=row, column=10, value='Ja' if booking.buyer_confirmed_payment else 'Nej')
-        ws.cell(row=row, column=11, value=booking.created_at.strftime('%Y-%m-%d %H:%M'))
-    
-    # Save to BytesIO
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename=biljettbokningar_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    
-    return response
+    # Write-only sheets keep memory flat: rows go straight to disk as they are appended
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Biljettbokningar")
+    
+    ws.append(['ID', 'Namn', 'E-post', 'Telefon', 'Tid', 'Ordinariebiljetter', 'Studentbiljetter', 'Totalt', 'Status', 'Betalning bekräftad', 'Datum'])
+    for row in export_rows():
+        ws.append([
+            row.id,
+            f"{row.first_name} {row.last_name}",
+            row.email,
+            row.phone,
+            f"{row.start_time}-{row.end_time}",
+            row.adult_tickets,
+            row.student_tickets,
+            row.total_amount,
+            row.status,
+            'Ja' if row.buyer_confirmed_payment else 'Nej',
+            row.created_at.strftime('%Y-%m-%d %H:%M')
+        ])
+    
+    return send_workbook(wb, f'biljettbokningar_{datetime.now().strftime("%Y%m%d")}.xlsx')
 
 @admin_bp.route('/revenue-report')
 @login_required
 def revenue_report():
     """Generate comprehensive revenue report"""
-    bookings = Booking.query.order_by(Booking.created_at.desc()).all()
+    summary = revenue_summary()
+    totals = summary['totals']
     
-    wb = Workbook()
+    wb = Workbook(write_only=True)
     
-    # Summary sheet
-    ws_summary = wb.active
-    ws_summary.title = "Revenue Summary"
-    
-    # Calculate totals
-    total_bookings = len(bookings)
-    confirmed_bookings = [b for b in bookings if b.status == 'confirmed']
-    reserved_bookings = [b for b in bookings if b.status != 'confirmed']
-    
-    total_revenue = sum(b.total_amount for b in confirmed_bookings)
-    potential_revenue = sum(b.total_amount for b in reserved_bookings)
-    
-    # Summary data
+    # Summary sheet, from the per-show rollup
+    ws_summary = wb.create_sheet("Revenue Summary")
     summary_data = [
         ['Revenue Report', f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}'],
         [''],
         ['SUMMARY'],
-        ['Total Bookings:', total_bookings],
-        ['Confirmed Bookings:', len(confirmed_bookings)],
-        ['Reserved Bookings:', len(reserved_bookings)],
+        ['Total Bookings:', totals['confirmed_bookings'] + totals['reserved_bookings']],
+        ['Confirmed Bookings:', totals['confirmed_bookings']],
+        ['Reserved Bookings:', totals['reserved_bookings']],
         [''],
         ['REVENUE'],
-        ['Confirmed Revenue:', f'{total_revenue} kr'],
-        ['Potential Revenue:', f'{potential_revenue} kr'],
-        ['Total Potential:', f'{total_revenue + potential_revenue} kr'],
+        ['Confirmed Revenue:', f"{totals['confirmed_revenue']} kr"],
+        ['Potential Revenue:', f"{totals['potential_revenue']} kr"],
+        ['Total Potential:', f"{totals['confirmed_revenue'] + totals['potential_revenue']} kr"],
         [''],
         ['TICKET BREAKDOWN'],
-        ['Total Adult Tickets:', sum(b.adult_tickets for b in confirmed_bookings)],
-        ['Total Student Tickets:', sum(b.student_tickets for b in confirmed_bookings)],
-        ['Total Tickets Sold:', sum(b.adult_tickets + b.student_tickets for b in confirmed_bookings)],
+        ['Total Adult Tickets:', totals['adult_tickets_sold']],
+        ['Total Student Tickets:', totals['student_tickets_sold']],
+        ['Total Tickets Sold:', totals['adult_tickets_sold'] + totals['student_tickets_sold']],
     ]
-    
-    for row, data in enumerate(summary_data, 1):
-        if len(data) == 2:
-            ws_summary.cell(row=row, column=1, value=data[0])
-            ws_summary.cell(row=row, column=2, value=data[1])
-        else:
-            ws_summary.cell(row=row, column=1, value=data[0])
+    for data in summary_data:
+        ws_summary.append(data)
     
     # Detailed bookings sheet
     ws_details = wb.create_sheet("Detailed Bookings")
-    
-    # Headers
-    headers = ['Booking Ref', 'Name', 'Email', 'Phone', 'Show Time', 'Adult Tickets', 'Student Tickets', 'Total Amount', 'Status', 'Payment Confirmed', 'Created Date']
-    for col, header in enumerate(headers, 1):
-        ws_details.cell(row=1, column=col, value=header)
-    
-    # Data
-    for row, booking in enumerate(bookings, 2):
-        ws_details.cell(row=row, column=1, value=booking.booking_reference)
-        ws_details.cell(row=row, column=2, value=booking.full_name)
-        ws_details.cell(row=row, column=3, value=booking.email)
-        ws_details.cell(row=row, column=4, value=booking.phone)
-        ws_details.cell(row=row, column=5, value=f"{booking.show.start_time}-{booking.show.end_time}")
-        ws_details.cell(row=row, column=6, value=booking.adult_tickets)
-        ws_details.cell(row=row, column=7, value=booking.student_tickets)
-        ws_details.cell(row=row, column=8, value=booking.total_amount)
-        ws_details.cell(row=row, column=9, value=booking.status)
-        ws_details.cell(row=row, column=10, value='Yes' if booking.buyer_confirmed_payment else 'No')
-        ws_details.cell(row=row, column=11, value=booking.created_at.strftime('%Y-%m-%d %H:%M'))
+    ws_details.append(['Booking Ref', 'Name', 'Email', 'Phone', 'Show Time', 'Adult Tickets', 'Student Tickets', 'Total Amount', 'Status', 'Payment Confirmed', 'Created Date'])
+    for row in export_rows():
+        ws_details.append([
+            row.booking_reference,
+            f"{row.first_name} {row.last_name}",
+            row.email,
+            row.phone,
+            f"{row.start_time}-{row.end_time}",
+            row.adult_tickets,
+            row.student_tickets,
+            row.total_amount,
+            row.status,
+            'Yes' if row.buyer_confirmed_payment else 'No',
+            row.created_at.strftime('%Y-%m-%d %H:%M')
+        ])
     
     # Revenue by show sheet
     ws_shows = wb.create_sheet("Revenue by Show")
-    
-    # Group by show
-    show_revenue = {}
-    for booking in bookings:
-        show_key = f"{booking.show.start_time}-{booking.show.end_time}"
-        if show_key not in show_revenue:
-            show_revenue[show_key] = {
-                'confirmed_revenue': 0,
-                'potential_revenue': 0,
-                'confirmed_bookings': 0,
-                'reserved_bookings': 0,
-                'total_tickets': 0
-            }
-        
-        if booking.status == 'confirmed':
-            show_revenue[show_key]['confirmed_revenue'] += booking.total_amount
-            show_revenue[show_key]['confirmed_bookings'] += 1
-        else:
-            show_revenue[show_key]['potential_revenue'] += booking.total_amount
-            show_revenue[show_key]['reserved_bookings'] += 1
-        
-        show_revenue[show_key]['total_tickets'] += booking.adult_tickets + booking.student_tickets
-    
-    # Show revenue headers
-    show_headers = ['Show Time', 'Confirmed Revenue', 'Potential Revenue', 'Total Revenue', 'Confirmed Bookings', 'Reserved Bookings', 'Total Tickets']
-    for col, header in enumerate(show_headers, 1):
-        ws_shows.cell(row=1, column=col, value=header)
-    
-    # Show revenue data
-    for row, (show_time, data) in enumerate(show_revenue.items(), 2):
-        ws_shows.cell(row=row, column=1, value=show_time)
-        ws_shows.cell(row=row, column=2, value=f"{data['confirmed_revenue']} kr")
-        ws_shows.cell(row=row, column=3, value=f"{data['potential_revenue']} kr")
-        ws_shows.cell(row=row, column=4, value=f"{data['confirmed_revenue'] + data['potential_revenue']} kr")
-        ws_shows.cell(row=row, column=5, value=data['confirmed_bookings'])
-        ws_shows.cell(row=row, column=6, value=data['reserved_bookings'])
-        ws_shows.cell(row=row, column=7, value=data['total_tickets'])
-    
-    # Save to BytesIO
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename=revenue_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    
-    return response
+    ws_shows.append(['Show Time', 'Confirmed Revenue', 'Potential Revenue', 'Total Revenue', 'Confirmed Bookings', 'Reserved Bookings', 'Total Tickets'])
+    for show in summary['shows']:
+        if not show['confirmed_bookings'] and not show['reserved_bookings']:
+            continue
+        ws_shows.append([
+            show['show_time'],
+            f"{show['confirmed_revenue']} kr",
+            f"{show['potential_revenue']} kr",
+            f"{show['confirmed_revenue'] + show['potential_revenue']} kr",
+            show['confirmed_bookings'],
+            show['reserved_bookings'],
+            show['total_tickets']
+        ])
+    
+    return send_workbook(wb, f'revenue_report_{datetime.now().strftime("%Y%m%d")}.xlsx')
+
+@admin_bp.route('/stats')
+@login_required
+def revenue_stats():
+    """Revenue and ticket totals per show as JSON"""
+    return jsonify(revenue_summary())
 
 @admin_bp.route('/shows')
 @login_required
@@ -486,13 +540,11 @@ def edit_show(show_id):
                 flash('Tillgängliga biljetter kan inte vara fler än totalt antal biljetter.', 'error')
                 return render_template('admin/edit_show.html', show=show, concert_name=get_concert_name())
             
-            # Calculate how many tickets are currently booked
-            confirmed_bookings = [b for b in show.bookings if b.status == 'confirmed']
-            total_booked = sum(b.total_tickets for b in confirmed_bookings)
+            # Tickets held by bookings (reserved or confirmed) can't be handed out again
+            total_booked = count_held_tickets(show.id)
             
-            # Check if we're trying to set available tickets too low
-            if new_available_tickets < total_booked:
-                flash(f'Kan inte sätta tillgängliga biljetter till {new_available_tickets}. Det finns redan {total_booked} bekräftade biljetter.', 'error')
+            if new_available_tickets > new_total_tickets - total_booked:
+                flash(f'Kan inte sätta tillgängliga biljetter till {new_available_tickets}. Det finns redan {total_booked} bokade biljetter av {new_total_tickets}.', 'error')
                 return render_template('admin/edit_show.html', show=show, concert_name=get_concert_name())
             
             # Update show
@@ -529,41 +581,141 @@ def delete_show(show_id):
     
     return redirect(url_for('admin.manage_shows'))
 
+@admin_bp.route('/exports', methods=['GET', 'POST'])
+@login_required
+def pdf_exports():
+    """Bulk PDF export of all tickets for a show or the whole event"""
+    if request.method == 'POST':
+        show_id = request.form.get('show_id', type=int)
+        if show_id and not db.session.get(Show, show_id):
+            flash('Föreställningen finns inte.', 'error')
+            return redirect(url_for('admin.pdf_exports'))
+        
+        export = start_pdf_export(show_id, 'admin')
+        flash(f'PDF-export #{export.id} har startats.', 'success')
+        return redirect(url_for('admin.pdf_exports'))
+    
+    shows = Show.query.order_by(Show.start_time).all()
+    exports = PdfExport.query.order_by(PdfExport.created_at.desc()).limit(20).all()
+    files = {export.id: export_files(export.id) for export in exports if export.status == 'done'}
+    return render_template('admin/exports.html', shows=shows, exports=exports, files=files)
+
+@admin_bp.route('/exports/<int:export_id>/status')
+@login_required
+def pdf_export_status(export_id):
+    """Progress of an export, polled by the exports page"""
+    export = PdfExport.query.get_or_404(export_id)
+    return jsonify({
+        'id': export.id,
+        'status': export.status,
+        'progress': export.progress,
+        'parts_done': export.parts_done,
+        'parts_total': export.parts_total,
+        'tickets_done': export.tickets_done,
+        'tickets_total': export.tickets_total,
+        'error': export.error
+    })
+
+@admin_bp.route('/exports/<int:export_id>/files/<filename>')
+@login_required
+def pdf_export_file(export_id, filename):
+    """Download one file of a finished export"""
+    from flask import send_from_directory
+    PdfExport.query.get_or_404(export_id)
+    return send_from_directory(export_dir(export_id), filename, as_attachment=True)
+
+@admin_bp.route('/checkins')
+@login_required
+def checkins():
+    """Live check-in dashboard"""
+    return render_template('admin/checkins.html')
+
+@admin_bp.route('/checkins/stream')
+@login_required
+def checkins_stream():
+    """Server-sent events with check-in counts and the latest scans"""
+    app = current_app._get_current_object()
+    response = Response(checkin_stream(app), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Rows per page in the ticket list
+TICKETS_PER_PAGE = 100
+
+def prefix_match(column, term):
+    """column LIKE 'term%' with wildcards in term escaped, so a NOCASE index can serve it"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(escaped + '%', escape='\\')
+
 @admin_bp.route('/tickets')
 @login_required
 def tickets():
-    """List all tickets with filters"""
+    """List tickets with filters, newest first, one page at a time"""
     show_id = request.args.get('show_id', type=int)
     used_filter = request.args.get('used')
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
     booking_ref = request.args.get('booking_ref', '')
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     
     query = Ticket.query
     
     if show_id:
-        query = query.filter_by(show_id=show_id)
+        query = query.filter(Ticket.show_id == show_id)
     
     if used_filter == 'used':
-        query = query.filter_by(is_used=True)
+        query = query.filter(Ticket.is_used == True)
     elif used_filter == 'unused':
-        query = query.filter_by(is_used=False)
+        query = query.filter(Ticket.is_used == False)
     
+    # Booking filters go through ticket.booking_id, so Booking is never joined twice
     if booking_ref:
-        query = query.join(Booking).filter(Booking.booking_reference == booking_ref)
+        query = query.filter(Ticket.booking_id.in_(
+            db.select(Booking.id).where(Booking.booking_reference == booking_ref)
+        ))
     
     if search:
-        query = query.join(Booking).filter(
-            Ticket.ticket_reference.contains(search) |
-            Booking.booking_reference.contains(search) |
-            Booking.first_name.contains(search) |
-            Booking.last_name.contains(search)
+        query = query.filter(
+            prefix_match(Ticket.ticket_reference, search) |
+            Ticket.booking_id.in_(db.select(Booking.id).where(
+                prefix_match(Booking.booking_reference, search) |
+                prefix_match(Booking.first_name, search) |
+                prefix_match(Booking.last_name, search)
+            ))
         )
     
-    tickets = query.order_by(Ticket.created_at.desc()).all()
+    # Counts for the whole filtered list in one aggregate query
+    total, used_count = query.with_entities(
+        db.func.count(Ticket.id), db.func.sum(db.case((Ticket.is_used == True, 1), else_=0))
+    ).one()
+    used_count = used_count or 0
+    
+    # Keyset pagination on id: cost stays the same on the last page as on the first
+    page_query = query.options(joinedload(Ticket.booking), joinedload(Ticket.show), joinedload(Ticket.buyer))
+    if after:
+        tickets = page_query.filter(Ticket.id > after).order_by(Ticket.id).limit(TICKETS_PER_PAGE + 1).all()
+        has_newer = len(tickets) > TICKETS_PER_PAGE
+        tickets = list(reversed(tickets[:TICKETS_PER_PAGE]))
+        has_older = True
+    else:
+        if before:
+            page_query = page_query.filter(Ticket.id < before)
+        tickets = page_query.order_by(Ticket.id.desc()).limit(TICKETS_PER_PAGE + 1).all()
+        has_older = len(tickets) > TICKETS_PER_PAGE
+        tickets = tickets[:TICKETS_PER_PAGE]
+        has_newer = bool(before)
+    
+    filters = dict(show_id=show_id or None, used=used_filter or None, search=search or None, booking_ref=booking_ref or None)
+    newer_url = url_for('admin.tickets', after=tickets[0].id, **filters) if tickets and has_newer else None
+    older_url = url_for('admin.tickets', before=tickets[-1].id, **filters) if tickets and has_older else None
+    
     shows = Show.query.all()
     
     return render_template('admin/tickets.html', tickets=tickets, shows=shows,
-                         selected_show=show_id, used_filter=used_filter, search=search, booking_ref=booking_ref, concert_name=get_concert_name())
+                         selected_show=show_id, used_filter=used_filter, search=search, booking_ref=booking_ref,
+                         total=total, used_count=used_count, newer_url=newer_url, older_url=older_url,
+                         concert_name=get_concert_name())
 
 @admin_bp.route('/ticket/<int:ticket_id>/delete', methods=['POST'])
 @login_required
@@ -645,51 +797,183 @@ def resend_confirmation(booking_id):
         return redirect(url_for('admin.dashboard'))
 
     try:
-        from app.utils.email import send_booking_confirmation
-        success = send_booking_confirmation(booking)
-
-        if success:
-            flash(f'Bekräftelse skickad om till {booking.full_name}!', 'success')
-        else:
-            flash('Ett fel uppstod vid omssändning av bekräftelse.', 'error')
+        enqueue_email('booking_confirmation', booking_id=booking.id)
+        flash(f'Bekräftelsen skickas om till {booking.full_name} inom kort.', 'success')
     except Exception as e:
         flash(f'Ett fel uppstod: {str(e)}', 'error')
 
     return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/email-jobs')
+@login_required
+def email_jobs():
+    """View the email queue, failed jobs first"""
+    status_filter = request.args.get('status', 'problems')
+    
+    query = EmailJob.query
+    if status_filter == 'problems':
+        # Dead jobs plus jobs waiting for another attempt
+        query = query.filter(db.or_(
+            EmailJob.status == 'dead',
+            db.and_(EmailJob.status == 'pending', EmailJob.attempts > 0)
+        ))
+    elif status_filter in ('pending', 'running', 'done', 'dead'):
+        query = query.filter_by(status=status_filter)
+    
+    jobs = query.order_by(EmailJob.created_at.desc()).limit(200).all()
+    counts = dict(db.session.query(EmailJob.status, db.func.count(EmailJob.id)).group_by(EmailJob.status).all())
+    
+    return render_template('admin/email_jobs.html', jobs=jobs, counts=counts, status_filter=status_filter)
+
+@admin_bp.route('/email-jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_email_job(job_id):
+    """Put a failed email job back in the queue"""
+    job = EmailJob.query.get_or_404(job_id)
+    
+    if job.status in ('done', 'running'):
+        flash('Jobbet kan inte köras om.', 'error')
+    else:
+        retry_job(job)
+        flash(f'E-postjobb #{job.id} har lagts i kön igen.', 'success')
+    
+    return redirect(url_for('admin.email_jobs'))
+
+AUDIT_PER_PAGE = 50
+
 @admin_bp.route('/audit')
 @login_required
 def audit_log():
-    """View audit log"""
-    page = request.args.get('page', 1, type=int)
+    """View audit log (or with archive=1, the archived events), newest first, one page at a time"""
     action_filter = request.args.get('action')
     entity_filter = request.args.get('entity')
     user_filter = request.args.get('user')
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    archive = request.args.get('archive') == '1'
+    
+    current_filters = {
+        'action': action_filter,
+        'entity': entity_filter,
+        'user': user_filter
+    }
+    filters = {name: value for name, value in current_filters.items() if value}
+    
+    # Keyset pagination on (timestamp, id), served by the timestamp indexes at any depth
+    cursor = None
+    if archive:
+        try:
+            cursor = (datetime.fromisoformat(request.args['at']), after or before) if after or before else None
+        except (KeyError, ValueError):
+            cursor = None
+    elif after or before:
+        cursor_log = db.session.get(AuditLog, after or before)
+        cursor = (cursor_log.timestamp, cursor_log.id) if cursor_log else None
+    newer = bool(after and cursor)
+    
+    if archive:
+        logs = query_archive(filters, cursor, newer, AUDIT_PER_PAGE + 1)
+    else:
+        query = AuditLog.query
+        
+        if action_filter:
+            query = query.filter_by(action_type=action_filter)
+        if entity_filter:
+            query = query.filter_by(entity_type=entity_filter)
+        if user_filter:
+            query = query.filter_by(user_identifier=user_filter)
+        
+        key = db.tuple_(AuditLog.timestamp, AuditLog.id)
+        if newer:
+            logs = query.filter(key > cursor).order_by(AuditLog.timestamp, AuditLog.id).limit(AUDIT_PER_PAGE + 1).all()
+        else:
+            if cursor:
+                query = query.filter(key < cursor)
+            logs = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(AUDIT_PER_PAGE + 1).all()
+    
+    if newer:
+        has_newer = len(logs) > AUDIT_PER_PAGE
+        logs = list(reversed(logs[:AUDIT_PER_PAGE]))
+        has_older = True
+    else:
+        has_older = len(logs) > AUDIT_PER_PAGE
+        logs = logs[:AUDIT_PER_PAGE]
+        has_newer = cursor is not None
+    
+    def page_url(log, direction):
+        if archive:
+            return url_for('admin.audit_log', archive=1, at=log.timestamp.isoformat(), **{direction: log.id}, **filters)
+        return url_for('admin.audit_log', **{direction: log.id}, **filters)
+    
+    newer_url = page_url(logs[0], 'after') if logs and has_newer else None
+    older_url = page_url(logs[-1], 'before') if logs and has_older else None
+    
+    # Filter values and row counts come from audit_facet (or the segment index) instead of DISTINCT scans
+    facets = archive_facets() if archive else audit_facets()
+    if not filters:
+        total = sum(facets['action'].values())
+    elif len(filters) == 1:
+        facet, value = next(iter(filters.items()))
+        total = facets[facet].get(value, 0)
+    else:
+        total = None
+    
+    return render_template('admin/audit.html', logs=logs, total=total, archive=archive,
+                         newer_url=newer_url, older_url=older_url,
+                         actions=list(facets['action']),
+                         entities=list(facets['entity']),
+                         users=list(facets['user']),
+                         current_filters=current_filters, concert_name=get_concert_name())
+
+@admin_bp.route('/api/booking/<booking_reference>/history')
+@login_required
+def booking_history_api(booking_reference):
+    """A booking's tickets and full audit history as JSON (optionally ?ticket=REF for one ticket)"""
+    booking_reference = booking_reference.strip().upper()
+    ticket_reference = request.args.get('ticket', '').strip().upper() or None
+    
+    booking = Booking.query.options(joinedload(Booking.show)).filter_by(booking_reference=booking_reference).first()
+    events = booking_history(booking_reference, ticket_reference)
+    if booking is None and not events:
+        return jsonify({'error': 'Bokningen hittades inte'}), 404
+    
+    result = {'booking_reference': booking_reference, 'booking': None, 'events': events}
+    if booking is not None:
+        tickets = Ticket.query.filter_by(booking_id=booking.id).order_by(Ticket.ticket_reference).all()
+        result['booking'] = {
+            'name': f"{booking.first_name} {booking.last_name}",
+            'phone': booking.phone,
+            'email': booking.email,
+            'show': f"{booking.show.start_time}-{booking.show.end_time}",
+            'status': booking.status,
+            'total_amount': booking.total_amount,
+            'created_at': booking.created_at.isoformat() if booking.created_at else None,
+            'confirmed_at': booking.confirmed_at.isoformat() if booking.confirmed_at else None,
+            'tickets': [
+                {
+                    'ticket_reference': ticket.ticket_reference,
+                    'ticket_type': ticket.ticket_type,
+                    'is_used': ticket.is_used,
+                    'used_at': ticket.used_at.isoformat() if ticket.used_at else None,
+                    'checked_by': ticket.checked_by
+                }
+                for ticket in tickets
+            ]
+        }
+    return jsonify(result)
+
+@admin_bp.route('/audit/archive', methods=['POST'])
+@login_required
+def archive_audit():
+    """Move old audit events and those of finished shows to the archive now"""
+    try:
+        moved = archive_audit_log('admin')
+        if moved:
+            flash(f'{moved} händelser flyttades till arkivet.', 'success')
+        else:
+            flash('Inga händelser att arkivera.', 'info')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Arkiveringen misslyckades: {str(e)}', 'error')
     
-    query = AuditLog.query
-    
-    if action_filter:
-        query = query.filter_by(action_type=action_filter)
-    if entity_filter:
-        query = query.filter_by(entity_type=entity_filter)
-    if user_filter:
-        query = query.filter_by(user_identifier=user_filter)
-    
-    logs = query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=50, error_out=False
-    )
-    
-    # Get unique values for filters
-    actions = db.session.query(AuditLog.action_type.distinct()).all()
-    entities = db.session.query(AuditLog.entity_type.distinct()).all()
-    users = db.session.query(AuditLog.user_identifier.distinct()).all()
-    
-    return render_template('admin/audit.html', logs=logs, 
-                         actions=[a[0] for a in actions],
-                         entities=[e[0] for e in entities],
-                         users=[u[0] for u in users],
-                         current_filters={
-                             'action': action_filter,
-                             'entity': entity_filter,
-                             'user': user_filter
-                         }, concert_name=get_concert_name())
+    return redirect(url_for('admin.audit_log', archive=1))
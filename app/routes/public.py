@@ -2,8 +2,15 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from app.models import Show, Booking, Settings, Ticket
 from app import db
 from app.utils.audit import log_booking_created, log_payment_initiated, log_buyer_confirmed_payment
+from app.utils.jobs import enqueue_email
+from app.utils.door import build_door_manifest, verify_door_token, apply_door_checkins, DOOR_BATCH_MAX
+from app.utils.media import media_dir, class_photo_sources, MEDIA_MAX_AGE
+from app.utils.qr_codes import generate_ticket_qr_code
+from app.utils.reservations import reserve_tickets, get_availability, get_all_availability, AVAILABILITY_TTL
+from app.utils.tickets import validate_ticket_scan
 from datetime import datetime
 import re
+import hashlib
 import qrcode
 import io
 import base64
@@ -54,23 +61,29 @@ def generate_swish_qr_code(phone, amount, booking_ref):
     
     return f"data:image/png;base64,{img_base64}"
 
+@public_bp.route('/media/<path:filename>')
+def media_file(filename):
+    """Serve content-addressed uploads with long-lived immutable caching"""
+    from flask import send_from_directory
+    
+    response = send_from_directory(media_dir(), filename, max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @public_bp.route('/class-photo')
 def class_photo():
-    """Serve class photo from database"""
-    from flask import Response
-    
-    # Get class photo data from database
-    class_photo_data = Settings.get_value('class_photo_data')
-    class_photo_content_type = Settings.get_value('class_photo_content_type', 'image/jpeg')
-    
-    if class_photo_data:
-        import base64
-        try:
-            # Decode base64 data
-            photo_bytes = base64.b64decode(class_photo_data)
-            return Response(photo_bytes, mimetype=class_photo_content_type)
-        except Exception as e:
-            print(f"Error decoding class photo data: {e}")
+    """Redirect to the current class photo in the media store"""
+    sources = class_photo_sources()
+    
+    if sources:
+        # Prefer WebP when the browser accepts it
+        target = sources['webp'] if 'image/webp' in request.headers.get('Accept', '') else sources['src']
+        response = redirect(target)
+        response.cache_control.public = True
+        response.cache_control.max_age = 60
+        response.vary.add('Accept')
+        return response
     
     # Fallback to static file if no database image
     from flask import send_from_directory
@@ -100,6 +113,7 @@ def index():
         times_display = "17:45-18:45 eller 19:00-20:00"  # fallback
 
     return render_template('index.html', 
+                         class_photo=class_photo_sources(),
                          swish_recipient_name=swish_recipient_name,
                          adult_price=adult_price,
                          student_price=student_price,
@@ -265,13 +279,9 @@ def booking_confirm():
         flash('Tyvärr är biljetterna slut till den här spelningen.', 'error')
         return redirect(url_for('public.booking'))
     
-    # Generate unique booking reference
-    booking_reference = Booking.generate_booking_reference()
-    
-    # Create booking
+    # Create booking (the reference is assigned when it is inserted)
     booking = Booking(
         show_id=session['show_id'],
-        booking_reference=booking_reference,
         first_name=first_name,
         last_name=last_name,
         email=email,
@@ -283,11 +293,17 @@ def booking_confirm():
     )
     
     try:
-        db.session.add(booking)
-        db.session.commit()
+        # Take the tickets from the show atomically, so concurrent buyers can't oversell
+        if not reserve_tickets(show.id, booking.total_tickets):
+            db.session.rollback()
+            flash('Tyvärr finns det inte tillräckligt många biljetter kvar till den här spelningen.', 'error')
+            return redirect(url_for('public.booking'))
+        
+        booking.add_with_unique_reference()
         
         # Log booking creation
         log_booking_created(booking)
+        db.session.commit()
         
         # Clear session data
         session.pop('show_id', None)
@@ -295,9 +311,8 @@ def booking_confirm():
         session.pop('student_tickets', None)
         session.pop('total_amount', None)
         
-        # Send confirmation email
-        from app.utils.email import send_booking_confirmation
-        send_booking_confirmation(booking)
+        # Queue confirmation email
+        enqueue_email('booking_confirmation', booking_id=booking.id)
         
         flash('Tack! Du har reserverat dina biljetter. Glöm inte att swisha summan till 012 345 67 89 för att bekräfta din plats.', 'success')
         return redirect(url_for('public.booking_success', booking_reference=booking.booking_reference, email=booking.email))
@@ -312,24 +327,8 @@ def mobile_ticket(ticket_reference):
     """Mobile-friendly ticket display with QR code"""
     ticket = Ticket.query.filter_by(ticket_reference=ticket_reference).first_or_404()
     
-    # Get logo data from database if available
-    logo_data = None
-    qr_logo_data = Settings.get_value('qr_logo_data')
-    
-    if qr_logo_data:
-        import base64
-        import io
-        
-        try:
-            # Decode base64 data
-            logo_bytes = base64.b64decode(qr_logo_data)
-            logo_data = io.BytesIO(logo_bytes)
-        except Exception as e:
-            print(f"Error decoding logo data: {e}")
-            logo_data = None
-    
-    # Generate QR code for this specific ticket with logo
-    qr_code_data = generate_ticket_qr_code(ticket, logo_data)
+    # Generate QR code for this specific ticket with logo (cached per logo version)
+    qr_code_data = generate_ticket_qr_code(ticket)
     
     # Get concert information from settings
     concert_name = Settings.get_value('concert_name', 'Klasskonsert 24C')
@@ -361,6 +360,49 @@ def validate_ticket_page(show_id=None):
                          shows=shows, 
                          selected_show=selected_show)
 
+@public_bp.route('/api/door-manifest/<int:show_id>')
+def door_manifest(show_id):
+    """Ticket manifest for offline validation at the door (admin session or door token required)"""
+    if not session.get('admin_logged_in') and not verify_door_token(request.args.get('token'), show_id):
+        return jsonify({'error': 'Logga in som administratör för att använda offline-läge'}), 403
+    
+    manifest = build_door_manifest(show_id)
+    if manifest is None:
+        return jsonify({'error': 'Föreställningen finns inte'}), 404
+    
+    response = jsonify(manifest)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@public_bp.route('/api/validate-tickets/batch', methods=['POST'])
+def validate_tickets_batch_api():
+    """Record many door scans at once (offline scanners syncing their queue)"""
+    data = request.get_json(silent=True) or {}
+    scans = data.get('scans')
+    try:
+        show_id = int(data.get('show_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Ingen föreställning vald'}), 400
+    
+    if not session.get('admin_logged_in') and not verify_door_token(data.get('token'), show_id):
+        return jsonify({'error': 'Logga in som administratör för att synka skanningar'}), 403
+    
+    if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+        return jsonify({'error': 'Felaktigt format på skanningar'}), 400
+    if len(scans) > DOOR_BATCH_MAX:
+        return jsonify({'error': f'Högst {DOOR_BATCH_MAX} skanningar per anrop'}), 400
+    
+    try:
+        results = apply_door_checkins(show_id, scans, 'Door validation (sync)')
+    except Exception as e:
+        db.session.rollback()
+        print(f"💥 Error syncing {len(scans)} door scans: {str(e)}")
+        return jsonify({'error': 'Ett internt fel uppstod. Försök igen senare.'}), 500
+    
+    accepted = sum(1 for result in results if result['valid'])
+    print(f"🚪 Synced {len(scans)} door scans for show {show_id}: {accepted} accepted")
+    return jsonify({'results': results, 'accepted': accepted})
+
 @public_bp.route('/api/validate-ticket', methods=['POST'])
 def validate_ticket_api():
     """API endpoint to validate a ticket by QR code"""
@@ -387,75 +429,14 @@ def validate_ticket_api():
                 'status': 'error'
             }), 400
         
-        # Find the ticket
-        ticket = Ticket.query.filter_by(ticket_reference=ticket_reference).first()
-        
-        if not ticket:
-            print(f"❌ Ticket not found: {ticket_reference}")
-            return jsonify({
-                'valid': False,
-                'message': 'Biljett hittades inte',
-                'status': 'error',
-                'ticket_reference': ticket_reference
-            })
+        result = validate_ticket_scan(ticket_reference, int(show_id), 'Door validation')
         
-        print(f"🎫 Found ticket: {ticket.ticket_reference}, is_used: {ticket.is_used}, booking_status: {ticket.booking.status}")
-        
-        # Check if ticket is for the correct show
-        if ticket.booking.show_id != int(show_id):
-            print(f"⚠️ Ticket for wrong show: {ticket_reference}, ticket show: {ticket.booking.show_id}, validation show: {show_id}")
-            return jsonify({
-                'valid': False,
-                'message': 'Biljett för fel föreställning',
-                'status': 'wrong_show',
-                'ticket_reference': ticket_reference,
-                'ticket_show_id': ticket.booking.show_id,
-                'validation_show_id': int(show_id)
-            })
-        
-        # Check if ticket is already used
-        if ticket.is_used:
-            print(f"⚠️ Ticket already used: {ticket_reference}")
-            return jsonify({
-                'valid': False,
-                'message': 'Biljett redan använd',
-                'status': 'used',
-                'ticket_reference': ticket_reference,
-                'used_at': ticket.used_at.isoformat() if ticket.used_at else None
-            })
-        
-        # Check if booking is confirmed
-        if ticket.booking.status != 'confirmed':
-            print(f"⚠️ Booking not confirmed: {ticket_reference}, status: {ticket.booking.status}")
-            return jsonify({
-                'valid': False,
-                'message': 'Biljett inte bekräftad',
-                'status': 'unconfirmed',
-                'ticket_reference': ticket_reference,
-                'booking_status': ticket.booking.status
-            })
-        
-        # Mark ticket as used
-        ticket.is_used = True
-        ticket.used_at = datetime.now()
-        
-        # Log the ticket usage
-        from app.utils.audit import log_ticket_used
-        log_ticket_used(ticket, 'Door validation')
-        
-        db.session.commit()
-        
-        print(f"✅ Ticket validated successfully: {ticket_reference}")
+        if result['valid']:
+            print(f"✅ Ticket validated successfully: {ticket_reference}")
+        else:
+            print(f"⚠️ Ticket rejected: {ticket_reference} ({result['status']})")
         
-        return jsonify({
-            'valid': True,
-            'message': 'Biljett godkänd - välkommen in!',
-            'status': 'success',
-            'ticket_reference': ticket_reference,
-            'ticket_type': 'Ordinarie' if ticket.ticket_type == 'normal' else 'Student',
-            'booking_reference': ticket.booking.booking_reference,
-            'used_at': ticket.used_at.isoformat()
-        })
+        return jsonify(result)
         
     except Exception as e:
         print(f"💥 Error validating ticket: {str(e)}")
@@ -467,90 +448,6 @@ def validate_ticket_api():
             'status': 'error'
         }), 500
 
-def generate_ticket_qr_code(ticket, logo_data=None):
-    """Generate QR code for a specific ticket with optional logo"""
-    import qrcode
-    from PIL import Image as PILImage, ImageDraw
-    import io
-    import base64
-    import os
-    
-    # Create QR code with higher error correction for logo embedding
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(ticket.ticket_reference)
-    qr.make(fit=True)
-    
-    # Create QR code image
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Add logo if provided
-    if logo_data:
-        try:
-            # Open logo from BytesIO
-            logo = PILImage.open(logo_data)
-            
-            # Calculate logo size - smaller to avoid interfering with QR code
-            qr_size = qr_img.size[0]
-            logo_size = int(qr_size * 0.15)  # 15% of QR code size (smaller)
-            
-            # Resize logo maintaining aspect ratio
-            logo.thumbnail((logo_size, logo_size), PILImage.Resampling.LANCZOS)
-            
-            # Convert logo to RGBA if it isn't already
-            if logo.mode != 'RGBA':
-                logo = logo.convert('RGBA')
-            
-            # Create a semi-transparent white background for better visibility
-            logo_bg_size = logo_size + 8  # Add small padding
-            logo_bg = PILImage.new('RGBA', (logo_bg_size, logo_bg_size), (255, 255, 255, 200))  # Semi-transparent white
-            
-            # Create rounded rectangle mask for the background
-            mask = PILImage.new('L', (logo_bg_size, logo_bg_size), 0)
-            draw = ImageDraw.Draw(mask)
-            draw.rounded_rectangle([0, 0, logo_bg_size, logo_bg_size], radius=4, fill=255)
-            
-            # Apply mask to create rounded background
-            logo_bg.putalpha(mask)
-            
-            # Paste logo on semi-transparent background
-            logo_x = (logo_bg_size - logo_size) // 2
-            logo_y = (logo_bg_size - logo_size) // 2
-            
-            # Composite logo onto background preserving colors
-            logo_bg.paste(logo, (logo_x, logo_y), logo)
-            
-            # Calculate position to center logo in QR code
-            qr_width, qr_height = qr_img.size
-            logo_width, logo_height = logo_bg.size
-            
-            x = (qr_width - logo_width) // 2
-            y = (qr_height - logo_height) // 2
-            
-            # Convert QR code to RGBA for alpha blending
-            qr_img = qr_img.convert('RGBA')
-            
-            # Paste logo onto QR code with alpha blending
-            qr_img.paste(logo_bg, (x, y), logo_bg)
-            
-            # Convert back to RGB for final output
-            qr_img = qr_img.convert('RGB')
-            
-        except Exception as e:
-            print(f"Error adding logo to QR code: {e}")
-            # Continue without logo if there's an error
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format='PNG')
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return img_base64
-
 @public_bp.route('/booking/success/<booking_reference>/<email>')
 def booking_success(booking_reference, email):
     """Success page with payment confirmation option"""
@@ -588,10 +485,10 @@ def initiate_payment(booking_reference, email):
     # Mark payment as initiated
     booking.swish_payment_initiated = True
     booking.swish_payment_initiated_at = datetime.utcnow()
-    db.session.commit()
     
     # Log payment initiation
     log_payment_initiated(booking)
+    db.session.commit()
     
     # Generate Swish URL
     swish_number = Settings.get_value('swish_number', '012 345 67 89')
@@ -618,14 +515,13 @@ def confirm_payment(booking_reference, email):
         return redirect(url_for('public.booking_success', booking_reference=booking_reference, email=email))
     
     booking.buyer_confirmed_payment = True
-    db.session.commit()
     
     # Log buyer confirmation
     log_buyer_confirmed_payment(booking)
+    db.session.commit()
     
-    # Send notification to admin
-    from app.utils.email import send_admin_notification
-    send_admin_notification(booking)
+    # Queue notification to admin
+    enqueue_email('admin_notification', booking_id=booking.id)
     
     flash('Tack! Vi har fått din bekräftelse. Administratören kommer att kontrollera betalningen.', 'success')
     return redirect(url_for('public.booking_success', booking_reference=booking_reference, email=email))
@@ -637,14 +533,36 @@ def check_availability():
     if not show_id:
         return jsonify({'error': 'Show ID required'}), 400
     
-    show = Show.query.get_or_404(show_id)
-    show.update_availability()
-    db.session.commit()
-    
-    return jsonify({
-        'available': show.available_tickets,
-        'sold_out': show.is_sold_out
+    try:
+        show_id = int(show_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid show ID'}), 400
+    
+    # Served from a short-lived snapshot, so polling never writes or locks the database
+    snapshot = get_availability(show_id)
+    if snapshot is None:
+        return jsonify({'error': 'Show not found'}), 404
+    
+    response = jsonify({
+        'available': snapshot['available'],
+        'sold_out': snapshot['sold_out']
     })
+    response.set_etag(f"show-{show_id}-{snapshot['available']}")
+    response.cache_control.public = True
+    response.cache_control.max_age = int(AVAILABILITY_TTL)
+    return response.make_conditional(request)
+
+@public_bp.route('/api/availability')
+def all_availability():
+    """API endpoint with availability for every show in one request"""
+    snapshots = get_all_availability()
+    
+    response = jsonify({'shows': snapshots})
+    state = ','.join(f"{s['show_id']}:{s['capacity']}:{s['available']}" for s in snapshots)
+    response.set_etag(hashlib.sha1(state.encode()).hexdigest()[:16])
+    response.cache_control.public = True
+    response.cache_control.max_age = int(AVAILABILITY_TTL)
+    return response.make_conditional(request)
 
 @public_bp.route('/lost-tickets', methods=['GET', 'POST'])
 def lost_tickets():
@@ -661,15 +579,12 @@ def lost_tickets():
         confirmed_bookings_with_tickets = [b for b in bookings if b.tickets]
         
         if confirmed_bookings_with_tickets:
-            # Send ticket resend email for each confirmed booking with tickets
-            from app.utils.email import send_multiple_tickets_resend
-            if send_multiple_tickets_resend(confirmed_bookings_with_tickets):
-                if len(confirmed_bookings_with_tickets) == 1:
-                    flash('Om denna e-post har biljetter kommer dessa skickas dit.', 'success')
-                else:
-                    flash(f'Om denna e-post har biljetter kommer dessa skickas dit ({len(confirmed_bookings_with_tickets)} bokningar hittades).', 'success')
+            # Queue one ticket resend email covering every confirmed booking with tickets
+            enqueue_email('multiple_tickets_resend', booking_ids=[b.id for b in confirmed_bookings_with_tickets])
+            if len(confirmed_bookings_with_tickets) == 1:
+                flash('Om denna e-post har biljetter kommer dessa skickas dit.', 'success')
             else:
-                flash('Ett fel uppstod vid skickande av e-post. Försök igen senare.', 'error')
+                flash(f'Om denna e-post har biljetter kommer dessa skickas dit ({len(confirmed_bookings_with_tickets)} bokningar hittades).', 'success')
         else:
             # Always show success message for security (don't reveal if email exists)
             flash('Om denna e-post har biljetter kommer dessa skickas dit.', 'success')
@@ -732,13 +647,9 @@ def contact():
             flash('Ange en giltig e-postadress.', 'error')
             return render_template('contact.html')
         
-        # Send contact email
-        from app.utils.email import send_contact_message
-        if send_contact_message(name, email, phone, subject, message):
-            flash('Tack för ditt meddelande! Vi återkommer så snart som möjligt.', 'success')
-            return redirect(url_for('public.contact'))
-        else:
-            flash('Ett fel uppstod vid skickande av meddelandet. Försök igen senare.', 'error')
-            return render_template('contact.html')
+        # Queue contact email
+        enqueue_email('contact_message', name=name, email=email, phone=phone, subject=subject, message=message)
+        flash('Tack för ditt meddelande! Vi återkommer så snart som möjligt.', 'success')
+        return redirect(url_for('public.contact'))
     
     return render_template('contact.html')
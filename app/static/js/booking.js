@@ -147,39 +147,46 @@ function initFormValidation() {
 }
 
 function initAvailabilityChecking() {
-    // Check availability when time selection changes
+    // Refresh availability for all shows when time selection changes
     const timeInputs = document.querySelectorAll('input[name="show_id"]');
     
     timeInputs.forEach(input => {
         input.addEventListener('change', function() {
-            const showId = this.value;
-            checkAvailability(showId);
+            refreshAvailability();
         });
     });
 }
 
-function checkAvailability(showId) {
-    fetch(`/api/check-availability?show_id=${showId}`)
+function refreshAvailability() {
+    // One request covers every show on the page
+    fetch('/api/availability')
         .then(response => response.json())
         .then(data => {
-            const timeOption = document.querySelector(`input[value="${showId}"]`).closest('.time-option');
-            const availabilitySpan = timeOption.querySelector('.availability');
-            
-            if (data.sold_out) {
-                availabilitySpan.innerHTML = '<span class="sold-out">Slutsåld</span>';
-                timeOption.querySelector('input').disabled = true;
-                timeOption.querySelector('.time-label').style.opacity = '0.5';
-            } else {
-                availabilitySpan.innerHTML = `<span class="available">${data.available} biljetter kvar</span>`;
-                timeOption.querySelector('input').disabled = false;
-                timeOption.querySelector('.time-label').style.opacity = '1';
-            }
+            data.shows.forEach(show => updateTimeOption(show.show_id, show));
         })
         .catch(error => {
             console.error('Error checking availability:', error);
         });
 }
 
+function updateTimeOption(showId, data) {
+    const input = document.querySelector(`input[name="show_id"][value="${showId}"]`);
+    if (!input) return;
+    
+    const timeOption = input.closest('.time-option');
+    const availabilitySpan = timeOption.querySelector('.availability');
+    
+    if (data.sold_out) {
+        availabilitySpan.innerHTML = '<span class="sold-out">Slutsåld</span>';
+        input.disabled = true;
+        timeOption.querySelector('.time-label').style.opacity = '0.5';
+    } else {
+        availabilitySpan.innerHTML = `<span class="available">${data.available} biljetter kvar</span>`;
+        input.disabled = false;
+        timeOption.querySelector('.time-label').style.opacity = '1';
+    }
+}
+
 function showError(message) {
     // Remove existing error messages
     const existingErrors = document.querySelectorAll('.error-message');
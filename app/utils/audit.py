@@ -1,28 +1,236 @@
+import atexit
 import json
+import queue
+import threading
+from collections import Counter
 from datetime import datetime
-from app.models import AuditLog, db
+from flask import current_app, has_app_context
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import Session
+from app.models import AuditLog, AuditFacet, db, upsert
+
+# Events logged in a session wait here until the session commits
+AUDIT_BUFFER_KEY = 'audit_events'
+
+# Audit log filter facet -> column whose distinct values it lists
+AUDIT_FACETS = {
+    'action': 'action_type',
+    'entity': 'entity_type',
+    'user': 'user_identifier',
+}
+
+# On SQLite this trigger counts every new audit_log row into audit_facet inside the INSERT itself,
+# so logging stays one statement (created by migration 7b4e2f9c6a15, or by create_all)
+AUDIT_FACET_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS audit_log_count_facets AFTER INSERT ON audit_log
+BEGIN
+    INSERT INTO audit_facet (facet, value, count) VALUES {values}
+    ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;
+END
+'''.format(values=', '.join(f"('{facet}', NEW.{column}, 1)" for facet, column in AUDIT_FACETS.items()))
+_facet_trigger = DDL(AUDIT_FACET_TRIGGER).execute_if(dialect='sqlite')
+
+# Optional asynchronous sink: (app, rows) batches written by a background thread
+_async_queue = queue.Queue()
+_async_thread = None
+_async_lock = threading.Lock()
 
 def log_audit_event(action_type, entity_type, entity_id, user_type, user_identifier, 
-                   details=None, old_value=None, new_value=None):
-    """Log an audit event to the database"""
+                   details=None, old_value=None, new_value=None, booking_reference=None, ticket_reference=None):
+    """Record an audit event; it is written when the caller's transaction commits
+
+    booking_reference and ticket_reference go into their own indexed columns; when not given
+    they are taken from details.
+    """
+    if details:
+        booking_reference = booking_reference or details.get('booking_reference')
+        ticket_reference = ticket_reference or details.get('ticket_reference')
+    db.session.info.setdefault(AUDIT_BUFFER_KEY, []).append({
+        'timestamp': datetime.utcnow(),
+        'action_type': action_type,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'user_type': user_type,
+        'user_identifier': user_identifier,
+        'details': json.dumps(details) if details else None,
+        'old_value': json.dumps(old_value) if old_value else None,
+        'new_value': json.dumps(new_value) if new_value else None,
+        'booking_reference': booking_reference,
+        'ticket_reference': ticket_reference
+    })
+    return True
+
+def count_audit_facets(connection, rows, sign=1):
+    """Add (or with sign=-1, remove) rows' values to the audit_facet counts in one executemany upsert"""
+    counts = Counter((facet, row[column]) for row in rows for facet, column in AUDIT_FACETS.items())
+    if not counts:
+        return
+    stmt = upsert(AuditFacet)
+    stmt = stmt.on_conflict_do_update(index_elements=['facet', 'value'], set_={
+        'count': AuditFacet.count + stmt.excluded.count
+    })
+    connection.execute(stmt, [
+        dict(facet=facet, value=value, count=sign * count) for (facet, value), count in counts.items()
+    ])
+    if sign < 0:
+        table = AuditFacet.__table__
+        connection.execute(table.delete().where(table.c.count <= 0))
+
+def _isolated(connection, what, write):
+    """Run write(); if it fails, undo only that step, never the business change around it
+
+    SQLite rolls back just the failed statement, so no savepoint is needed there; other databases
+    abort the whole transaction on an error and get a savepoint.
+    """
+    savepoint = None if connection.dialect.name == 'sqlite' else connection.begin_nested()
     try:
-        audit_entry = AuditLog(
-            action_type=action_type,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            user_type=user_type,
-            user_identifier=user_identifier,
-            details=json.dumps(details) if details else None,
-            old_value=json.dumps(old_value) if old_value else None,
-            new_value=json.dumps(new_value) if new_value else None
-        )
-        db.session.add(audit_entry)
-        db.session.commit()
-        return True
+        write()
     except Exception as e:
-        db.session.rollback()
-        print(f"Failed to log audit event: {e}")
+        if savepoint is not None:
+            savepoint.rollback()
+        print(f"Failed to {what}: {e}")
         return False
+    if savepoint is not None:
+        savepoint.commit()
+    return True
+
+def _write_rows(connection, rows):
+    """Bulk INSERT the events and count them into audit_facet
+
+    SQLite counts them in the INSERT (AUDIT_FACET_TRIGGER). Elsewhere the count is a second step
+    that fails on its own: the events stay and only the filter counts are stale until
+    rebuild_audit_facets().
+    """
+    if (_isolated(connection, f"log {len(rows)} audit events",
+                  lambda: connection.execute(AuditLog.__table__.insert(), rows))
+            and connection.dialect.name != 'sqlite'):
+        _isolated(connection, "update audit filter counts", lambda: count_audit_facets(connection, rows))
+
+# SQLAlchemy also fires the commit and rollback events when a begin_nested() savepoint is released
+# or rolled back; the buffer belongs to the outer transaction, so those are ignored
+
+def _before_commit(session):
+    if session.in_nested_transaction():
+        return
+    rows = session.info.pop(AUDIT_BUFFER_KEY, None)
+    if not rows:
+        return
+    if has_app_context() and current_app.config.get('AUDIT_ASYNC'):
+        # Handed to the background writer once the business transaction has committed
+        session.info.setdefault('audit_async_rows', []).extend(rows)
+        return
+    _write_rows(session.connection(), rows)
+
+def _after_commit(session):
+    if session.in_nested_transaction():
+        return
+    rows = session.info.pop('audit_async_rows', None)
+    if rows:
+        _start_async_writer()
+        _async_queue.put((current_app._get_current_object(), rows))
+
+def _after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(AUDIT_BUFFER_KEY, None)
+    session.info.pop('audit_async_rows', None)
+
+def _drain_async_queue(block=True):
+    """Write queued batches, merging whatever else is waiting into the same INSERT"""
+    batches = [_async_queue.get()] if block else []
+    while True:
+        try:
+            batches.append(_async_queue.get_nowait())
+        except queue.Empty:
+            break
+    by_app = {}
+    for app, rows in batches:
+        by_app.setdefault(app, []).extend(rows)
+    for app, rows in by_app.items():
+        with app.app_context():
+            with db.engine.begin() as connection:
+                _write_rows(connection, rows)
+    for _ in batches:
+        _async_queue.task_done()
+
+def _async_writer():
+    while True:
+        try:
+            _drain_async_queue()
+        except Exception as e:
+            print(f"Audit writer error: {e}")
+
+def _start_async_writer():
+    global _async_thread
+    with _async_lock:
+        if _async_thread is None or not _async_thread.is_alive():
+            _async_thread = threading.Thread(target=_async_writer, name='audit-writer', daemon=True)
+            _async_thread.start()
+
+@atexit.register
+def flush_audit_queue():
+    """Write audit events still waiting for the background writer (on shutdown)"""
+    try:
+        _drain_async_queue(block=False)
+    except Exception as e:
+        print(f"Failed to flush audit queue: {e}")
+
+def register_audit_writer():
+    """Write buffered audit events as part of each session commit"""
+    for name, listener in (('before_commit', _before_commit), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    if not event.contains(db.metadata, 'after_create', _facet_trigger):
+        event.listen(db.metadata, 'after_create', _facet_trigger)
+
+def audit_facets():
+    """Filter values for the audit log page: {facet: {value: rows}}, read from audit_facet"""
+    facets = {facet: {} for facet in AUDIT_FACETS}
+    for row in AuditFacet.query.order_by(AuditFacet.facet, AuditFacet.value).all():
+        facets.setdefault(row.facet, {})[row.value] = row.count
+    return facets
+
+def rebuild_audit_facets():
+    """Recompute audit_facet from audit_log (after bulk imports that bypass log_audit_event)"""
+    db.session.execute(db.delete(AuditFacet))
+    for facet, column in AUDIT_FACETS.items():
+        column = getattr(AuditLog, column)
+        rows = db.session.query(column, db.func.count(AuditLog.id)).group_by(column).all()
+        if rows:
+            db.session.execute(db.insert(AuditFacet), [
+                dict(facet=facet, value=value, count=count) for value, count in rows
+            ])
+    db.session.commit()
+
+def _event_dict(log, archived=False):
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.isoformat() if log.timestamp else None,
+        'action_type': log.action_type,
+        'entity_type': log.entity_type,
+        'entity_id': log.entity_id,
+        'user_type': log.user_type,
+        'user_identifier': log.user_identifier,
+        'booking_reference': log.booking_reference,
+        'ticket_reference': log.ticket_reference,
+        'details': json.loads(log.details) if log.details else None,
+        'old_value': json.loads(log.old_value) if log.old_value else None,
+        'new_value': json.loads(log.new_value) if log.new_value else None,
+        'archived': archived
+    }
+
+def booking_history(booking_reference, ticket_reference=None):
+    """Every audit event of a booking (or one of its tickets), archived ones included, oldest first"""
+    from app.utils.audit_archive import archived_booking_events
+    query = AuditLog.query.filter(AuditLog.booking_reference == booking_reference)
+    if ticket_reference:
+        query = query.filter(AuditLog.ticket_reference == ticket_reference)
+    events = [_event_dict(log, archived=True) for log in archived_booking_events(booking_reference)
+              if not ticket_reference or log.ticket_reference == ticket_reference]
+    events += [_event_dict(log) for log in query.all()]
+    events.sort(key=lambda event: (event['timestamp'] or '', event['id']))
+    return events
 
 def log_booking_created(booking):
     """Log when a booking is created"""
@@ -74,21 +282,17 @@ def log_payment_confirmed(booking, admin_user):
         details=details
     )
 
-def log_ticket_generated(ticket, booking):
-    """Log when a ticket is generated"""
-    details = {
-        'ticket_reference': ticket.ticket_reference,
-        'ticket_type': ticket.ticket_type,
-        'booking_reference': booking.booking_reference
-    }
-    return log_audit_event(
-        action_type='ticket_generated',
-        entity_type='ticket',
-        entity_id=ticket.id,
-        user_type='admin',
-        user_identifier='system',
-        details=details
-    )
+def log_tickets_generated(entries):
+    """Log ticket_generated for many (ticket_id, details) pairs at once (details name the ticket and booking)"""
+    for ticket_id, details in entries:
+        log_audit_event(
+            action_type='ticket_generated',
+            entity_type='ticket',
+            entity_id=ticket_id,
+            user_type='admin',
+            user_identifier='system',
+            details=details
+        )
 
 def log_ticket_deleted(ticket, admin_user, reason=None):
     """Log when a ticket is deleted"""
@@ -103,7 +307,8 @@ def log_ticket_deleted(ticket, admin_user, reason=None):
         entity_id=ticket.id,
         user_type='admin',
         user_identifier=admin_user,
-        details=details
+        details=details,
+        booking_reference=ticket.booking.booking_reference
     )
 
 def log_ticket_used(ticket, checker_user):
@@ -118,7 +323,8 @@ def log_ticket_used(ticket, checker_user):
         entity_id=ticket.id,
         user_type='admin',
         user_identifier=checker_user,
-        details=details
+        details=details,
+        booking_reference=ticket.booking.booking_reference
     )
 
 def log_settings_changed(key, old_value, new_value, admin_user):
@@ -163,5 +369,18 @@ def log_ticket_state_change(ticket, checker_user, action):
         entity_id=ticket.id,
         user_type='admin',
         user_identifier=checker_user,
-        details=details
-    )
\ No newline at end of file
+        details=details,
+        booking_reference=ticket.booking.booking_reference
+    )
+
+def log_tickets_used(entries, checker_user):
+    """Log ticket_used for many (ticket_id, details) pairs at once (details name the ticket and booking)"""
+    for ticket_id, details in entries:
+        log_audit_event(
+            action_type='ticket_used',
+            entity_type='ticket',
+            entity_id=ticket_id,
+            user_type='admin',
+            user_identifier=checker_user,
+            details=details
+        )
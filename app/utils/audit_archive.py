@@ -0,0 +1,214 @@
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from app.models import AuditLog, AuditArchiveSegment, AuditArchiveReference, Booking, Show, Ticket, db
+from app.utils.audit import AUDIT_FACETS, count_audit_facets, log_audit_event
+
+# A show's events move to the archive once it ended this long ago (door scans, late disputes)
+FINISHED_SHOW_GRACE = timedelta(days=1)
+
+# How often worker.py runs the archive job
+ARCHIVE_INTERVAL = 6 * 3600
+
+def archive_dir():
+    """Directory holding the audit archive segments"""
+    path = current_app.config.get('AUDIT_ARCHIVE_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'audit_archive')
+    return path
+
+def show_end(show):
+    """Local end time of a show, or None if its date is not in the usual '29/1 2026' form"""
+    try:
+        return datetime.strptime(f"{show.date} {show.end_time}", '%d/%m %Y %H:%M')
+    except (TypeError, ValueError):
+        return None
+
+def finished_show_ids(now=None):
+    now = now or datetime.now()
+    finished = []
+    for show in Show.query.all():
+        end = show_end(show)
+        if end is not None and end + FINISHED_SHOW_GRACE < now:
+            finished.append(show.id)
+    return finished
+
+def _archivable_condition():
+    """Events older than AUDIT_ARCHIVE_DAYS or about bookings/tickets of finished shows (None if nothing qualifies)"""
+    conditions = []
+    days = current_app.config.get('AUDIT_ARCHIVE_DAYS')
+    if days:
+        conditions.append(AuditLog.timestamp < datetime.utcnow() - timedelta(days=days))
+    shows = finished_show_ids()
+    if shows:
+        conditions.append((AuditLog.entity_type == 'booking') & AuditLog.entity_id.in_(
+            db.select(Booking.id).where(Booking.show_id.in_(shows))
+        ))
+        conditions.append((AuditLog.entity_type == 'ticket') & AuditLog.entity_id.in_(
+            db.select(Ticket.id).where(Ticket.show_id.in_(shows))
+        ))
+    return db.or_(*conditions) if conditions else None
+
+def _write_segment(path, rows):
+    """Write rows as gzip JSONL to a temp file next to path and sync it to disk; returns the temp path"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for row in rows:
+                row = dict(row, timestamp=row['timestamp'].isoformat() if row['timestamp'] else None)
+                f.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    return tmp_path
+
+def archive_audit_log(user_identifier='system'):
+    """Move archivable events out of audit_log into new segment files; returns how many moved"""
+    condition = _archivable_condition()
+    if condition is None:
+        return 0
+    ids = db.session.scalars(db.select(AuditLog.id).where(condition).order_by(AuditLog.id)).all()
+    if not ids:
+        return 0
+
+    path = archive_dir()
+    os.makedirs(path, exist_ok=True)
+    segment_rows = current_app.config.get('AUDIT_ARCHIVE_SEGMENT_ROWS', 5000)
+    table = AuditLog.__table__
+    moved = 0
+    for start in range(0, len(ids), segment_rows):
+        # DELETE ... RETURNING claims the rows: a run started at the same time (worker thread and
+        # "Arkivera nu") only gets rows still there, so no event lands in two segments or is uncounted twice
+        rows = sorted(db.session.execute(
+            table.delete().where(table.c.id.in_(ids[start:start + segment_rows]), condition).returning(*table.c)
+        ).mappings().all(), key=lambda row: row['id'])
+        if not rows:
+            db.session.rollback()
+            continue
+
+        # audit_log ids are never reused (AUTOINCREMENT), so neither is a segment name
+        filename = f"audit-{rows[0]['id']:08d}-{rows[-1]['id']:08d}.jsonl.gz"
+        segment_path = os.path.join(path, filename)
+        tmp_path = _write_segment(segment_path, rows)
+        placed = False
+        try:
+            _index_segment(filename, rows, user_identifier)
+            # A hard link fails instead of replacing, so a file another segment points to is never touched
+            os.link(tmp_path, segment_path)
+            placed = True
+            db.session.commit()
+        except Exception:
+            # The DELETE is undone with the rest; only files this run created are removed
+            db.session.rollback()
+            if placed:
+                os.remove(segment_path)
+            raise
+        finally:
+            os.remove(tmp_path)
+        moved += len(rows)
+        print(f"Archived {len(rows)} audit events to {filename}")
+    return moved
+
+def _index_segment(filename, rows, user_identifier):
+    """Record a written segment, its references and the lower facet counts (the caller commits)"""
+    timestamps = [row['timestamp'] for row in rows if row['timestamp']] or [datetime.min]
+    segment = AuditArchiveSegment(
+        filename=filename,
+        rows=len(rows),
+        first_id=rows[0]['id'],
+        last_id=rows[-1]['id'],
+        first_timestamp=min(timestamps),
+        last_timestamp=max(timestamps),
+        facets=json.dumps({
+            facet: Counter(row[column] for row in rows) for facet, column in AUDIT_FACETS.items()
+        })
+    )
+    db.session.add(segment)
+    count_audit_facets(db.session.connection(), rows, sign=-1)
+    db.session.flush()
+    references = {row['booking_reference'] for row in rows if row['booking_reference']}
+    if references:
+        db.session.execute(db.insert(AuditArchiveReference), [
+            dict(booking_reference=reference, segment_id=segment.id) for reference in sorted(references)
+        ])
+    log_audit_event(
+        action_type='audit_archived',
+        entity_type='audit',
+        entity_id=segment.id,
+        user_type='admin',
+        user_identifier=user_identifier,
+        details={'filename': filename, 'rows': len(rows)}
+    )
+
+def archive_facets():
+    """Filter values and row counts over all segments, shaped like audit_facets()"""
+    facets = {facet: Counter() for facet in AUDIT_FACETS}
+    for (segment_facets,) in db.session.query(AuditArchiveSegment.facets).all():
+        for facet, counts in json.loads(segment_facets).items():
+            facets.setdefault(facet, Counter()).update(counts)
+    return {facet: dict(sorted(counts.items())) for facet, counts in facets.items()}
+
+def _read_segment(filename):
+    with gzip.open(os.path.join(archive_dir(), filename), 'rt', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            row['timestamp'] = datetime.fromisoformat(row['timestamp']) if row['timestamp'] else datetime.min
+            yield row
+
+def query_archive(filters, cursor=None, newer=False, limit=50):
+    """Archived events matching filters, paged on (timestamp, id) like the live log
+
+    Returns up to limit events older than cursor, newest first (or with newer=True, the ones after
+    cursor, oldest first) as unsaved AuditLog objects. Only segments that can still hold a better
+    row than the ones found so far are decompressed, and those without the filtered values are skipped.
+    """
+    order = AuditArchiveSegment.first_timestamp if newer else AuditArchiveSegment.last_timestamp.desc()
+    found = []
+    for segment in AuditArchiveSegment.query.order_by(order, AuditArchiveSegment.id).all():
+        if len(found) >= limit:
+            edge = found[-1][0][0]
+            if (segment.first_timestamp > edge) if newer else (segment.last_timestamp < edge):
+                break
+        if cursor is not None and ((segment.last_timestamp < cursor[0]) if newer else (segment.first_timestamp > cursor[0])):
+            continue
+        segment_facets = json.loads(segment.facets)
+        if any(value not in segment_facets.get(facet, {}) for facet, value in filters.items()):
+            continue
+
+        for row in _read_segment(segment.filename):
+            if any(row[AUDIT_FACETS[facet]] != value for facet, value in filters.items()):
+                continue
+            key = (row['timestamp'], row['id'])
+            if cursor is not None and ((key <= cursor) if newer else (key >= cursor)):
+                continue
+            found.append((key, row))
+        found.sort(key=lambda item: item[0], reverse=not newer)
+        del found[limit:]
+
+    return [AuditLog(**row) for _, row in found]
+
+def archived_booking_events(booking_reference):
+    """Archived events of one booking, oldest first, read only from the segments that hold them"""
+    segments = AuditArchiveSegment.query.join(
+        AuditArchiveReference, AuditArchiveReference.segment_id == AuditArchiveSegment.id
+    ).filter(AuditArchiveReference.booking_reference == booking_reference).all()
+    rows = [
+        row for segment in segments for row in _read_segment(segment.filename)
+        if row.get('booking_reference') == booking_reference
+    ]
+    rows.sort(key=lambda row: (row['timestamp'], row['id']))
+    return [AuditLog(**row) for row in rows]
+
+def run_archive_worker(app, interval=ARCHIVE_INTERVAL):
+    """Archive old audit events every interval seconds (runs in a thread of worker.py)"""
+    while True:
+        with app.app_context():
+            try:
+                archive_audit_log()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Audit archive failed: {e}")
+        time.sleep(interval)
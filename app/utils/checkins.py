@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from app.models import Show, Ticket, Booking, db
+
+# Scans published in this process; a stream picks up the ones after the last sequence it saw
+CHECKIN_BUFFER_SIZE = 200
+_events = deque(maxlen=CHECKIN_BUFFER_SIZE)
+_sequence = 0
+_condition = threading.Condition()
+
+# A resync looks a little before the newest scan sent, so a scan committed late by another worker
+# with a slightly earlier used_at is not missed; scans already sent are skipped
+CHECKIN_OVERLAP = timedelta(seconds=10)
+
+def publish_checkin(ticket_reference, show_id, ticket_type, booking_reference, name, used_at):
+    """Tell open check-in streams in this process that a ticket was let in"""
+    global _sequence
+    event = {
+        'ticket_reference': ticket_reference,
+        'show_id': show_id,
+        'ticket_type': 'Ordinarie' if ticket_type == 'normal' else 'Student',
+        'booking_reference': booking_reference,
+        'name': name,
+        'used_at': used_at.isoformat() if used_at else None
+    }
+    with _condition:
+        _sequence += 1
+        _events.append((_sequence, event))
+        _condition.notify_all()
+
+def wait_for_checkins(after, timeout):
+    """Block until scans newer than sequence after arrive (or timeout); returns (sequence, events)"""
+    with _condition:
+        if _sequence == after:
+            _condition.wait(timeout)
+        return _sequence, [event for sequence, event in _events if sequence > after]
+
+def current_sequence():
+    with _condition:
+        return _sequence
+
+def checkin_counts():
+    """Checked-in and total confirmed tickets per show, in one GROUP BY"""
+    rows = db.session.query(
+        Booking.show_id,
+        func.count(Ticket.id),
+        func.sum(case((Ticket.is_used == True, 1), else_=0))
+    ).join(Booking, Ticket.booking_id == Booking.id).filter(
+        Booking.status == 'confirmed'
+    ).group_by(Booking.show_id).all()
+    counts = {show_id: {'used': int(used or 0), 'total': total} for show_id, total, used in rows}
+
+    shows = Show.query.order_by(Show.start_time).all()
+    return [
+        dict(show_id=show.id, label=f"{show.start_time}-{show.end_time}", **counts.get(show.id, {'used': 0, 'total': 0}))
+        for show in shows
+    ]
+
+def recent_checkins(limit=20, since=None):
+    """Latest used tickets, newest first (optionally only those used after since)"""
+    query = db.session.query(
+        Ticket.ticket_reference, Ticket.ticket_type, Ticket.used_at,
+        Booking.show_id, Booking.booking_reference, Booking.first_name, Booking.last_name
+    ).join(Booking, Ticket.booking_id == Booking.id).filter(Ticket.is_used == True, Ticket.used_at.isnot(None))
+    if since is not None:
+        query = query.filter(Ticket.used_at > since)
+    rows = query.order_by(Ticket.used_at.desc()).limit(limit).all()
+    return [
+        {
+            'ticket_reference': row.ticket_reference,
+            'show_id': row.show_id,
+            'ticket_type': 'Ordinarie' if row.ticket_type == 'normal' else 'Student',
+            'booking_reference': row.booking_reference,
+            'name': f"{row.first_name} {row.last_name}",
+            'used_at': row.used_at.isoformat()
+        }
+        for row in rows
+    ]
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def checkin_stream(app):
+    """Server-sent events: a snapshot, then scans as they happen and fresh counts
+
+    Scans made in this process arrive through the event bus right away. Scans handled by other
+    gunicorn workers (or toggled in admin) are picked up by a cheap resync every few seconds.
+    The stream ends after CHECKIN_STREAM_SECONDS and the browser reconnects on its own.
+    """
+    resync_interval = app.config.get('CHECKIN_RESYNC_SECONDS', 5)
+    deadline = time.monotonic() + app.config.get('CHECKIN_STREAM_SECONDS', 300)
+    sequence = current_sequence()
+
+    with app.app_context():
+        scans = recent_checkins()
+        counts = checkin_counts()
+        db.session.remove()
+    last_counts = counts
+    watermark = max((datetime.fromisoformat(scan['used_at']) for scan in scans), default=None)
+    sent = deque((scan['ticket_reference'] for scan in scans), maxlen=CHECKIN_BUFFER_SIZE)
+
+    yield "retry: 2000\n\n"
+    yield _sse('snapshot', {'counts': counts, 'scans': scans})
+
+    next_resync = time.monotonic() + resync_interval
+    while time.monotonic() < deadline:
+        sequence, events = wait_for_checkins(sequence, max(0.1, next_resync - time.monotonic()))
+        new_scans = [event for event in events if event['ticket_reference'] not in sent]
+
+        resync = time.monotonic() >= next_resync
+        if new_scans or resync:
+            with app.app_context():
+                if resync:
+                    known = {scan['ticket_reference'] for scan in new_scans}
+                    new_scans += [scan for scan in reversed(recent_checkins(since=watermark - CHECKIN_OVERLAP if watermark else None))
+                                  if scan['ticket_reference'] not in sent and scan['ticket_reference'] not in known]
+                    next_resync = time.monotonic() + resync_interval
+                counts = checkin_counts()
+                db.session.remove()
+
+            for scan in new_scans:
+                sent.append(scan['ticket_reference'])
+                if scan['used_at']:
+                    used_at = datetime.fromisoformat(scan['used_at'])
+                    watermark = max(watermark, used_at) if watermark else used_at
+                yield _sse('scan', scan)
+            if counts != last_counts or new_scans:
+                last_counts = counts
+                yield _sse('counts', counts)
+            else:
+                yield ": keepalive\n\n"
+        else:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
@@ -0,0 +1,142 @@
+from datetime import datetime
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app.models import Show, Ticket, Booking, db
+from app.utils.audit import log_tickets_used
+from app.utils.checkins import publish_checkin
+
+# How long a scanner may keep refreshing its manifest without an admin session
+DOOR_TOKEN_MAX_AGE = 12 * 3600
+
+# Most scans accepted in one sync request (keeps the IN list under SQLite's parameter limit)
+DOOR_BATCH_MAX = 500
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='door-manifest')
+
+def make_door_token(show_id):
+    """Signed token tying a scanner to one show"""
+    return _serializer().dumps({'show_id': show_id})
+
+def verify_door_token(token, show_id):
+    """True if token was issued by this server for show_id and has not expired"""
+    if not token:
+        return False
+    try:
+        data = _serializer().loads(token, max_age=DOOR_TOKEN_MAX_AGE)
+    except BadSignature:
+        return False
+    return data.get('show_id') == show_id
+
+def build_door_manifest(show_id):
+    """Every ticket of the event in compact form, for validating scans in the browser"""
+    if db.session.get(Show, show_id) is None:
+        return None
+
+    # One query for the whole event: tickets for other shows must be recognised as wrong show
+    rows = db.session.query(
+        Ticket.ticket_reference, Booking.show_id, Ticket.ticket_type, Ticket.is_used, Ticket.used_at, Booking.status
+    ).join(Booking, Ticket.booking_id == Booking.id).all()
+
+    # ticket_reference -> [show_id, 'N'/'S', used 0/1, confirmed 0/1, used_at or None]
+    # used_at is stored as local server time, so it goes out with the server's UTC offset
+    tickets = {
+        row.ticket_reference: [
+            row.show_id,
+            'N' if row.ticket_type == 'normal' else 'S',
+            1 if row.is_used else 0,
+            1 if row.status == 'confirmed' else 0,
+            row.used_at.astimezone().isoformat() if row.used_at else None
+        ]
+        for row in rows
+    }
+
+    # Not signed on its own: the browser could not check a signature without the secret key.
+    # The signed door token guards this download, and a sync re-checks every scan in the database.
+    return {
+        'show_id': show_id,
+        'issued_at': datetime.utcnow().isoformat() + 'Z',
+        'token': make_door_token(show_id),
+        'tickets': tickets
+    }
+
+def _scan_time(value, now):
+    """Client scan time as local naive datetime like Ticket.used_at; never in the future"""
+    try:
+        scanned_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return now
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+    return min(scanned_at, now)
+
+def _verdict(reference, status, message, **extra):
+    return dict(ticket_reference=reference, valid=status == 'success', status=status, message=message, **extra)
+
+def apply_door_checkins(show_id, scans, checker_user):
+    """Resolve many door scans in one transaction; the earliest scan of a ticket wins
+
+    scans is a list of {'ticket_reference', 'scanned_at'}. Returns one verdict per scan, in the given order.
+    """
+    now = datetime.now()
+    references = {str(scan.get('ticket_reference', '')).strip() for scan in scans} - {''}
+    rows = db.session.query(
+        Ticket.id, Ticket.ticket_reference, Ticket.ticket_type, Ticket.is_used, Ticket.used_at,
+        Booking.show_id, Booking.status, Booking.booking_reference, Booking.first_name, Booking.last_name
+    ).join(Booking, Ticket.booking_id == Booking.id).filter(Ticket.ticket_reference.in_(references)).all()
+    tickets = {row.ticket_reference: row for row in rows}
+
+    # Decide in scan order so the first scan at any door is the one that gets in
+    order = sorted(range(len(scans)), key=lambda i: _scan_time(scans[i].get('scanned_at'), now))
+    verdicts = [None] * len(scans)
+    used_now = {}
+    accepted = []
+    audit_entries = []
+    for i in order:
+        reference = str(scans[i].get('ticket_reference', '')).strip()
+        scanned_at = _scan_time(scans[i].get('scanned_at'), now)
+        row = tickets.get(reference)
+        if row is None:
+            verdicts[i] = _verdict(reference, 'error', 'Biljett hittades inte')
+        elif row.show_id != show_id:
+            verdicts[i] = _verdict(reference, 'wrong_show', 'Biljett för fel föreställning', ticket_show_id=row.show_id)
+        elif row.status != 'confirmed':
+            verdicts[i] = _verdict(reference, 'unconfirmed', 'Biljett inte bekräftad', booking_status=row.status)
+        elif row.is_used and row.used_at == scanned_at:
+            # Same scan sent again after a lost response
+            verdicts[i] = _verdict(reference, 'success', 'Biljett godkänd - välkommen in!', used_at=scanned_at.isoformat())
+        elif row.is_used or reference in used_now:
+            used_at = used_now.get(reference, row.used_at)
+            verdicts[i] = _verdict(reference, 'used', 'Biljett redan använd', used_at=used_at.isoformat() if used_at else None)
+        else:
+            # Conditional UPDATE: another request may have marked it since the SELECT
+            result = db.session.execute(
+                db.update(Ticket)
+                .where(Ticket.id == row.id, Ticket.is_used == False)
+                .values(is_used=True, used_at=scanned_at, checked_by=checker_user)
+            )
+            if result.rowcount != 1:
+                verdicts[i] = _verdict(reference, 'used', 'Biljett redan använd')
+                continue
+            used_now[reference] = scanned_at
+            accepted.append((reference, row, scanned_at))
+            audit_entries.append((row.id, {
+                'ticket_reference': reference,
+                'booking_reference': row.booking_reference,
+                'used_at': scanned_at.isoformat(),
+                'synced_at': now.isoformat()
+            }))
+            verdicts[i] = _verdict(
+                reference, 'success', 'Biljett godkänd - välkommen in!',
+                ticket_type='Ordinarie' if row.ticket_type == 'normal' else 'Student',
+                booking_reference=row.booking_reference,
+                used_at=scanned_at.isoformat()
+            )
+
+    log_tickets_used(audit_entries, checker_user)
+    db.session.commit()
+
+    for reference, row, scanned_at in accepted:
+        publish_checkin(reference, row.show_id, row.ticket_type, row.booking_reference,
+                        f"{row.first_name} {row.last_name}", scanned_at)
+    return verdicts
@@ -1,5 +1,8 @@
+import base64
 from flask_mail import Message
-from app import mail
+from app.utils.mail_pool import send_message
+from app.utils.qr_codes import render_ticket_qr_png
+from app.utils.ticket_pdfs import get_tickets_pdf
 from app.models import Settings
 from flask import current_app
 
@@ -60,7 +63,7 @@ def send_booking_confirmation(booking):
         <p>Med vänliga hälsningar,<br>{concert_name}-gruppen</p>
         """
         
-        mail.send(msg)
+        send_message(msg)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to send booking confirmation email: {e}")
@@ -100,7 +103,7 @@ def send_admin_notification(booking):
         <p>Logga in på adminpanelen för att hantera reservationen.</p>
         """
         
-        mail.send(msg)
+        send_message(msg)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to send admin notification email: {e}")
@@ -110,9 +113,8 @@ def send_payment_confirmed(booking):
     """Send payment confirmed email with PDF tickets attached"""
     try:
         from flask_mail import Message
-        from app import mail
+        from app.utils.mail_pool import send_message
         from app.models import Settings
-        from app.utils.pdf_tickets import generate_tickets_pdf
         
         print(f"Starting send_payment_confirmed for booking {booking.booking_reference}")
         
@@ -123,10 +125,9 @@ def send_payment_confirmed(booking):
         
         print(f"Concert info: {concert_name}, {concert_date}, {concert_venue}")
         
-        # Generate PDF with all tickets
-        print(f"Generating PDF for {len(booking.tickets)} tickets")
-        pdf_data = generate_tickets_pdf(booking)
-        print(f"PDF generated successfully, size: {len(pdf_data)} bytes")
+        # PDF with all tickets, rendered when the tickets were generated
+        pdf_data = get_tickets_pdf(booking)
+        print(f"Ticket PDF for {len(booking.tickets)} tickets, size: {len(pdf_data)} bytes")
         
         # Create email message
         msg = Message(
@@ -271,7 +272,7 @@ def send_payment_confirmed(booking):
         
         # Send email
         print(f"Sending email to {booking.email}")
-        mail.send(msg)
+        send_message(msg)
         print(f"Email sent successfully to {booking.email}")
         return True
         
@@ -298,20 +299,8 @@ def send_ticket_resend(booking):
             for ticket in booking.tickets:
                 ticket_type_text = "Ordinarie" if ticket.ticket_type == "normal" else "Student"
                 
-                # Generate QR code for ticket
-                import qrcode
-                import io
-                import base64
-                
-                qr = qrcode.QRCode(version=1, box_size=10, border=5)
-                qr.add_data(ticket.ticket_reference)
-                qr.make(fit=True)
-                
-                img = qr.make_image(fill_color="black", back_color="white")
-                buffer = io.BytesIO()
-                img.save(buffer, format='PNG')
-                buffer.seek(0)
-                img_base64 = base64.b64encode(buffer.getvalue()).decode()
+                # QR code from the shared cache
+                img_base64 = base64.b64encode(render_ticket_qr_png(ticket.ticket_reference, with_logo=False)).decode()
                 
                 qr_codes_html += f"""
                 <div style="border: 2px solid #dc2626; padding: 15px; margin: 10px 0; border-radius: 8px; text-align: center;">
@@ -347,7 +336,14 @@ def send_ticket_resend(booking):
         <p>Med vänliga hälsningar,<br>{concert_name}-gruppen</p>
         """
         
-        mail.send(msg)
+        if booking.tickets:
+            msg.attach(
+                filename=f"biljetter_{booking.booking_reference}.pdf",
+                content_type="application/pdf",
+                data=get_tickets_pdf(booking)
+            )
+        
+        send_message(msg)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to resend tickets email: {e}")
@@ -384,20 +380,8 @@ def send_multiple_tickets_resend(bookings):
                     ticket_type_text = "Ordinarie" if ticket.ticket_type == "normal" else "Student"
                     total_tickets += 1
                     
-                    # Generate QR code for ticket
-                    import qrcode
-                    import io
-                    import base64
-                    
-                    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-                    qr.add_data(ticket.ticket_reference)
-                    qr.make(fit=True)
-                    
-                    img = qr.make_image(fill_color="black", back_color="white")
-                    buffer = io.BytesIO()
-                    img.save(buffer, format='PNG')
-                    buffer.seek(0)
-                    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+                    # QR code from the shared cache
+                    img_base64 = base64.b64encode(render_ticket_qr_png(ticket.ticket_reference, with_logo=False)).decode()
                     
                     all_tickets_html += f"""
                     <div style="border: 2px solid #dc2626; padding: 15px; margin: 10px 0; border-radius: 8px; text-align: center;">
@@ -433,7 +417,15 @@ def send_multiple_tickets_resend(bookings):
         <p>Med vänliga hälsningar,<br>{concert_name}-gruppen</p>
         """
         
-        mail.send(msg)
+        for booking in bookings:
+            if booking.tickets:
+                msg.attach(
+                    filename=f"biljetter_{booking.booking_reference}.pdf",
+                    content_type="application/pdf",
+                    data=get_tickets_pdf(booking)
+                )
+        
+        send_message(msg)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to resend multiple tickets email: {e}")
@@ -477,7 +469,7 @@ def send_contact_message(name, email, phone, subject, message):
         <p>Meddelandet skickades från: {concert_name} kontaktformulär</p>
         """
         
-        mail.send(msg)
+        send_message(msg)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to send contact message: {e}")
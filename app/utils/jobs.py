@@ -0,0 +1,243 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context, request
+from app.models import EmailJob, Booking, db
+from app.utils.mail_pool import close_connection
+
+# Retry delays grow 30s, 60s, 120s, ... up to an hour
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+# A job still 'running' after this long belonged to a worker that died
+STALE_LOCK_AFTER = timedelta(minutes=10)
+
+def _send_booking_confirmation(payload):
+    from app.utils.email import send_booking_confirmation
+    booking = db.session.get(Booking, payload['booking_id'])
+    return booking is None or send_booking_confirmation(booking)
+
+def _send_admin_notification(payload):
+    from app.utils.email import send_admin_notification
+    booking = db.session.get(Booking, payload['booking_id'])
+    return booking is None or send_admin_notification(booking)
+
+def _send_payment_confirmed(payload):
+    from app.utils.email import send_payment_confirmed
+    booking = db.session.get(Booking, payload['booking_id'])
+    return booking is None or send_payment_confirmed(booking)
+
+def _send_multiple_tickets_resend(payload):
+    from app.utils.email import send_multiple_tickets_resend
+    bookings = Booking.query.filter(Booking.id.in_(payload['booking_ids'])).order_by(Booking.id).all()
+    return not bookings or send_multiple_tickets_resend(bookings)
+
+def _send_contact_message(payload):
+    from app.utils.email import send_contact_message
+    return send_contact_message(payload['name'], payload['email'], payload['phone'], payload['subject'], payload['message'])
+
+# Job kind -> handler returning True when the email was sent (a deleted booking counts as done)
+EMAIL_HANDLERS = {
+    'booking_confirmation': _send_booking_confirmation,
+    'admin_notification': _send_admin_notification,
+    'payment_confirmed': _send_payment_confirmed,
+    'multiple_tickets_resend': _send_multiple_tickets_resend,
+    'contact_message': _send_contact_message,
+}
+
+def enqueue_email(kind, commit=True, **payload):
+    """Queue an email for the worker, or send it from a background thread when no worker is configured
+
+    With commit=False the job joins the caller's transaction; call send_in_background([job]) after committing.
+    """
+    if kind not in EMAIL_HANDLERS:
+        raise ValueError(f"Unknown email job kind: {kind}")
+
+    # The worker has no request, so remember where links in the email should point
+    if has_request_context():
+        payload.setdefault('base_url', request.host_url)
+
+    job = EmailJob(
+        kind=kind,
+        payload=json.dumps(payload),
+        max_attempts=current_app.config.get('EMAIL_MAX_ATTEMPTS', 5)
+    )
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+        send_in_background([job])
+    return job
+
+def mail_quota_delay():
+    """Seconds until another email fits MAIL_RATE_PER_MINUTE and MAIL_RATE_PER_DAY (0 = send now)
+
+    Counted from sent jobs in email_job, so the web processes and the worker share one budget.
+    Every email goes to a single recipient, so jobs and recipients are the same count.
+    """
+    if current_app.extensions['mail'].suppress:
+        return 0
+
+    now = datetime.utcnow()
+    delay = 0
+    for window, limit in ((timedelta(minutes=1), current_app.config.get('MAIL_RATE_PER_MINUTE', 20)),
+                          (timedelta(days=1), current_app.config.get('MAIL_RATE_PER_DAY', 500))):
+        if not limit:
+            continue
+        # The limit-th newest send in the window; there is room again once it drops out
+        edge = db.session.query(EmailJob.finished_at).filter(
+            EmailJob.status == 'done',
+            EmailJob.finished_at > now - window
+        ).order_by(EmailJob.finished_at.desc()).offset(limit - 1).limit(1).scalar()
+        if edge is not None:
+            delay = max(delay, (edge + window - now).total_seconds())
+    return delay
+
+def _claim(job_id, now):
+    """Conditional UPDATE so two processes never take the same job"""
+    result = db.session.execute(
+        db.update(EmailJob)
+        .where(EmailJob.id == job_id, EmailJob.status == 'pending')
+        .values(status='running', locked_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def send_in_background(jobs):
+    """Without a worker, send committed jobs from a thread so the request returns at once
+
+    The thread waits out the sending limits for its own jobs, then sends whatever else is
+    already due (held back, failed or orphaned by earlier requests) as long as the limits allow.
+    """
+    if current_app.config.get('WORKER_ENABLED') or not jobs:
+        return
+    app = current_app._get_current_object()
+    base_url = request.host_url if has_request_context() else None
+    threading.Thread(target=_send_jobs, args=(app, [job.id for job in jobs], base_url), daemon=True).start()
+
+def _send_jobs(app, job_ids, base_url):
+    with app.test_request_context(base_url=base_url):
+        for job_id in job_ids:
+            try:
+                delay = mail_quota_delay()
+                while delay:
+                    time.sleep(min(delay, 60))
+                    delay = mail_quota_delay()
+                if _claim(job_id, datetime.utcnow()):
+                    run_job(db.session.get(EmailJob, job_id))
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error sending email job {job_id}: {e}")
+        try:
+            _send_due_jobs()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error sending due email jobs: {e}")
+        db.session.remove()
+
+def _send_due_jobs():
+    release_stale_jobs()
+    while not mail_quota_delay():
+        job_id = claim_next_job()
+        if job_id is None:
+            return
+        run_job(db.session.get(EmailJob, job_id))
+
+def _retry_delay(attempts):
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+def run_job(job):
+    """Run one email job and record the outcome (done, retry later, or dead)"""
+    payload = json.loads(job.payload)
+    try:
+        sent = EMAIL_HANDLERS[job.kind](payload)
+        error = None if sent else 'Email could not be sent (see log)'
+    except Exception as e:
+        db.session.rollback()
+        sent = False
+        error = f"{type(e).__name__}: {e}"
+
+    now = datetime.utcnow()
+    job.attempts += 1
+    job.locked_at = None
+    if sent:
+        job.status = 'done'
+        job.finished_at = now
+    elif job.attempts >= job.max_attempts:
+        job.status = 'dead'
+        job.last_error = error
+        job.finished_at = now
+    else:
+        job.status = 'pending'
+        job.last_error = error
+        job.run_after = now + timedelta(seconds=_retry_delay(job.attempts))
+    db.session.commit()
+    return sent
+
+def claim_next_job():
+    """Atomically mark the next due job as running; returns its id or None"""
+    while True:
+        now = datetime.utcnow()
+        candidate = db.session.query(EmailJob.id).filter(
+            EmailJob.status == 'pending',
+            EmailJob.run_after <= now
+        ).order_by(EmailJob.run_after, EmailJob.id).first()
+        if candidate is None:
+            return None
+
+        if _claim(candidate.id, now):
+            return candidate.id
+
+def release_stale_jobs():
+    """Put jobs left 'running' by a crashed worker back in the queue"""
+    db.session.execute(
+        db.update(EmailJob)
+        .where(EmailJob.status == 'running', EmailJob.locked_at < datetime.utcnow() - STALE_LOCK_AFTER)
+        .values(status='pending', locked_at=None)
+    )
+    db.session.commit()
+
+def retry_job(job):
+    """Give a failed or dead job a fresh set of attempts"""
+    job.status = 'pending'
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    db.session.commit()
+    send_in_background([job])
+
+def run_worker(app, poll_interval=2.0, once=False):
+    """Process queued email jobs until stopped (or until the queue is empty if once=True)"""
+    print(f"📬 Email worker started (polling every {poll_interval}s)")
+    try:
+        _work(app, poll_interval, once)
+    finally:
+        with app.app_context():
+            close_connection()
+
+def _work(app, poll_interval, once):
+    while True:
+        with app.app_context():
+            # Sending limits are only waited out here, never in a web request
+            delay = mail_quota_delay()
+            if delay:
+                print(f"⏳ Sending limit reached, waiting {delay:.0f}s")
+                time.sleep(min(delay, 60))
+                continue
+            release_stale_jobs()
+            job_id = claim_next_job()
+            base_url = None
+            if job_id is not None:
+                base_url = json.loads(db.session.get(EmailJob, job_id).payload).get('base_url')
+
+        if job_id is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        # A request context lets the email templates build absolute links with url_for
+        with app.test_request_context(base_url=base_url):
+            job = db.session.get(EmailJob, job_id)
+            sent = run_job(job)
+            print(f"{'✅' if sent else '⚠️'} Email job {job.id} ({job.kind}): {job.status}")
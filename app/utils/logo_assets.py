@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from PIL import Image as PILImage, ImageDraw
+from flask import current_app
+from app.models import Settings
+
+# Pixel size of a ticket QR code: version 1 (21 modules) + border 4 on each side, box size 10
+TICKET_QR_SIZE = (21 + 2 * 4) * 10
+
+# Prepared logo overlays kept per worker, keyed by (logo digest, QR size)
+_overlays = {}
+_overlays_lock = threading.Lock()
+
+# (qr_logo_data string, digest) for logos uploaded before digests were stored
+_legacy_digest = (None, None)
+
+def logo_digest(logo_bytes):
+    """Short content hash identifying a logo version"""
+    return hashlib.sha256(logo_bytes).hexdigest()[:16]
+
+def _overlay_path(digest, qr_size):
+    path = current_app.config.get('QR_CACHE_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'qr_cache')
+    return os.path.join(path, f"logo-{digest}-{qr_size}.png")
+
+def build_logo_overlay(logo_bytes, qr_size):
+    """Decode and scale a logo onto its rounded semi-transparent background, ready to paste"""
+    logo = PILImage.open(io.BytesIO(logo_bytes))
+
+    # Calculate logo size - smaller to avoid interfering with QR code
+    logo_size = int(qr_size * 0.15)  # 15% of QR code size (smaller)
+
+    # Resize logo maintaining aspect ratio
+    logo.thumbnail((logo_size, logo_size), PILImage.Resampling.LANCZOS)
+
+    # Convert logo to RGBA if it isn't already
+    if logo.mode != 'RGBA':
+        logo = logo.convert('RGBA')
+
+    # Create a semi-transparent white background for better visibility
+    logo_bg_size = logo_size + 8  # Add small padding
+    logo_bg = PILImage.new('RGBA', (logo_bg_size, logo_bg_size), (255, 255, 255, 200))  # Semi-transparent white
+
+    # Create rounded rectangle mask for the background
+    mask = PILImage.new('L', (logo_bg_size, logo_bg_size), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle([0, 0, logo_bg_size, logo_bg_size], radius=4, fill=255)
+
+    # Apply mask to create rounded background
+    logo_bg.putalpha(mask)
+
+    # Composite logo onto background preserving colors
+    logo_x = (logo_bg_size - logo_size) // 2
+    logo_y = (logo_bg_size - logo_size) // 2
+    logo_bg.paste(logo, (logo_x, logo_y), logo)
+
+    return logo_bg
+
+def _save_overlay(digest, qr_size, overlay):
+    path = _overlay_path(digest, qr_size)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        overlay.save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to write logo overlay file: {e}")
+
+def store_logo(logo_bytes):
+    """Validate an uploaded logo and prepare its overlay once; returns the logo digest"""
+    digest = logo_digest(logo_bytes)
+    # Raises if the upload is not a readable image
+    overlay = build_logo_overlay(logo_bytes, TICKET_QR_SIZE)
+    _save_overlay(digest, TICKET_QR_SIZE, overlay)
+    with _overlays_lock:
+        _overlays[(digest, TICKET_QR_SIZE)] = overlay
+    return digest
+
+def current_logo_digest():
+    """Digest of the configured QR logo, or None if there is no logo"""
+    global _legacy_digest
+
+    digest = Settings.get_value('qr_logo_digest')
+    if digest:
+        return digest
+
+    qr_logo_data = Settings.get_value('qr_logo_data')
+    if not qr_logo_data:
+        return None
+
+    # Logo stored before digests existed: hash it once per settings version
+    if _legacy_digest[0] is not qr_logo_data:
+        try:
+            _legacy_digest = (qr_logo_data, logo_digest(base64.b64decode(qr_logo_data)))
+        except Exception as e:
+            print(f"Error decoding logo data: {e}")
+            return None
+    return _legacy_digest[1]
+
+def get_logo_overlay(digest, qr_size):
+    """Prepared overlay for a logo version, from memory, disk, or built from settings"""
+    key = (digest, qr_size)
+    with _overlays_lock:
+        overlay = _overlays.get(key)
+    if overlay is not None:
+        return overlay
+
+    path = _overlay_path(digest, qr_size)
+    try:
+        with PILImage.open(path) as image:
+            overlay = image.convert('RGBA')
+    except OSError:
+        overlay = None
+
+    if overlay is None:
+        qr_logo_data = Settings.get_value('qr_logo_data')
+        if not qr_logo_data:
+            return None
+        overlay = build_logo_overlay(base64.b64decode(qr_logo_data), qr_size)
+        _save_overlay(digest, qr_size, overlay)
+
+    with _overlays_lock:
+        _overlays[key] = overlay
+    return overlay
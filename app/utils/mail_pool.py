@@ -0,0 +1,86 @@
+import smtplib
+import threading
+import time
+from flask import current_app
+from flask_mail import Connection
+
+# Errors after which the pooled connection is dropped and the message is sent once more on a new one
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+# One authenticated SMTP connection per process, reused between messages
+_pool = {'connection': None, 'key': None, 'last_used': 0.0}
+_pool_lock = threading.Lock()
+
+def _state_key(state):
+    """Connection settings; a change (e.g. new admin email) means a new login"""
+    return (state.server, state.port, state.username, state.password, state.use_tls, state.use_ssl)
+
+def _close():
+    connection = _pool['connection']
+    _pool['connection'] = None
+    _pool['key'] = None
+    if connection is not None and connection.host is not None:
+        try:
+            connection.host.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.host.close()
+
+def _connect(state):
+    """Open a connection: TCP, STARTTLS and AUTH happen here, once"""
+    connection = Connection(state).__enter__()
+    _pool['connection'] = connection
+    _pool['key'] = _state_key(state)
+    _pool['last_used'] = time.monotonic()
+    return connection
+
+def _is_alive(connection):
+    try:
+        return connection.host.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+def _get_connection(state):
+    connection = _pool['connection']
+    if connection is None or _pool['key'] != _state_key(state):
+        _close()
+        return _connect(state)
+
+    # Servers drop idle clients; check with a cheap NOOP instead of finding out mid-send
+    idle = time.monotonic() - _pool['last_used']
+    if connection.host is not None and idle > current_app.config.get('MAIL_KEEPALIVE', 60) and not _is_alive(connection):
+        _close()
+        return _connect(state)
+    return connection
+
+def send_message(message):
+    """Send a Flask-Mail message over the pooled SMTP connection (rate limits: see jobs.mail_quota_delay)"""
+    state = current_app.extensions['mail']
+
+    with _pool_lock:
+        connection = _get_connection(state)
+        try:
+            connection.send(message)
+        except RECONNECT_ERRORS as e:
+            # Connection went away under us: log in again and retry this message once
+            print(f"SMTP connection lost ({type(e).__name__}), reconnecting")
+            _close()
+            connection = _connect(state)
+            connection.send(message)
+        except smtplib.SMTPResponseException as e:
+            # 421: server is closing the channel, any other error leaves the connection usable
+            if e.smtp_code != 421:
+                raise
+            _close()
+            connection = _connect(state)
+            connection.send(message)
+        except OSError:
+            # Unknown socket/TLS state, don't reuse it
+            _close()
+            raise
+
+        _pool['last_used'] = time.monotonic()
+
+def close_connection():
+    """Log out of the pooled SMTP connection (on worker shutdown)"""
+    with _pool_lock:
+        _close()
@@ -0,0 +1,123 @@
+import base64
+import hashlib
+import io
+import os
+from PIL import Image as PILImage
+from flask import current_app, url_for
+from app.models import Settings
+
+# Media files are content-addressed, so a URL never changes meaning and can be cached forever
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Widths of the pre-generated smaller copies (only made when the original is wider)
+VARIANT_WIDTHS = (480, 960)
+
+# digest -> original width, local to this worker
+_widths = {}
+
+# (class_photo_data string, (digest, ext)) for photos uploaded before the media store existed
+_legacy_class_photo = (None, None)
+
+def media_dir():
+    """Directory holding uploaded images and their variants"""
+    path = current_app.config.get('MEDIA_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'media')
+    return path
+
+def _write_file(filename, data):
+    path = os.path.join(media_dir(), filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=80, method=4)
+    elif image_format == 'JPEG':
+        image.convert('RGB').save(buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+    else:
+        image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+def store_image(image_bytes):
+    """Write an image plus resized and WebP variants into the media store; returns (digest, ext)"""
+    image = PILImage.open(io.BytesIO(image_bytes))
+    image.load()  # Raises if the upload is not a readable image
+
+    image_format = 'JPEG' if image.format == 'JPEG' else 'PNG'
+    ext = 'jpg' if image_format == 'JPEG' else 'png'
+    digest = hashlib.sha256(image_bytes).hexdigest()[:16]
+
+    if os.path.exists(os.path.join(media_dir(), f"{digest}.{ext}")):
+        return digest, ext
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    # Variants first, original last: the original's presence marks the set as complete
+    _write_file(f"{digest}.webp", _encode(image, 'WEBP'))
+    for width in VARIANT_WIDTHS:
+        if image.width > width:
+            resized = image.copy()
+            resized.thumbnail((width, image.height), PILImage.Resampling.LANCZOS)
+            _write_file(f"{digest}-{width}.{ext}", _encode(resized, image_format))
+            _write_file(f"{digest}-{width}.webp", _encode(resized, 'WEBP'))
+    _write_file(f"{digest}.{ext}", image_bytes)
+
+    _widths[digest] = image.width
+    return digest, ext
+
+def _original_width(digest, ext):
+    width = _widths.get(digest)
+    if width is None:
+        with PILImage.open(os.path.join(media_dir(), f"{digest}.{ext}")) as image:
+            width = image.width
+        _widths[digest] = width
+    return width
+
+def image_sources(digest, ext):
+    """src and srcset URLs (original format and WebP) for a stored image"""
+    width = _original_width(digest, ext)
+    widths = [w for w in VARIANT_WIDTHS if w < width]
+
+    def srcset(variant_ext):
+        entries = [f"{url_for('public.media_file', filename=f'{digest}-{w}.{variant_ext}')} {w}w" for w in widths]
+        entries.append(f"{url_for('public.media_file', filename=f'{digest}.{variant_ext}')} {width}w")
+        return ', '.join(entries)
+
+    return {
+        'src': url_for('public.media_file', filename=f"{digest}.{ext}"),
+        'webp': url_for('public.media_file', filename=f"{digest}.webp"),
+        'srcset': srcset(ext),
+        'webp_srcset': srcset('webp')
+    }
+
+def class_photo_sources():
+    """Media URLs for the uploaded class photo, or None if only the bundled photo exists"""
+    global _legacy_class_photo
+
+    class_photo_data = Settings.get_value('class_photo_data')
+    if not class_photo_data:
+        return None
+
+    digest = Settings.get_value('class_photo_digest')
+    ext = Settings.get_value('class_photo_ext')
+
+    try:
+        if digest and ext:
+            # Rebuild from the database copy if the media volume was lost
+            if not os.path.exists(os.path.join(media_dir(), f"{digest}.{ext}")):
+                store_image(base64.b64decode(class_photo_data))
+        else:
+            # Photo uploaded before the media store existed: store it once per settings version
+            if _legacy_class_photo[0] is not class_photo_data:
+                _legacy_class_photo = (class_photo_data, store_image(base64.b64decode(class_photo_data)))
+            digest, ext = _legacy_class_photo[1]
+        return image_sources(digest, ext)
+    except Exception as e:
+        print(f"Error preparing class photo: {e}")
+        return None
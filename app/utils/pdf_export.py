@@ -0,0 +1,227 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from flask import current_app
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as pdf_canvas
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import PdfExport, Booking, Show, Settings, db
+from app.utils.pdf_tickets import get_ticket_layout, begin_tickets_document, draw_booking_tickets
+
+# Config copied into the render processes so they open the same database and caches
+EXPORT_PROCESS_CONFIG = ('SQLALCHEMY_DATABASE_URI', 'QR_CACHE_DIR', 'MEDIA_DIR', 'SETTINGS_VERSION_FILE')
+
+GUEST_LIST_FILENAME = 'gastlista.pdf'
+
+# App used by a render process, created once by _init_render_process
+_render_app = None
+
+def export_dir(export_id):
+    """Directory holding the PDF files of one export"""
+    path = current_app.config.get('PDF_EXPORT_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'exports')
+    return os.path.join(path, str(export_id))
+
+def export_files(export_id):
+    """Finished files of an export, guest list first"""
+    path = export_dir(export_id)
+    if not os.path.isdir(path):
+        return []
+    names = sorted(name for name in os.listdir(path) if name.endswith('.pdf'))
+    if GUEST_LIST_FILENAME in names:
+        names.remove(GUEST_LIST_FILENAME)
+        names.insert(0, GUEST_LIST_FILENAME)
+    return names
+
+def _export_bookings(show_id):
+    """Confirmed bookings with tickets in print order: by show, then guest name"""
+    query = Booking.query.join(Show).filter(Booking.status == 'confirmed', Booking.tickets.any())
+    if show_id:
+        query = query.filter(Booking.show_id == show_id)
+    return query.options(joinedload(Booking.show), selectinload(Booking.tickets)).order_by(
+        Show.start_time, Booking.last_name, Booking.first_name, Booking.id
+    ).all()
+
+def _split_parts(bookings, tickets_per_part):
+    """Group bookings into parts of about tickets_per_part tickets, never splitting a booking"""
+    parts = []
+    current = []
+    count = 0
+    for booking in bookings:
+        if current and count + len(booking.tickets) > tickets_per_part:
+            parts.append((current, count))
+            current, count = [], 0
+        current.append(booking.id)
+        count += len(booking.tickets)
+    if current:
+        parts.append((current, count))
+    return parts
+
+def _write_atomically(path, draw):
+    """Let draw fill a canvas that writes to path, then move the file into place"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    c = pdf_canvas.Canvas(tmp_path, pagesize=A4)
+    draw(c)
+    c.save()
+    os.replace(tmp_path, path)
+
+def write_guest_list(path, bookings, concert_name):
+    """Printable guest list: one row per booking, grouped by show"""
+    width, height = A4
+    row_height = 18
+    columns = ((40, 'Namn'), (230, 'Bokning'), (300, 'Ord.'), (340, 'Stud.'), (385, 'Telefon'), (475, 'Incheckad'))
+
+    def draw(c):
+        c.setTitle(f"Gästlista - {concert_name}")
+        y = None
+        current_show = None
+        for booking in bookings:
+            if booking.show_id != current_show or y < 50:
+                if y is not None:
+                    c.showPage()
+                current_show = booking.show_id
+                c.setFont('Helvetica-Bold', 16)
+                c.drawString(40, height - 50, f"{concert_name} - gästlista")
+                c.setFont('Helvetica', 12)
+                c.drawString(40, height - 70, f"Föreställning {booking.show.start_time}-{booking.show.end_time}")
+                y = height - 100
+                c.setFont('Helvetica-Bold', 10)
+                for x, title in columns:
+                    c.drawString(x, y, title)
+                c.line(40, y - 5, width - 40, y - 5)
+                y -= row_height
+
+            c.setFont('Helvetica', 10)
+            c.drawString(40, y, f"{booking.last_name}, {booking.first_name}"[:38])
+            c.drawString(230, y, booking.booking_reference)
+            c.drawString(300, y, str(booking.adult_tickets))
+            c.drawString(340, y, str(booking.student_tickets))
+            c.drawString(385, y, booking.phone)
+            c.rect(475, y - 2, 10, 10)
+            y -= row_height
+        if y is None:
+            c.setFont('Helvetica', 12)
+            c.drawString(40, height - 50, 'Inga bekräftade bokningar.')
+        c.showPage()
+
+    _write_atomically(path, draw)
+
+def _init_render_process(config):
+    """Give a render process its own app and database connections"""
+    global _render_app
+    from app import create_app
+    _render_app = create_app(config)
+
+def _render_part(path, booking_ids):
+    """Write the tickets of the given bookings into one PDF file; returns (filename, tickets)"""
+    with _render_app.app_context():
+        bookings = Booking.query.options(joinedload(Booking.show), selectinload(Booking.tickets)).filter(
+            Booking.id.in_(booking_ids)
+        ).all()
+        by_id = {booking.id: booking for booking in bookings}
+
+        concert_name = Settings.get_value('concert_name', 'Klasskonsert 24C')
+        concert_date = Settings.get_value('concert_date', '29/1 2026')
+        concert_venue = Settings.get_value('concert_venue', 'Aulan på Rytmus Stockholm')
+        layout = get_ticket_layout(concert_name, concert_date, concert_venue)
+
+        tickets = 0
+
+        def draw(c):
+            nonlocal tickets
+            c.setTitle(f"{concert_name} - biljetter")
+            begin_tickets_document(c, layout)
+            for booking_id in booking_ids:
+                booking = by_id.get(booking_id)
+                if booking is not None:
+                    draw_booking_tickets(c, booking, layout, concert_venue)
+                    tickets += len(booking.tickets)
+
+        _write_atomically(path, draw)
+        return os.path.basename(path), tickets
+
+def run_pdf_export(app, export_id):
+    """Render an export: guest list, then ticket parts spread over a process pool"""
+    with app.app_context():
+        export = db.session.get(PdfExport, export_id)
+        try:
+            path = export_dir(export_id)
+            os.makedirs(path, exist_ok=True)
+
+            bookings = _export_bookings(export.show_id)
+            parts = _split_parts(bookings, current_app.config.get('PDF_EXPORT_TICKETS_PER_PART', 250))
+            concert_name = Settings.get_value('concert_name', 'Klasskonsert 24C')
+
+            export.status = 'running'
+            export.started_at = datetime.utcnow()
+            export.parts_total = len(parts)
+            export.tickets_total = sum(count for _, count in parts)
+            db.session.commit()
+
+            write_guest_list(os.path.join(path, GUEST_LIST_FILENAME), bookings, concert_name)
+
+            config = {key: current_app.config.get(key) for key in EXPORT_PROCESS_CONFIG}
+            processes = max(1, min(current_app.config.get('PDF_EXPORT_PROCESSES', 1), len(parts)))
+            # spawn: render processes must not inherit this process's database connections
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_render_process, initargs=(config,)) as pool:
+                futures = [
+                    pool.submit(_render_part, os.path.join(path, f"biljetter-{number:03d}.pdf"), booking_ids)
+                    for number, (booking_ids, _) in enumerate(parts, start=1)
+                ]
+                for future in as_completed(futures):
+                    filename, tickets = future.result()
+                    export.parts_done += 1
+                    export.tickets_done += tickets
+                    db.session.commit()
+                    print(f"PDF export {export_id}: {filename} done ({export.parts_done}/{export.parts_total})")
+
+            export.status = 'done'
+            export.finished_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"PDF export {export_id} failed: {e}")
+            export = db.session.get(PdfExport, export_id)
+            export.status = 'failed'
+            export.error = f"{type(e).__name__}: {e}"
+            export.finished_at = datetime.utcnow()
+            db.session.commit()
+
+def claim_next_export():
+    """Atomically take the oldest queued export; returns its id or None"""
+    candidate = db.session.query(PdfExport.id).filter_by(status='queued').order_by(PdfExport.id).first()
+    if candidate is None:
+        return None
+    result = db.session.execute(
+        db.update(PdfExport)
+        .where(PdfExport.id == candidate.id, PdfExport.status == 'queued')
+        .values(status='running')
+    )
+    db.session.commit()
+    return candidate.id if result.rowcount == 1 else None
+
+def start_pdf_export(show_id, created_by):
+    """Queue an export for worker.py, or render it in a background thread when there is no worker"""
+    export = PdfExport(show_id=show_id, created_by=created_by)
+    db.session.add(export)
+    db.session.commit()
+
+    if not current_app.config.get('WORKER_ENABLED'):
+        app = current_app._get_current_object()
+        threading.Thread(target=run_pdf_export, args=(app, export.id), daemon=True).start()
+    return export
+
+def run_export_worker(app, poll_interval=5.0):
+    """Render queued exports one at a time (runs in a thread of worker.py)"""
+    while True:
+        with app.app_context():
+            export_id = claim_next_export()
+        if export_id is None:
+            time.sleep(poll_interval)
+            continue
+        run_pdf_export(app, export_id)
@@ -1,337 +1,202 @@
-from reportlab.lib.pagesizes import A4, letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, KeepTogether
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics.charts.textlabels import Label
-import qrcode
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas as pdf_canvas
 import io
-import base64
-from datetime import datetime
+from app.utils.qr_codes import render_ticket_qr_png
+
+# Page geometry: tickets are 6 inch wide and centered, half inch top margin
+PAGE_WIDTH, PAGE_HEIGHT = A4
+TICKET_WIDTH = 6*inch
+TICKET_X = (PAGE_WIDTH - TICKET_WIDTH) / 2
+PAGE_TOP = PAGE_HEIGHT - 0.5*inch
+
+# Ticket rows top to bottom (header, date/venue, time/type, QR), then a gap and the stub
+TICKET_COLUMNS = (3*inch, 0.5*inch, 2.5*inch)
+TICKET_ROWS = (0.4*inch, 0.3*inch, 0.4*inch, 1.5*inch + 24)
+STUB_HEIGHT = 0.3*inch
+STUB_GAP = 10
+TICKET_HEIGHT = sum(TICKET_ROWS) + STUB_GAP + STUB_HEIGHT
+CELL_PADDING = 12
+
+# Booking summary table on the first page
+BOOKING_TABLE_TOP = PAGE_TOP - 100
+BOOKING_ROW_HEIGHT = 30
+BOOKING_COLUMNS = (2*inch, 4*inch)
+BOOKING_LABELS = ('Bokningsreferens:', 'Namn:', 'E-post:', 'Telefon:', 'Föreställning:', 'Plats:')
+FIRST_TICKET_TOP = BOOKING_TABLE_TOP - len(BOOKING_LABELS) * BOOKING_ROW_HEIGHT - 30
+
+# Color scheme inspired by Rytmus
+PRIMARY_BLUE = '#1e40af'
+SECONDARY_GRAY = '#374151'
+ACCENT_GREEN = '#059669'
+LIGHT_GRAY = '#f3f4f6'
+MUTED_GRAY = '#6b7280'
+
+# Static drawing operations per concert settings version: {'key': (name, date, venue), 'layout': {...}}
+_layout_cache = {'key': None, 'layout': None}
+
+def _fit_size(text, font, size, max_width, min_size=6):
+    """Largest font size up to size at which text fits in max_width"""
+    while size > min_size and stringWidth(text, font, size) > max_width:
+        size -= 0.5
+    return size
+
+def _text_op(text, x, y_mid, font, size, color, align='left', max_width=None):
+    """Text operation with the font shrunk to fit and the baseline centered on y_mid"""
+    if max_width:
+        size = _fit_size(text, font, size, max_width)
+    return ('text', text, x, y_mid - size * 0.35, font, size, color, align)
+
+def _row_bounds():
+    """(bottom, middle) of each ticket row, measured from the bottom of the stub"""
+    bounds = []
+    top = TICKET_HEIGHT
+    for height in TICKET_ROWS:
+        bounds.append((top - height, top - height / 2))
+        top -= height
+    return bounds
+
+def _build_layout(concert_name, concert_date, concert_venue):
+    """Precompute every static element of the ticket PDF for one set of concert settings"""
+    header = [
+        _text_op(concert_name, PAGE_WIDTH / 2, PAGE_TOP - 24, 'Helvetica-Bold', 28, PRIMARY_BLUE, 'center', TICKET_WIDTH),
+        _text_op(concert_date, PAGE_WIDTH / 2, PAGE_TOP - 60, 'Helvetica', 18, SECONDARY_GRAY, 'center', TICKET_WIDTH),
+    ]
+    label_width, value_width = BOOKING_COLUMNS
+    for i, label in enumerate(BOOKING_LABELS):
+        y = BOOKING_TABLE_TOP - (i + 1) * BOOKING_ROW_HEIGHT
+        header.append(('rect', TICKET_X, y, label_width, BOOKING_ROW_HEIGHT, LIGHT_GRAY, PRIMARY_BLUE, 1))
+        header.append(('rect', TICKET_X + label_width, y, value_width, BOOKING_ROW_HEIGHT,
+                       LIGHT_GRAY if i % 2 else '#ffffff', PRIMARY_BLUE, 1))
+        header.append(_text_op(label, TICKET_X + 6, y + BOOKING_ROW_HEIGHT / 2, 'Helvetica-Bold', 12, SECONDARY_GRAY))
+
+    left_width, _, right_width = TICKET_COLUMNS
+    right_center = TICKET_WIDTH - right_width / 2
+    rows = _row_bounds()
+    table_bottom = rows[-1][0]
+    ticket = [
+        ('rect', 0, rows[0][0], TICKET_WIDTH, TICKET_ROWS[0], LIGHT_GRAY, None, 0),
+        ('rect', 0, rows[2][0], TICKET_WIDTH, TICKET_ROWS[2], '#f0f9ff', None, 0),
+        ('line', 0, rows[0][0], TICKET_WIDTH, rows[0][0], PRIMARY_BLUE, 1),
+        ('line', 0, rows[2][0], TICKET_WIDTH, rows[2][0], PRIMARY_BLUE, 1),
+        ('rect', 0, table_bottom, TICKET_WIDTH, TICKET_HEIGHT - table_bottom, None, PRIMARY_BLUE, 2),
+        _text_op(concert_name, left_width / 2, rows[0][1], 'Helvetica-Bold', 16, PRIMARY_BLUE, 'center', left_width - 2*CELL_PADDING),
+        _text_op(concert_date, CELL_PADDING, rows[1][1], 'Helvetica', 12, SECONDARY_GRAY, 'left', left_width - 2*CELL_PADDING),
+        _text_op(concert_venue, right_center, rows[1][1], 'Helvetica', 10, SECONDARY_GRAY, 'center', right_width - 2*CELL_PADDING),
+        # Stub
+        ('rect', 0, 0, TICKET_WIDTH, STUB_HEIGHT, '#f9fafb', '#d1d5db', 1),
+        _text_op('KEEP THIS TICKET', left_width / 2, STUB_HEIGHT / 2, 'Helvetica', 8, MUTED_GRAY, 'center'),
+    ]
+    return {'header': header, 'ticket': ticket, 'rows': rows}
+
+def get_ticket_layout(concert_name, concert_date, concert_venue):
+    """Static ticket layout for the given concert settings, built once per settings version"""
+    key = (concert_name, concert_date, concert_venue)
+    if _layout_cache['key'] != key:
+        _layout_cache['layout'] = _build_layout(*key)
+        _layout_cache['key'] = key
+    return _layout_cache['layout']
+
+def _draw_ops(c, ops):
+    for op in ops:
+        if op[0] == 'text':
+            _, text, x, y, font, size, color, align = op
+            c.setFont(font, size)
+            c.setFillColor(colors.HexColor(color))
+            if align == 'center':
+                c.drawCentredString(x, y, text)
+            else:
+                c.drawString(x, y, text)
+        elif op[0] == 'rect':
+            _, x, y, width, height, fill, stroke, line_width = op
+            if fill:
+                c.setFillColor(colors.HexColor(fill))
+            if stroke:
+                c.setStrokeColor(colors.HexColor(stroke))
+                c.setLineWidth(line_width)
+            c.rect(x, y, width, height, stroke=1 if stroke else 0, fill=1 if fill else 0)
+        elif op[0] == 'line':
+            _, x1, y1, x2, y2, color, line_width = op
+            c.setStrokeColor(colors.HexColor(color))
+            c.setLineWidth(line_width)
+            c.line(x1, y1, x2, y2)
+
+def begin_tickets_document(c, layout):
+    """Register the static ticket skeleton as a reusable form in a new canvas"""
+    c.beginForm('ticket_skeleton', 0, 0, TICKET_WIDTH, TICKET_HEIGHT)
+    _draw_ops(c, layout['ticket'])
+    c.endForm()
+
+def _draw_ticket(c, layout, ticket, show_time, top, ticket_num, total_tickets):
+    """Stamp the skeleton at top and fill in the per-ticket fields"""
+    left_width, _, right_width = TICKET_COLUMNS
+    right_center = TICKET_WIDTH - right_width / 2
+    rows = layout['rows']
+    ticket_type = 'Ordinarie' if ticket.ticket_type == 'normal' else 'Student'
+
+    c.saveState()
+    c.translate(TICKET_X, top - TICKET_HEIGHT)
+    c.doForm('ticket_skeleton')
+    _draw_ops(c, [
+        _text_op(f"BILJETT {ticket_num}/{total_tickets}", right_center, rows[0][1], 'Helvetica-Bold', 12, PRIMARY_BLUE, 'center'),
+        _text_op(show_time, CELL_PADDING, rows[2][1], 'Helvetica-Bold', 14, ACCENT_GREEN),
+        _text_op(ticket_type, right_center, rows[2][1], 'Helvetica-Bold', 12, PRIMARY_BLUE, 'center'),
+        _text_op(ticket.ticket_reference, right_center, rows[3][1], 'Helvetica', 8, MUTED_GRAY, 'center', right_width - 2*CELL_PADDING),
+        _text_op(ticket.ticket_reference, right_center, STUB_HEIGHT / 2, 'Helvetica', 8, MUTED_GRAY, 'center', right_width - 2*CELL_PADDING),
+    ])
+    qr_size = 1.5*inch
+    qr_image = ImageReader(io.BytesIO(render_ticket_qr_png(ticket.ticket_reference)))
+    c.drawImage(qr_image, CELL_PADDING, rows[3][0] + (TICKET_ROWS[3] - qr_size) / 2, qr_size, qr_size)
+    c.restoreState()
+
+def draw_booking_tickets(c, booking, layout, concert_venue):
+    """Draw the booking summary page and one page per ticket onto an open canvas"""
+    show_time = f"{booking.show.start_time}-{booking.show.end_time}"
+    _draw_ops(c, layout['header'])
+
+    _, value_width = BOOKING_COLUMNS
+    values = (booking.booking_reference, booking.full_name, booking.email, booking.phone, show_time, concert_venue)
+    value_x = TICKET_X + BOOKING_COLUMNS[0] + 6
+    _draw_ops(c, [
+        _text_op(value, value_x, BOOKING_TABLE_TOP - (i + 0.5) * BOOKING_ROW_HEIGHT, 'Helvetica-Bold', 12, '#000000', 'left', value_width - 12)
+        for i, value in enumerate(values)
+    ])
+
+    tickets = booking.tickets
+    top = FIRST_TICKET_TOP
+    for i, ticket in enumerate(tickets):
+        if i > 0:
+            c.showPage()
+            top = PAGE_TOP
+        _draw_ticket(c, layout, ticket, show_time, top, i + 1, len(tickets))
+    c.showPage()
 
 def generate_tickets_pdf(booking):
     """Generate PDF with all tickets for a booking"""
-    
+    from app.models import Settings
+
     try:
-        print(f"Starting PDF generation for booking {booking.booking_reference}")
-        
-        # Create PDF buffer
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        
-        # Create custom styles inspired by Rytmus aesthetic
-        title_style = ParagraphStyle(
-            'ConcertTitle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            textColor=colors.HexColor('#1e40af'),  # Rytmus blue
-            alignment=TA_CENTER,
-            spaceAfter=15,
-            fontName='Helvetica-Bold'
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'ConcertSubtitle',
-            parent=styles['Heading2'],
-            fontSize=18,
-            textColor=colors.HexColor('#374151'),  # Dark gray
-            alignment=TA_CENTER,
-            spaceAfter=20,
-            fontName='Helvetica'
-        )
-        
-        # Color scheme inspired by Rytmus
-        primary_blue = colors.HexColor('#1e40af')  # Rytmus blue
-        secondary_gray = colors.HexColor('#374151')  # Dark gray
-        accent_green = colors.HexColor('#059669')  # Success green
-        light_gray = colors.HexColor('#f3f4f6')  # Light background
-        
-        # Get concert information
-        from app.models import Settings
-        import os
         concert_name = Settings.get_value('concert_name', 'Klasskonsert 24C')
         concert_date = Settings.get_value('concert_date', '29/1 2026')
         concert_venue = Settings.get_value('concert_venue', 'Aulan på Rytmus Stockholm')
-        
-        print(f"Concert info: {concert_name}, {concert_date}, {concert_venue}")
-        
-        # Get logo data from database if available
-        logo_data = None
-        qr_logo_data = Settings.get_value('qr_logo_data')
-        qr_logo_content_type = Settings.get_value('qr_logo_content_type', 'image/jpeg')
-        
-        if qr_logo_data:
-            import base64
-            from PIL import Image as PILImage
-            
-            try:
-                # Decode base64 data
-                logo_bytes = base64.b64decode(qr_logo_data)
-                logo_data = io.BytesIO(logo_bytes)
-                print("Logo data loaded successfully")
-            except Exception as e:
-                print(f"Error decoding logo data: {e}")
-                logo_data = None
-        
-        # Build PDF content
-        story = []
-        
-        # Header
-        story.append(Paragraph(f"{concert_name}", title_style))
-        story.append(Paragraph(f"{concert_date}", subtitle_style))
-        story.append(Spacer(1, 20))
-        
-        # Booking info
-        booking_info = [
-            ['Bokningsreferens:', booking.booking_reference],
-            ['Namn:', booking.full_name],
-            ['E-post:', booking.email],
-            ['Telefon:', booking.phone],
-            ['Föreställning:', f"{booking.show.start_time}-{booking.show.end_time}"],
-            ['Plats:', concert_venue]
-        ]
-        
-        booking_table = Table(booking_info, colWidths=[2*inch, 4*inch])
-        booking_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), light_gray),
-            ('TEXTCOLOR', (0, 0), (0, -1), secondary_gray),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (1, 0), (1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, primary_blue),
-            ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, light_gray])
-        ]))
-        
-        story.append(booking_table)
-        story.append(Spacer(1, 30))
-        
-        print(f"Generating {len(booking.tickets)} tickets")
-        
-        # Generate tickets
-        for i, ticket in enumerate(booking.tickets):
-            print(f"Creating ticket {i+1}/{len(booking.tickets)}: {ticket.ticket_reference}")
-            
-            # Create ticket-like design
-            ticket_data = create_ticket_design(ticket, booking, concert_name, concert_date, concert_venue, logo_data, i+1, len(booking.tickets))
-            
-            # Wrap ticket elements in KeepTogether to prevent page breaks within a ticket
-            story.append(KeepTogether(ticket_data))
-            
-            # Add page break after each ticket (except the last one) to ensure each ticket starts on a new page
-            if i < len(booking.tickets) - 1:
-                story.append(PageBreak())
-        
-        print("Building PDF document")
-        doc.build(story)
-        buffer.seek(0)
-        
+        layout = get_ticket_layout(concert_name, concert_date, concert_venue)
+
+        buffer = io.BytesIO()
+        c = pdf_canvas.Canvas(buffer, pagesize=A4)
+        c.setTitle(f"{concert_name} - {booking.booking_reference}")
+        begin_tickets_document(c, layout)
+        draw_booking_tickets(c, booking, layout, concert_venue)
+        c.save()
+
         pdf_data = buffer.getvalue()
-        print(f"PDF generated successfully, size: {len(pdf_data)} bytes")
-        
+        print(f"PDF generated for booking {booking.booking_reference}: {len(booking.tickets)} tickets, {len(pdf_data)} bytes")
         return pdf_data
-        
+
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         import traceback
         traceback.print_exc()
         raise e
-
-def create_ticket_design(ticket, booking, concert_name, concert_date, concert_venue, logo_data, ticket_num, total_tickets):
-    """Create a single ticket design"""
-    from reportlab.lib.units import inch
-    from reportlab.platypus import Table, TableStyle, Spacer
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT
-    from reportlab.lib.styles import ParagraphStyle
-    from reportlab.platypus import Paragraph, Image
-    import io
-    import base64
-    
-    # Generate QR code with logo
-    qr_code_data = generate_ticket_qr_code(ticket, logo_data)
-    qr_buffer = io.BytesIO(base64.b64decode(qr_code_data))
-    
-    # Ticket dimensions
-    ticket_width = 6*inch
-    ticket_height = 3*inch
-    
-    # Create ticket table structure
-    ticket_type = 'Ordinarie' if ticket.ticket_type == 'normal' else 'Student'
-    
-    # Main ticket content
-    ticket_content = [
-        # Header row
-        [
-            Paragraph(f"<b><font color='#1e40af'>{concert_name}</font></b>", 
-                     ParagraphStyle('TicketTitle', fontSize=16, alignment=TA_CENTER, fontName='Helvetica-Bold')),
-            "",
-            Paragraph(f"<b><font color='#1e40af'>BILJETT {ticket_num}/{total_tickets}</font></b>", 
-                     ParagraphStyle('TicketNumber', fontSize=12, alignment=TA_CENTER, fontName='Helvetica-Bold'))
-        ],
-        # Date and venue row
-        [
-            Paragraph(f"<font color='#374151'>{concert_date}</font>", 
-                     ParagraphStyle('TicketDate', fontSize=12, alignment=TA_LEFT, fontName='Helvetica')),
-            "",
-            Paragraph(f"<font color='#374151'>{concert_venue}</font>", 
-                     ParagraphStyle('TicketVenue', fontSize=10, alignment=TA_CENTER, fontName='Helvetica'))
-        ],
-        # Time and type row
-        [
-            Paragraph(f"<b><font color='#059669'>{booking.show.start_time}-{booking.show.end_time}</font></b>", 
-                     ParagraphStyle('TicketTime', fontSize=14, alignment=TA_LEFT, fontName='Helvetica-Bold')),
-            "",
-            Paragraph(f"<b><font color='#1e40af'>{ticket_type}</font></b>", 
-                     ParagraphStyle('TicketType', fontSize=12, alignment=TA_CENTER, fontName='Helvetica-Bold'))
-        ],
-        # QR code and reference row
-        [
-            Image(qr_buffer, width=1.5*inch, height=1.5*inch),
-            "",
-            Paragraph(f"<font color='#6b7280' size='8'>{ticket.ticket_reference}</font>", 
-                     ParagraphStyle('TicketRef', fontSize=8, alignment=TA_CENTER, fontName='Helvetica'))
-        ]
-    ]
-    
-    # Create ticket table
-    ticket_table = Table(ticket_content, colWidths=[3*inch, 0.5*inch, 2.5*inch], rowHeights=[0.4*inch, 0.3*inch, 0.4*inch, 1.5*inch])
-    
-    # Style the ticket table
-    ticket_table.setStyle(TableStyle([
-        # Borders
-        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1e40af')),
-        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.HexColor('#1e40af')),
-        ('LINEBELOW', (0, 2), (-1, 2), 1, colors.HexColor('#1e40af')),
-        
-        # Background colors
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),  # Header background
-        ('BACKGROUND', (0, 1), (-1, 1), colors.white),
-        ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#f0f9ff')),  # Time row background
-        ('BACKGROUND', (0, 3), (-1, 3), colors.white),
-        
-        # Padding
-        ('PADDING', (0, 0), (-1, -1), 12),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        
-        # Perforated line effect (dashed border)
-        ('LINEBELOW', (0, 3), (-1, 3), 1, colors.HexColor('#d1d5db')),
-    ]))
-    
-    # Add perforated edge effect
-    perforated_style = TableStyle([
-        ('LINEABOVE', (0, 3), (-1, 3), 1, colors.HexColor('#d1d5db')),
-        ('LINEBELOW', (0, 3), (-1, 3), 1, colors.HexColor('#d1d5db')),
-    ])
-    
-    # Create ticket stub
-    stub_content = [
-        [
-            Paragraph(f"<font color='#6b7280' size='8'>KEEP THIS TICKET</font>", 
-                     ParagraphStyle('StubText', fontSize=8, alignment=TA_CENTER, fontName='Helvetica')),
-            "",
-            Paragraph(f"<font color='#6b7280' size='8'>{ticket.ticket_reference}</font>", 
-                     ParagraphStyle('StubRef', fontSize=8, alignment=TA_CENTER, fontName='Helvetica'))
-        ]
-    ]
-    
-    stub_table = Table(stub_content, colWidths=[3*inch, 0.5*inch, 2.5*inch], rowHeights=[0.3*inch])
-    stub_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f9fafb')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db')),
-        ('PADDING', (0, 0), (-1, -1), 8),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    
-    return [ticket_table, Spacer(1, 10), stub_table]
-
-def generate_ticket_qr_code(ticket, logo_data=None):
-    """Generate QR code for a specific ticket with optional logo"""
-    import qrcode
-    from PIL import Image as PILImage, ImageDraw
-    import io
-    import base64
-    import os
-    
-    # Create QR code with higher error correction for logo embedding
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(ticket.ticket_reference)
-    qr.make(fit=True)
-    
-    # Create QR code image
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Add logo if provided
-    if logo_data:
-        try:
-            # Open logo from BytesIO
-            logo = PILImage.open(logo_data)
-            
-            # Calculate logo size - smaller to avoid interfering with QR code
-            qr_size = qr_img.size[0]
-            logo_size = int(qr_size * 0.15)  # 15% of QR code size (smaller)
-            
-            # Resize logo maintaining aspect ratio
-            logo.thumbnail((logo_size, logo_size), PILImage.Resampling.LANCZOS)
-            
-            # Convert logo to RGBA if it isn't already
-            if logo.mode != 'RGBA':
-                logo = logo.convert('RGBA')
-            
-            # Create a semi-transparent white background for better visibility
-            logo_bg_size = logo_size + 8  # Add small padding
-            logo_bg = PILImage.new('RGBA', (logo_bg_size, logo_bg_size), (255, 255, 255, 200))  # Semi-transparent white
-            
-            # Create rounded rectangle mask for the background
-            mask = PILImage.new('L', (logo_bg_size, logo_bg_size), 0)
-            draw = ImageDraw.Draw(mask)
-            draw.rounded_rectangle([0, 0, logo_bg_size, logo_bg_size], radius=4, fill=255)
-            
-            # Apply mask to create rounded background
-            logo_bg.putalpha(mask)
-            
-            # Paste logo on semi-transparent background
-            logo_x = (logo_bg_size - logo_size) // 2
-            logo_y = (logo_bg_size - logo_size) // 2
-            
-            # Composite logo onto background preserving colors
-            logo_bg.paste(logo, (logo_x, logo_y), logo)
-            
-            # Calculate position to center logo in QR code
-            qr_width, qr_height = qr_img.size
-            logo_width, logo_height = logo_bg.size
-            
-            x = (qr_width - logo_width) // 2
-            y = (qr_height - logo_height) // 2
-            
-            # Convert QR code to RGBA for alpha blending
-            qr_img = qr_img.convert('RGBA')
-            
-            # Paste logo onto QR code with alpha blending
-            qr_img.paste(logo_bg, (x, y), logo_bg)
-            
-            # Convert back to RGB for final output
-            qr_img = qr_img.convert('RGB')
-            
-        except Exception as e:
-            print(f"Error adding logo to QR code: {e}")
-            # Continue without logo if there's an error
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format='PNG')
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return img_base64
\ No newline at end of file
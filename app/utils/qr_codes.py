@@ -0,0 +1,106 @@
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+import qrcode
+from flask import current_app
+from app.utils.logo_assets import current_logo_digest, get_logo_overlay
+
+# Rendered ticket QR PNGs kept per worker, keyed by (ticket_reference, logo digest, box size)
+QR_MEMORY_CACHE_SIZE = 512
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+def _cache_dir():
+    """Directory for rendered QR codes shared by all workers"""
+    path = current_app.config.get('QR_CACHE_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'qr_cache')
+    return path
+
+def _cache_path(key):
+    ticket_reference, digest, box_size = key
+    safe_reference = ''.join(c for c in ticket_reference if c.isalnum() or c == '-')
+    return os.path.join(_cache_dir(), f"{safe_reference}-{digest}-{box_size}.png")
+
+def _remember(key, png):
+    with _memory_lock:
+        _memory_cache[key] = png
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > QR_MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def _read_disk(key):
+    try:
+        with open(_cache_path(key), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_disk(key, png):
+    path = _cache_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to write QR cache file: {e}")
+
+def _render_ticket_qr(ticket_reference, digest, box_size):
+    """Render a ticket QR code with optional logo to PNG bytes"""
+    # Create QR code with higher error correction for logo embedding
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction
+        box_size=box_size,
+        border=4,
+    )
+    qr.add_data(ticket_reference)
+    qr.make(fit=True)
+
+    # Create QR code image
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+
+    # Add logo if configured - the overlay is prepared once per logo version
+    if digest:
+        try:
+            qr_size = qr_img.size[0]
+            overlay = get_logo_overlay(digest, qr_size)
+            if overlay is not None:
+                x = (qr_size - overlay.size[0]) // 2
+                y = (qr_img.size[1] - overlay.size[1]) // 2
+                qr_img.paste(overlay, (x, y), overlay)
+        except Exception as e:
+            print(f"Error adding logo to QR code: {e}")
+            # Continue without logo if there's an error
+
+    buffer = io.BytesIO()
+    qr_img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def render_ticket_qr_png(ticket_reference, box_size=10, with_logo=True):
+    """Ticket QR code as PNG bytes, served from memory or disk cache when possible"""
+    digest = current_logo_digest() if with_logo else None
+    key = (ticket_reference, digest or 'nologo', box_size)
+
+    with _memory_lock:
+        png = _memory_cache.get(key)
+        if png is not None:
+            _memory_cache.move_to_end(key)
+            return png
+
+    png = _read_disk(key)
+    if png is None:
+        png = _render_ticket_qr(ticket_reference, digest, box_size)
+        _write_disk(key, png)
+
+    _remember(key, png)
+    return png
+
+def generate_ticket_qr_code(ticket):
+    """Generate QR code for a specific ticket with the configured logo, as a base64 PNG string"""
+    png = render_ticket_qr_png(ticket.ticket_reference)
+    return base64.b64encode(png).decode()
@@ -0,0 +1,109 @@
+import time
+from sqlalchemy.orm.util import identity_key
+from app.models import Show, Booking, db
+
+# How long an availability snapshot may be served without asking the database
+AVAILABILITY_TTL = 1.0
+
+# show_id -> (expires_at, snapshot), local to this worker; key None holds the all-shows list
+_availability_cache = {}
+
+def _expire_show(show_id):
+    """Make a loaded Show pick up a counter changed behind the ORM's back"""
+    _availability_cache.pop(show_id, None)
+    _availability_cache.pop(None, None)
+    show = db.session.identity_map.get(identity_key(Show, show_id))
+    if show is not None:
+        db.session.expire(show, ['available_tickets'])
+
+def reserve_tickets(show_id, count):
+    """Atomically take count tickets from a show, returns False if not enough are left"""
+    # Single conditional UPDATE in the caller's transaction: no read-then-write race,
+    # and a rollback of the caller also gives the tickets back
+    if count <= 0:
+        return True
+
+    result = db.session.execute(
+        db.update(Show)
+        .where(Show.id == show_id, Show.available_tickets >= count)
+        .values(available_tickets=Show.available_tickets - count)
+        .execution_options(synchronize_session=False)
+    )
+    _expire_show(show_id)
+    return result.rowcount == 1
+
+def release_tickets(show_id, count):
+    """Return count tickets to a show (booking or ticket deleted), capped at total_tickets"""
+    if count <= 0:
+        return
+
+    released = Show.available_tickets + count
+    db.session.execute(
+        db.update(Show)
+        .where(Show.id == show_id)
+        .values(available_tickets=db.case(
+            (released > Show.total_tickets, Show.total_tickets),
+            else_=released
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    _expire_show(show_id)
+
+def count_held_tickets(show_id):
+    """Number of tickets held by bookings for a show, reserved or confirmed"""
+    return db.session.query(
+        db.func.coalesce(db.func.sum(Booking.adult_tickets + Booking.student_tickets), 0)
+    ).filter(Booking.show_id == show_id).scalar()
+
+def recalculate_availability(show):
+    """Rebuild the available_tickets counter from bookings (repair tool, not for hot paths)"""
+    show.available_tickets = max(0, show.total_tickets - count_held_tickets(show.id))
+    return show.available_tickets
+
+def get_availability(show_id):
+    """Read-only availability snapshot for a show (None if it doesn't exist), cached briefly"""
+    now = time.monotonic()
+    cached = _availability_cache.get(show_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    row = db.session.query(Show.available_tickets).filter(Show.id == show_id).first()
+    if row is None:
+        return None
+
+    available = max(0, row.available_tickets or 0)
+    snapshot = {
+        'show_id': show_id,
+        'available': available,
+        'sold_out': available <= 0
+    }
+    _availability_cache[show_id] = (now + AVAILABILITY_TTL, snapshot)
+    return snapshot
+
+def get_all_availability():
+    """Availability snapshots for every show in one query, cached like get_availability"""
+    now = time.monotonic()
+    cached = _availability_cache.get(None)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    rows = db.session.query(
+        Show.id, Show.start_time, Show.end_time, Show.total_tickets, Show.available_tickets
+    ).order_by(Show.start_time).all()
+
+    snapshots = []
+    for row in rows:
+        available = max(0, row.available_tickets or 0)
+        snapshot = {
+            'show_id': row.id,
+            'time': f"{row.start_time}-{row.end_time}",
+            'capacity': row.total_tickets,
+            'available': available,
+            'sold_out': available <= 0
+        }
+        snapshots.append(snapshot)
+        # Per-show lookups can reuse the same snapshot
+        _availability_cache[row.id] = (now + AVAILABILITY_TTL, snapshot)
+
+    _availability_cache[None] = (now + AVAILABILITY_TTL, snapshots)
+    return snapshots
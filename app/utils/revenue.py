@@ -0,0 +1,134 @@
+from collections import defaultdict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, contains_eager
+from app.models import Booking, Show, ShowRevenue, db
+
+ROLLUP_COLUMNS = (
+    'confirmed_revenue', 'potential_revenue', 'confirmed_bookings', 'reserved_bookings',
+    'adult_tickets_sold', 'student_tickets_sold', 'total_tickets'
+)
+
+# Booking attributes the rollup depends on
+TRACKED_ATTRIBUTES = ('show_id', 'status', 'total_amount', 'adult_tickets', 'student_tickets')
+
+def _contribution(show_id, status, total_amount, adult_tickets, student_tickets):
+    """What one booking adds to its show's rollup row"""
+    confirmed = status == 'confirmed'
+    adult_tickets = adult_tickets or 0
+    student_tickets = student_tickets or 0
+    return show_id, {
+        'confirmed_revenue': (total_amount or 0) if confirmed else 0,
+        'potential_revenue': 0 if confirmed else (total_amount or 0),
+        'confirmed_bookings': 1 if confirmed else 0,
+        'reserved_bookings': 0 if confirmed else 1,
+        'adult_tickets_sold': adult_tickets if confirmed else 0,
+        'student_tickets_sold': student_tickets if confirmed else 0,
+        'total_tickets': adult_tickets + student_tickets,
+    }
+
+def _current(booking):
+    show_id = booking.show_id if booking.show_id is not None else (booking.show.id if booking.show else None)
+    return _contribution(show_id, booking.status or 'reserved', booking.total_amount,
+                         booking.adult_tickets, booking.student_tickets)
+
+def _previous(booking):
+    """Contribution as last written to the database (before this flush's changes)"""
+    state = inspect(booking)
+    values = []
+    for name in TRACKED_ATTRIBUTES:
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(booking, name))
+    return _contribution(*values)
+
+def _add(deltas, contribution, sign):
+    show_id, values = contribution
+    if show_id is None:
+        return
+    for column, value in values.items():
+        deltas[show_id][column] += sign * value
+
+def _changed(booking):
+    state = inspect(booking)
+    return any(state.attrs[name].history.has_changes() for name in TRACKED_ATTRIBUTES)
+
+def _update_rollup(session, flush_context):
+    """Apply the flush's booking changes to show_revenue, in the same transaction"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    new_shows = []
+    deleted_shows = set()
+
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            _add(deltas, _current(obj), 1)
+        elif isinstance(obj, Show):
+            new_shows.append(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and _changed(obj):
+            _add(deltas, _previous(obj), -1)
+            _add(deltas, _current(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            _add(deltas, _previous(obj), -1)
+        elif isinstance(obj, Show):
+            deleted_shows.add(obj.id)
+
+    if not (deltas or new_shows or deleted_shows):
+        return
+
+    # Connection-level statements: running them through the session would start another flush
+    connection = session.connection()
+    for show_id in new_shows:
+        connection.execute(db.insert(ShowRevenue).values(show_id=show_id))
+    for show_id, values in deltas.items():
+        values = {column: value for column, value in values.items() if value}
+        if show_id in deleted_shows or not values:
+            continue
+        table = ShowRevenue.__table__
+        result = connection.execute(
+            table.update().where(table.c.show_id == show_id)
+            .values({column: table.c[column] + value for column, value in values.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(show_id=show_id, **values))
+    for show_id in deleted_shows:
+        connection.execute(ShowRevenue.__table__.delete().where(ShowRevenue.__table__.c.show_id == show_id))
+
+def register_revenue_rollup():
+    """Keep show_revenue in step with bookings for every session flush"""
+    if not event.contains(Session, 'after_flush', _update_rollup):
+        event.listen(Session, 'after_flush', _update_rollup)
+
+def rebuild_revenue_rollup():
+    """Recompute show_revenue from the bookings (after bulk imports that bypass the ORM)"""
+    confirmed = Booking.status == 'confirmed'
+    rows = db.session.query(
+        Show.id,
+        db.func.coalesce(db.func.sum(db.case((confirmed, Booking.total_amount), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((confirmed, 0), else_=Booking.total_amount)), 0),
+        db.func.count(db.case((confirmed, Booking.id))),
+        db.func.count(db.case((~confirmed, Booking.id))),
+        db.func.coalesce(db.func.sum(db.case((confirmed, Booking.adult_tickets), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((confirmed, Booking.student_tickets), else_=0)), 0),
+        db.func.coalesce(db.func.sum(Booking.adult_tickets + Booking.student_tickets), 0),
+    ).outerjoin(Booking, Booking.show_id == Show.id).group_by(Show.id).all()
+
+    db.session.execute(db.delete(ShowRevenue))
+    if rows:
+        db.session.execute(db.insert(ShowRevenue), [dict(zip(('show_id',) + ROLLUP_COLUMNS, row)) for row in rows])
+    db.session.commit()
+
+def revenue_summary():
+    """Per-show rollup rows plus event totals, read from show_revenue in O(shows)"""
+    rows = ShowRevenue.query.join(Show).options(contains_eager(ShowRevenue.show)).order_by(Show.start_time).all()
+    shows = [
+        dict(show_id=row.show_id, show_time=f"{row.show.start_time}-{row.show.end_time}",
+             **{column: getattr(row, column) for column in ROLLUP_COLUMNS})
+        for row in rows
+    ]
+    totals = {column: sum(show[column] for show in shows) for column in ROLLUP_COLUMNS}
+    return {'shows': shows, 'totals': totals}
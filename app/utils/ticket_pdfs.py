@@ -0,0 +1,66 @@
+import glob
+import hashlib
+import os
+from flask import current_app
+from app.models import Settings
+from app.utils.logo_assets import current_logo_digest
+from app.utils.pdf_tickets import generate_tickets_pdf
+
+# Bump when the ticket PDF layout changes so stored PDFs are rendered again
+TICKET_PDF_LAYOUT_VERSION = 1
+
+def _pdf_dir():
+    """Directory for stored ticket PDFs shared by all workers"""
+    path = current_app.config.get('TICKET_PDF_DIR')
+    if not path:
+        path = os.path.join(current_app.instance_path, 'ticket_pdfs')
+    return path
+
+def tickets_pdf_version(booking):
+    """Hash of everything printed on a booking's ticket PDF"""
+    parts = [
+        TICKET_PDF_LAYOUT_VERSION,
+        booking.booking_reference, booking.first_name, booking.last_name, booking.email, booking.phone,
+        booking.show.start_time, booking.show.end_time,
+        Settings.get_value('concert_name', 'Klasskonsert 24C'),
+        Settings.get_value('concert_date', '29/1 2026'),
+        Settings.get_value('concert_venue', 'Aulan på Rytmus Stockholm'),
+        current_logo_digest() or 'nologo',
+    ]
+    parts.extend(f"{ticket.ticket_reference}:{ticket.ticket_type}" for ticket in booking.tickets)
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+def _pdf_path(booking, version):
+    return os.path.join(_pdf_dir(), f"{booking.id}-{version}.pdf")
+
+def invalidate_tickets_pdf(booking_id, keep=None):
+    """Remove stored PDFs of a booking (except the path in keep)"""
+    for path in glob.glob(os.path.join(_pdf_dir(), f"{booking_id}-*.pdf")):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def store_tickets_pdf(booking):
+    """Render a booking's ticket PDF and store it under its content version; returns the bytes"""
+    path = _pdf_path(booking, tickets_pdf_version(booking))
+    pdf_data = generate_tickets_pdf(booking)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_data)
+    os.replace(tmp_path, path)
+
+    # Older versions of this booking's PDF can't be served any more
+    invalidate_tickets_pdf(booking.id, keep=path)
+    return pdf_data
+
+def get_tickets_pdf(booking):
+    """Stored ticket PDF for the booking's current content, rendered only if missing"""
+    try:
+        with open(_pdf_path(booking, tickets_pdf_version(booking)), 'rb') as f:
+            return f.read()
+    except OSError:
+        return store_tickets_pdf(booking)
@@ -1,93 +1,89 @@
-from app.models import Ticket, Buyer, Booking, db
-from app.utils.audit import log_ticket_generated, log_ticket_used, log_ticket_state_change
+from app.models import Ticket, Buyer, Booking, db, upsert
+from app.utils.audit import log_payment_confirmed, log_tickets_generated, log_ticket_deleted, log_ticket_used, log_ticket_state_change, log_tickets_used
+from app.utils.checkins import publish_checkin
+from app.utils.reservations import release_tickets
+from app.utils.ticket_pdfs import store_tickets_pdf, invalidate_tickets_pdf
 from datetime import datetime
+from sqlalchemy.orm import aliased
 
-def create_or_update_buyer(booking):
-    """Create or update buyer record from booking"""
-    buyer = Buyer.query.filter_by(phone=booking.phone).first()
-    
-    if buyer:
-        # Update existing buyer
-        buyer.first_name = booking.first_name
-        buyer.last_name = booking.last_name
-        buyer.email = booking.email
-        buyer.updated_at = datetime.utcnow()
-    else:
-        # Create new buyer
-        buyer = Buyer(
-            phone=booking.phone,
-            first_name=booking.first_name,
-            last_name=booking.last_name,
-            email=booking.email
-        )
-        db.session.add(buyer)
-    
-    db.session.commit()
-    return buyer
+def upsert_buyers(bookings):
+    """Create or update the buyers of bookings with one INSERT ... ON CONFLICT(phone); returns {phone: buyer_id}"""
+    now = datetime.utcnow()
+    # One row per phone number; the last booking's contact details win, as they would one at a time
+    rows = {
+        booking.phone: dict(phone=booking.phone, first_name=booking.first_name, last_name=booking.last_name,
+                            email=booking.email, created_at=now, updated_at=now)
+        for booking in bookings
+    }
+    stmt = upsert(Buyer)
+    stmt = stmt.on_conflict_do_update(index_elements=['phone'], set_={
+        'first_name': stmt.excluded.first_name,
+        'last_name': stmt.excluded.last_name,
+        'email': stmt.excluded.email,
+        'updated_at': stmt.excluded.updated_at,
+    }).returning(Buyer.phone, Buyer.id)
+    return dict(db.session.execute(stmt, list(rows.values())).all())
 
-def generate_tickets_for_booking(booking):
-    """Generate individual tickets for a confirmed booking"""
-    if booking.status != 'confirmed':
-        raise ValueError("Can only generate tickets for confirmed bookings")
-    
-    # Create or update buyer
-    buyer = create_or_update_buyer(booking)
-    
-    tickets = []
-    ticket_number = 1
-    
-    # Generate normal tickets
-    for i in range(booking.adult_tickets):
-        ticket_ref = Ticket.generate_ticket_reference(
-            booking.booking_reference, 
-            "normal", 
-            ticket_number
-        )
-        
-        ticket = Ticket(
-            ticket_reference=ticket_ref,
-            booking_id=booking.id,
-            show_id=booking.show_id,
-            buyer_id=buyer.id,
-            ticket_type="normal",
-            ticket_number=ticket_number
-        )
-        
-        db.session.add(ticket)
-        tickets.append(ticket)
-        
-        ticket_number += 1
-    
-    # Generate student tickets
-    for i in range(booking.student_tickets):
-        ticket_ref = Ticket.generate_ticket_reference(
-            booking.booking_reference, 
-            "student", 
-            ticket_number
-        )
-        
-        ticket = Ticket(
-            ticket_reference=ticket_ref,
-            booking_id=booking.id,
-            show_id=booking.show_id,
-            buyer_id=buyer.id,
-            ticket_type="student",
-            ticket_number=ticket_number
-        )
-        
-        db.session.add(ticket)
-        tickets.append(ticket)
-        
-        ticket_number += 1
-    
-    db.session.commit()
-    
-    # Log ticket generation after commit (when tickets have IDs)
-    for ticket in tickets:
-        log_ticket_generated(ticket, booking)
-    
+def insert_tickets(bookings, buyer_ids):
+    """Insert the tickets of confirmed bookings with one executemany; returns them as dicts with ids"""
+    rows = []
+    for booking in bookings:
+        ticket_number = 1
+        for ticket_type, count in (('normal', booking.adult_tickets), ('student', booking.student_tickets)):
+            for _ in range(count or 0):
+                rows.append(dict(
+                    ticket_reference=Ticket.generate_ticket_reference(booking.booking_reference, ticket_type, ticket_number),
+                    booking_id=booking.id,
+                    show_id=booking.show_id,
+                    buyer_id=buyer_ids[booking.phone],
+                    ticket_type=ticket_type,
+                    ticket_number=ticket_number
+                ))
+                ticket_number += 1
+    if not rows:
+        return []
+    
+    ids = dict(db.session.execute(db.insert(Ticket).returning(Ticket.ticket_reference, Ticket.id), rows).all())
+    return [dict(row, id=ids[row['ticket_reference']]) for row in rows]
+
+def _create_tickets(bookings):
+    """Buyers, tickets and ticket_generated audit events for confirmed bookings, without committing"""
+    tickets = insert_tickets(bookings, upsert_buyers(bookings))
+    references = {booking.id: booking.booking_reference for booking in bookings}
+    log_tickets_generated([
+        (ticket['id'], {
+            'ticket_reference': ticket['ticket_reference'],
+            'ticket_type': ticket['ticket_type'],
+            'booking_reference': references[ticket['booking_id']]
+        })
+        for ticket in tickets
+    ])
     return tickets
 
+def confirm_bookings(bookings, admin_user):
+    """Confirm payment for bookings: status, buyers, tickets and audit events in the caller's transaction
+
+    Bookings that are already confirmed are skipped. The caller commits (or rolls back); returns the new tickets.
+    """
+    bookings = [booking for booking in bookings if booking.status != 'confirmed']
+    if not bookings:
+        return []
+    
+    now = datetime.utcnow()
+    for booking in bookings:
+        booking.status = 'confirmed'
+        booking.confirmed_at = now
+        log_payment_confirmed(booking, admin_user)
+    return _create_tickets(bookings)
+
+def store_booking_pdfs(bookings):
+    """Render each booking's ticket PDF once now, so emails and resends only read the stored file"""
+    for booking in bookings:
+        try:
+            store_tickets_pdf(booking)
+        except Exception as e:
+            print(f"Error pre-rendering ticket PDF for booking {booking.booking_reference}: {e}")
+
 def delete_ticket(ticket, admin_user, reason=None):
     """Delete a ticket and update counts"""
     if ticket.is_used:
@@ -105,13 +101,16 @@ def delete_ticket(ticket, admin_user, reason=None):
     
     booking.total_amount = (booking.adult_tickets * 200) + (booking.student_tickets * 100)
     
-    # Update show availability
-    booking.show.update_availability()
+    # Give the seat back to the show
+    release_tickets(booking.show_id, 1)
     
     # Remove the ticket
     db.session.delete(ticket)
     db.session.commit()
     
+    # The stored PDF still contains the deleted ticket
+    invalidate_tickets_pdf(booking.id)
+    
     return True
 
 def get_tickets_for_booking(booking):
@@ -131,13 +130,76 @@ def mark_ticket_as_used(ticket, checker_user):
     ticket.used_at = datetime.utcnow()
     ticket.checked_by = checker_user
     
-    db.session.commit()
-    
     # Log the usage
     log_ticket_used(ticket, checker_user)
     
+    db.session.commit()
+    
     return True
 
+def validate_ticket_scan(ticket_reference, show_id, checker_user):
+    """Check a scanned ticket and mark it used if it may enter; returns the verdict as a dict
+
+    An accepted scan is one UPDATE ... FROM booking ... RETURNING that only matches an unused ticket
+    of a confirmed booking for this show, so two scanners can never both let the same ticket in.
+    Only a rejected scan reads the ticket to tell the door why.
+    """
+    used_at = datetime.now()
+    # SQLite's RETURNING can't name the FROM table, so the reference comes from a subquery
+    owner = aliased(Booking)
+    booking_reference = db.select(owner.booking_reference).where(owner.id == Ticket.booking_id).scalar_subquery()
+    name = db.select(owner.first_name + ' ' + owner.last_name).where(owner.id == Ticket.booking_id).scalar_subquery()
+    row = db.session.execute(
+        db.update(Ticket)
+        .where(
+            Ticket.ticket_reference == ticket_reference,
+            Ticket.is_used == False,
+            Ticket.booking_id == Booking.id,
+            Booking.status == 'confirmed',
+            Booking.show_id == show_id
+        )
+        .values(is_used=True, used_at=used_at, checked_by=checker_user)
+        .returning(Ticket.id, Ticket.ticket_type, booking_reference.label('booking_reference'), name.label('name'))
+    ).first()
+    if row is None:
+        db.session.rollback()
+        return _rejected_scan(ticket_reference, show_id)
+
+    log_tickets_used([(row.id, {
+        'ticket_reference': ticket_reference,
+        'booking_reference': row.booking_reference,
+        'used_at': used_at.isoformat()
+    })], checker_user)
+    db.session.commit()
+    publish_checkin(ticket_reference, show_id, row.ticket_type, row.booking_reference, row.name, used_at)
+
+    return {'valid': True, 'message': 'Biljett godkänd - välkommen in!', 'status': 'success',
+            'ticket_reference': ticket_reference,
+            'ticket_type': 'Ordinarie' if row.ticket_type == 'normal' else 'Student',
+            'booking_reference': row.booking_reference,
+            'used_at': used_at.isoformat()}
+
+def _rejected_scan(ticket_reference, show_id):
+    """Verdict for a scan the UPDATE did not accept: unknown, wrong show, used or unconfirmed"""
+    row = db.session.query(
+        Ticket.is_used, Ticket.used_at, Booking.show_id, Booking.status
+    ).join(Booking, Ticket.booking_id == Booking.id).filter(Ticket.ticket_reference == ticket_reference).first()
+
+    if row is None:
+        return {'valid': False, 'message': 'Biljett hittades inte', 'status': 'error',
+                'ticket_reference': ticket_reference}
+
+    if row.show_id != show_id:
+        return {'valid': False, 'message': 'Biljett för fel föreställning', 'status': 'wrong_show',
+                'ticket_reference': ticket_reference, 'ticket_show_id': row.show_id, 'validation_show_id': show_id}
+
+    if row.is_used:
+        return {'valid': False, 'message': 'Biljett redan använd', 'status': 'used',
+                'ticket_reference': ticket_reference, 'used_at': row.used_at.isoformat() if row.used_at else None}
+
+    return {'valid': False, 'message': 'Biljett inte bekräftad', 'status': 'unconfirmed',
+            'ticket_reference': ticket_reference, 'booking_status': row.status}
+
 def change_ticket_state(ticket, checker_user):
     """Toggle ticket state between used and unused"""
     if ticket.is_used:
@@ -153,9 +215,9 @@ def change_ticket_state(ticket, checker_user):
         ticket.checked_by = checker_user
         action = "marked_as_used"
     
-    db.session.commit()
-    
     # Log the state change
     log_ticket_state_change(ticket, checker_user, action)
     
+    db.session.commit()
+    
     return True
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for TicketBroker
+Runs against a throwaway SQLite database, never the real one
+
+Usage:
+    python benchmark.py settings     # Settings queries per request, uncached vs cached
+    python benchmark.py references [bookings] [processes]
+                                     # Insert bookings from several processes, check references are unique
+    python benchmark.py pdf [bookings] [tickets]
+                                     # Ticket PDF time and peak memory per booking
+    python benchmark.py mail [messages]
+                                     # SMTP sends, new connection per message vs pooled (needs aiosmtpd)
+    python benchmark.py tickets [max_tickets]
+                                     # Admin ticket list page time and queries as the ticket count grows
+    python benchmark.py dashboard [max_tickets]
+                                     # Admin dashboard page time and queries as the booking count grows
+    python benchmark.py audit [max_events]
+                                     # Admin audit log page time and queries as the audit log grows
+    python benchmark.py confirm [bookings]
+                                     # Confirming payments one booking at a time vs all selected at once
+"""
+
+import contextlib
+import io
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import multiprocessing
+
+def create_benchmark_app(workdir):
+    """Create an app bound to a fresh database inside workdir"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['SETTINGS_VERSION_FILE'] = os.path.join(workdir, 'settings.version')
+    os.environ['QR_CACHE_DIR'] = os.path.join(workdir, 'qr_cache')
+    os.environ['MEDIA_DIR'] = os.path.join(workdir, 'media')
+    os.environ['PDF_EXPORT_DIR'] = os.path.join(workdir, 'exports')
+    os.environ['TICKET_PDF_DIR'] = os.path.join(workdir, 'ticket_pdfs')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from app import create_app, db
+    app = create_app()
+    app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    app.config['SETTINGS_VERSION_FILE'] = os.environ['SETTINGS_VERSION_FILE']
+    app.config['QR_CACHE_DIR'] = os.environ['QR_CACHE_DIR']
+    app.config['MEDIA_DIR'] = os.environ['MEDIA_DIR']
+    app.config['PDF_EXPORT_DIR'] = os.environ['PDF_EXPORT_DIR']
+    app.config['TICKET_PDF_DIR'] = os.environ['TICKET_PDF_DIR']
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+def populate_defaults(app):
+    """Insert the shows and settings a fresh install would have"""
+    from app import db
+    from app.models import Show, Settings
+
+    with app.app_context():
+        db.session.add(Show(date='29/1 2026', start_time='17:45', end_time='18:45', total_tickets=100, available_tickets=100))
+        db.session.add(Show(date='29/1 2026', start_time='19:00', end_time='20:00', total_tickets=100, available_tickets=100))
+        db.session.commit()
+        for key, value in {
+            'concert_name': 'Klasskonsert 24C',
+            'concert_date': '29/1 2026',
+            'concert_venue': 'Aulan på Rytmus Stockholm',
+            'adult_price': '200',
+            'student_price': '100',
+            'swish_number': '012 345 67 89',
+            'swish_recipient_name': 'Event Organizer',
+            'contact_email': 'admin@example.com',
+        }.items():
+            Settings.set_value(key, value)
+
+class QueryCounter:
+    """Count SQL statements executed on the app's engine"""
+
+    def __init__(self, engine, match=None):
+        self.engine = engine
+        self.match = match
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.match is None or self.match in statement.lower():
+            self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+def benchmark_settings(app, requests_per_page=50):
+    """Compare Settings SELECTs per page render with and without the cache"""
+    from app import db
+    from app.models import Settings
+
+    def uncached_get_value(key, default=None):
+        setting = Settings.query.filter_by(key=key).first()
+        return setting.value if setting else default
+
+    pages = ['/', '/booking', '/contact', '/lost-tickets']
+    client = app.test_client()
+    cached_get_value = Settings.get_value
+    results = {}
+
+    for mode in ('uncached', 'cached'):
+        Settings.get_value = staticmethod(uncached_get_value) if mode == 'uncached' else cached_get_value
+        with app.app_context():
+            Settings.invalidate_cache()
+        try:
+            # Warm up once so the cached run measures the steady state
+            for page in pages:
+                client.get(page)
+
+            for page in pages:
+                with app.app_context():
+                    engine = db.engine
+                with QueryCounter(engine, match='from settings') as counter:
+                    start = time.perf_counter()
+                    for _ in range(requests_per_page):
+                        client.get(page)
+                    elapsed = time.perf_counter() - start
+                results.setdefault(page, {})[mode] = (counter.count / requests_per_page, elapsed / requests_per_page * 1000)
+        finally:
+            Settings.get_value = cached_get_value
+
+    print(f"{'Page':<16}{'Uncached q/req':>16}{'Cached q/req':>14}{'Uncached ms':>14}{'Cached ms':>12}")
+    for page, data in results.items():
+        print(f"{page:<16}{data['uncached'][0]:>16.1f}{data['cached'][0]:>14.1f}{data['uncached'][1]:>14.2f}{data['cached'][1]:>12.2f}")
+
+def _insert_bookings(workdir, count, results):
+    """Worker process for benchmark_references: insert count bookings, one transaction each
+
+    A booking is 4 statements: SAVEPOINT, INSERT, the show_revenue UPDATE and RELEASE. A reference
+    collision adds the failed INSERT, ROLLBACK TO SAVEPOINT and a new SAVEPOINT, so 7 with one retry.
+    """
+    app = create_benchmark_app(workdir)
+    from app import db
+    from app.models import Booking
+
+    max_statements = 0
+    total_statements = 0
+    with app.app_context():
+        engine = db.engine
+        for i in range(count):
+            booking = Booking(
+                show_id=1, first_name='Bench', last_name=str(i), email='bench@example.com',
+                phone='0700000000', adult_tickets=1, student_tickets=0, total_amount=200
+            )
+            with QueryCounter(engine) as counter:
+                booking.add_with_unique_reference()
+                db.session.commit()
+            max_statements = max(max_statements, counter.count)
+            total_statements += counter.count
+    results.put((count, total_statements, max_statements))
+
+def benchmark_references(workdir, bookings=100000, processes=4):
+    """Insert bookings concurrently and verify every booking reference is unique"""
+    from app import db
+    from app.models import Booking
+
+    # Switch the benchmark database to WAL so the writer processes don't starve each other
+    app = create_benchmark_app(workdir)
+    with app.app_context():
+        db.session.execute(db.text('PRAGMA journal_mode=WAL'))
+        db.session.commit()
+
+    per_process = bookings // processes
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_insert_bookings, args=(workdir, per_process, results))
+        for _ in range(processes)
+    ]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    stats = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        total = Booking.query.count()
+        distinct = db.session.query(db.func.count(db.distinct(Booking.booking_reference))).scalar()
+
+    inserted = sum(s[0] for s in stats)
+    print(f"Inserted bookings:       {inserted} from {processes} processes in {elapsed:.1f}s")
+    print(f"Rows / distinct refs:    {total} / {distinct}")
+    print(f"Statements per booking:  avg {sum(s[1] for s in stats) / inserted:.2f}, max {max(s[2] for s in stats)}")
+    print("Result:                  " + ("OK, no duplicates" if total == distinct == inserted else "FAILED"))
+
+def create_confirmed_bookings(app, count, tickets_per_booking):
+    """Insert bookings spread over the shows and confirm them, which generates their tickets"""
+    from app import db
+    from app.models import Booking, Show
+    from app.utils.tickets import confirm_bookings
+
+    with app.app_context():
+        show_ids = [show.id for show in Show.query.all()]
+        bookings = []
+        for i in range(count):
+            booking = Booking(
+                show_id=show_ids[i % len(show_ids)], first_name='Bench', last_name=str(i),
+                email=f'bench{i}@example.com', phone='0700000000', adult_tickets=tickets_per_booking,
+                student_tickets=0, total_amount=200 * tickets_per_booking, status='reserved'
+            )
+            booking.add_with_unique_reference()
+            bookings.append(booking)
+        confirm_bookings(bookings, 'benchmark')
+        db.session.commit()
+
+def benchmark_pdf(app, bookings=50, tickets_per_booking=4):
+    """Time and peak memory per booking PDF"""
+    from app.models import Booking
+    from app.utils.pdf_tickets import generate_tickets_pdf
+    from app.utils.qr_codes import render_ticket_qr_png
+
+    create_confirmed_bookings(app, bookings, tickets_per_booking)
+
+    with app.app_context():
+        all_bookings = Booking.query.all()
+        # Measure rendering, not QR generation: warm the QR cache first
+        for booking in all_bookings:
+            for ticket in booking.tickets:
+                render_ticket_qr_png(ticket.ticket_reference)
+
+        print(f"{bookings} bookings x {tickets_per_booking} tickets")
+        print(f"{'ms/booking':>12}{'Peak KiB':>10}{'KiB/PDF':>10}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_tickets_pdf(all_bookings[0])
+
+            start = time.perf_counter()
+            sizes = [len(generate_tickets_pdf(booking)) for booking in all_bookings]
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            generate_tickets_pdf(all_bookings[0])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(f"{elapsed / bookings * 1000:>12.2f}{peak / 1024:>10.0f}{sum(sizes) / len(sizes) / 1024:>10.1f}")
+
+def benchmark_mail(app, messages=200, handshake_delay=0.05):
+    """Send to a local aiosmtpd server with a new connection per message and with the pooled one"""
+    try:
+        import asyncio
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        print("aiosmtpd is not installed: pip install aiosmtpd")
+        return
+
+    class CountingHandler:
+        def __init__(self):
+            self.connections = 0
+            self.messages = 0
+
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            # Stand-in for the STARTTLS and AUTH round trips a real server needs
+            self.connections += 1
+            await asyncio.sleep(handshake_delay)
+            session.host_name = hostname
+            return responses
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages += 1
+            return '250 Message accepted for delivery'
+
+    from flask_mail import Message
+    from app import mail
+    from app.utils.mail_pool import send_message, close_connection
+
+    # Pick a free local port for the stand-in server
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        app.config.update(
+            MAIL_SERVER='127.0.0.1', MAIL_PORT=port,
+            MAIL_USE_TLS=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+            MAIL_SUPPRESS_SEND=False, MAIL_RATE_PER_MINUTE=0, MAIL_RATE_PER_DAY=0
+        )
+        mail.init_app(app)
+
+        print(f"{'Mode':<12}{'Messages':>10}{'Connections':>13}{'Total s':>10}{'ms/msg':>10}")
+        for mode, send in (('per-message', mail.send), ('pooled', send_message)):
+            handler.connections = 0
+            handler.messages = 0
+            with app.app_context():
+                start = time.perf_counter()
+                for i in range(messages):
+                    send(Message(subject=f'Benchmark {i}', recipients=['buyer@example.com'],
+                                 sender='admin@example.com', body='Hej!'))
+                elapsed = time.perf_counter() - start
+                close_connection()
+            print(f"{mode:<12}{handler.messages:>10}{handler.connections:>13}{elapsed:>10.2f}{elapsed / messages * 1000:>10.2f}")
+    finally:
+        controller.stop()
+
+def insert_bulk_tickets(app, start, count, tickets_per_booking=4):
+    """Insert confirmed bookings, buyers and tickets with bulk INSERTs (no PDFs, no audit)"""
+    from app import db
+    from app.models import Booking, Buyer, Show, Ticket
+    from app.utils.revenue import rebuild_revenue_rollup
+
+    with app.app_context():
+        show_ids = [show.id for show in Show.query.all()]
+        bookings = count // tickets_per_booking
+        first = start // tickets_per_booking
+        db.session.execute(db.insert(Booking), [
+            dict(show_id=show_ids[i % len(show_ids)], booking_reference=f'B{i:07d}', first_name='Bench',
+                 last_name=f'Person{i}', email=f'bench{i}@example.com', phone=f'07{i:08d}',
+                 adult_tickets=tickets_per_booking, student_tickets=0,
+                 total_amount=200 * tickets_per_booking, status='confirmed')
+            for i in range(first, first + bookings)
+        ])
+        db.session.execute(db.insert(Buyer), [
+            dict(phone=f'07{i:08d}', first_name='Bench', last_name=f'Person{i}', email=f'bench{i}@example.com')
+            for i in range(first, first + bookings)
+        ])
+        booking_rows = db.session.execute(
+            db.select(Booking.id, Booking.show_id, Booking.booking_reference, Buyer.id)
+            .join(Buyer, Buyer.phone == Booking.phone)
+            .where(Booking.booking_reference >= f'B{first:07d}')
+        ).all()
+        db.session.execute(db.insert(Ticket), [
+            dict(ticket_reference=f'{reference}-N{n:02d}', booking_id=booking_id, show_id=show_id,
+                 buyer_id=buyer_id, ticket_type='normal', ticket_number=n, is_used=(booking_id + n) % 3 == 0)
+            for booking_id, show_id, reference, buyer_id in booking_rows
+            for n in range(1, tickets_per_booking + 1)
+        ])
+        db.session.commit()
+
+        # Bulk INSERTs skip the ORM flush that maintains the revenue rollup
+        rebuild_revenue_rollup()
+
+def insert_bulk_audit_events(app, start, count):
+    """Insert door-scan style audit events with one bulk INSERT, then rebuild the filter facets"""
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models import AuditLog
+    from app.utils.audit import rebuild_audit_facets
+
+    actions = ('ticket_used', 'ticket_used', 'ticket_used', 'ticket_generated', 'payment_confirmed', 'booking_created')
+    first = datetime(2026, 1, 1)
+    with app.app_context():
+        db.session.execute(db.insert(AuditLog), [
+            dict(timestamp=first + timedelta(seconds=i), action_type=actions[i % len(actions)],
+                 entity_type='booking' if i % len(actions) >= 4 else 'ticket', entity_id=i,
+                 user_type='admin', user_identifier=f'door{i % 4}',
+                 details=f'{{"ticket_reference": "B{i:07d}-N01"}}')
+            for i in range(start, start + count)
+        ])
+        db.session.commit()
+        rebuild_audit_facets()
+
+def _time_admin_pages(app, max_tickets, pages_for, insert=insert_bulk_tickets):
+    """Grow the row count step by step (insert) and time the admin pages returned by pages_for(app)"""
+    from sqlalchemy import event
+    from app import db
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+    sizes = [size for size in (1000, 10000, 30000, 100000) if size <= max_tickets] or [max_tickets]
+    print(f"{'Rows':>8}  {'Page':<24}{'ms':>8}{'Queries':>9}")
+    inserted = 0
+    for size in sizes:
+        insert(app, inserted, size - inserted)
+        inserted = size
+        for name, url in pages_for(app):
+            client.get(url)
+            statements.clear()
+            start = time.perf_counter()
+            for _ in range(5):
+                response = client.get(url)
+            elapsed = (time.perf_counter() - start) / 5
+            assert response.status_code == 200, url
+            print(f"{size:>8}  {name:<24}{elapsed * 1000:>8.1f}{len(statements) // 5:>9}")
+
+def benchmark_tickets(app, max_tickets=30000):
+    """Time the admin ticket list (first page, filters, search, a deep page) at growing ticket counts"""
+    from app import db
+    from app.models import Ticket
+
+    def pages_for(app):
+        with app.app_context():
+            middle_id = db.session.query(db.func.min(Ticket.id)).scalar() + 50
+        return (
+            ('first page', '/admin/tickets'),
+            ('used only', '/admin/tickets?used=used'),
+            ('show + unused', '/admin/tickets?show_id=1&used=unused'),
+            ('search name prefix', '/admin/tickets?search=person12'),
+            ('search reference', '/admin/tickets?search=B00001'),
+            ('deep page', f'/admin/tickets?before={middle_id}'),
+        )
+
+    _time_admin_pages(app, max_tickets, pages_for)
+
+def benchmark_dashboard(app, max_tickets=30000):
+    """Time the admin dashboard (all bookings, unconfirmed filter, a later page) at growing ticket counts"""
+    def pages_for(app):
+        return (
+            ('dashboard', '/admin/'),
+            ('unconfirmed', '/admin/?unconfirmed=True'),
+            ('show 1 page 5', '/admin/?page_1=5'),
+        )
+
+    _time_admin_pages(app, max_tickets, pages_for)
+
+def benchmark_audit(app, max_events=30000):
+    """Time the admin audit log (first page, filters, a deep page) at growing event counts"""
+    from app import db
+    from app.models import AuditLog
+
+    def pages_for(app):
+        with app.app_context():
+            middle_id = db.session.query(db.func.min(AuditLog.id)).scalar() + 50
+        return (
+            ('first page', '/admin/audit'),
+            ('action filter', '/admin/audit?action=payment_confirmed'),
+            ('user + entity', '/admin/audit?user=door1&entity=ticket'),
+            ('deep page', f'/admin/audit?before={middle_id}'),
+        )
+
+    _time_admin_pages(app, max_events, pages_for, insert=insert_bulk_audit_events)
+
+def benchmark_confirm(app, bookings=50):
+    """Confirm reserved bookings one request each, then as many again in one bulk request"""
+    from sqlalchemy import event
+    from app import db
+    from app.models import Booking, Show
+    from app.utils.revenue import rebuild_revenue_rollup
+
+    app.config['WORKER_ENABLED'] = True  # Queue the emails, time only the confirmation
+    with app.app_context():
+        show_ids = [show.id for show in Show.query.all()]
+        db.session.execute(db.insert(Booking), [
+            dict(show_id=show_ids[i % len(show_ids)], booking_reference=f'C{i:07d}', first_name='Bench',
+                 last_name=f'Person{i}', email=f'bench{i}@example.com', phone=f'07{i % (bookings // 2 or 1):08d}',
+                 adult_tickets=2, student_tickets=1, total_amount=500, status='reserved')
+            for i in range(2 * bookings)
+        ])
+        db.session.commit()
+        rebuild_revenue_rollup()
+        ids = [booking_id for (booking_id,) in db.session.query(Booking.id).order_by(Booking.id).all()]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    statements = []
+    commits = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+        event.listen(db.engine, 'commit', lambda *args: commits.append(1))
+
+    def run(name, requests):
+        statements.clear()
+        commits.clear()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for url, data in requests:
+                assert client.post(url, data=data).status_code == 302, url
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24}{elapsed * 1000:>10.0f}{len(statements):>12}{len(commits):>9}")
+
+    print(f"Confirming {bookings} bookings (3 tickets each, emails queued; one at a time also renders each ticket PDF)")
+    print(f"{'':<24}{'ms':>10}{'Statements':>12}{'Commits':>9}")
+    run('one at a time', [(f'/admin/booking/{booking_id}/confirm-payment', None) for booking_id in ids[:bookings]])
+    run('selected at once', [('/admin/bookings/confirm-payments', {'booking_ids': [str(i) for i in ids[bookings:]]})])
+
+def main():
+    """Main benchmark function"""
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    command = sys.argv[1].lower()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_benchmark_app(workdir)
+        populate_defaults(app)
+
+        if command == 'settings':
+            benchmark_settings(app)
+        elif command == 'references':
+            bookings = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+            processes = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+            benchmark_references(workdir, bookings, processes)
+        elif command == 'pdf':
+            bookings = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+            tickets_per_booking = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+            benchmark_pdf(app, bookings, tickets_per_booking)
+        elif command == 'mail':
+            messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+            benchmark_mail(app, messages)
+        elif command == 'tickets':
+            max_tickets = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+            benchmark_tickets(app, max_tickets)
+        elif command == 'dashboard':
+            max_tickets = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+            benchmark_dashboard(app, max_tickets)
+        elif command == 'audit':
+            max_events = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+            benchmark_audit(app, max_events)
+        elif command == 'confirm':
+            bookings = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+            benchmark_confirm(app, bookings)
+        else:
+            print(f"Unknown command: {command}")
+            print(__doc__)
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,18 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ticketbroker.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Settings cache - workers reload settings when this file changes (defaults to instance/settings.version)
+    SETTINGS_VERSION_FILE = os.environ.get('SETTINGS_VERSION_FILE')
+    
+    # Rendered ticket QR codes shared by all workers (defaults to instance/qr_cache)
+    QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR')
+    
+    # Uploaded images and their variants, served from /media (defaults to instance/media)
+    MEDIA_DIR = os.environ.get('MEDIA_DIR')
+    
+    # Rendered ticket PDFs per booking, reused for resends (defaults to instance/ticket_pdfs)
+    TICKET_PDF_DIR = os.environ.get('TICKET_PDF_DIR')
+    
     # Email configuration
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
@@ -16,6 +28,35 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = None  # Will be set from database settings
     
+    # Pooled SMTP connection - NOOP check after this many idle seconds, and sending caps shared
+    # by all processes through the email_job table (Gmail allows 500 recipients a day on a personal account)
+    MAIL_KEEPALIVE = int(os.environ.get('MAIL_KEEPALIVE', 60))
+    MAIL_RATE_PER_MINUTE = int(os.environ.get('MAIL_RATE_PER_MINUTE', 20))
+    MAIL_RATE_PER_DAY = int(os.environ.get('MAIL_RATE_PER_DAY', 500))
+    
+    # Background worker - when enabled, worker.py sends queued emails and renders PDF exports;
+    # otherwise the web app does both itself (EMAIL_WORKER_ENABLED is the older name)
+    WORKER_ENABLED = os.environ.get('WORKER_ENABLED', os.environ.get('EMAIL_WORKER_ENABLED', 'false')).lower() == 'true'
+    EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+    
+    # Bulk PDF export - files go to PDF_EXPORT_DIR (defaults to instance/exports)
+    PDF_EXPORT_DIR = os.environ.get('PDF_EXPORT_DIR')
+    PDF_EXPORT_PROCESSES = int(os.environ.get('PDF_EXPORT_PROCESSES', min(4, os.cpu_count() or 1)))
+    PDF_EXPORT_TICKETS_PER_PART = int(os.environ.get('PDF_EXPORT_TICKETS_PER_PART', 250))
+    
+    # Audit log - when enabled, events are written by a background thread after the commit
+    AUDIT_ASYNC = os.environ.get('AUDIT_ASYNC', 'false').lower() == 'true'
+    
+    # Audit archive - events older than AUDIT_ARCHIVE_DAYS, or of shows that have ended, are moved
+    # out of the database into gzip JSONL segments in AUDIT_ARCHIVE_DIR (defaults to instance/audit_archive)
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR')
+    AUDIT_ARCHIVE_DAYS = int(os.environ.get('AUDIT_ARCHIVE_DAYS', 90))
+    AUDIT_ARCHIVE_SEGMENT_ROWS = int(os.environ.get('AUDIT_ARCHIVE_SEGMENT_ROWS', 5000))
+    
+    # Live check-in dashboard - each stream reconnects after CHECKIN_STREAM_SECONDS
+    CHECKIN_STREAM_SECONDS = int(os.environ.get('CHECKIN_STREAM_SECONDS', 300))
+    CHECKIN_RESYNC_SECONDS = int(os.environ.get('CHECKIN_RESYNC_SECONDS', 5))
+    
     # Admin configuration
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD')
     
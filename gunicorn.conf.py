@@ -7,7 +7,10 @@ backlog = 2048
 
 # Worker processes
 workers = 4
-worker_class = "sync"
+# Threads, so a live check-in stream (server-sent events) doesn't tie up a whole worker;
+# the in-process caches (QR codes, logo overlays, SMTP pool) are guarded by their own locks
+worker_class = "gthread"
+threads = 8
 worker_connections = 1000
 timeout = 30
 keepalive = 2
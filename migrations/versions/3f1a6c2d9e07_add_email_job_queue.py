@@ -0,0 +1,39 @@
+"""Add email job queue
+
+Revision ID: 3f1a6c2d9e07
+Revises: 8c97fbd4ba54
+Create Date: 2026-10-17 11:04:27.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a6c2d9e07'
+down_revision = '8c97fbd4ba54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_job_status_run_after', 'email_job', ['status', 'run_after'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_email_job_status_run_after', table_name='email_job')
+    op.drop_table('email_job')
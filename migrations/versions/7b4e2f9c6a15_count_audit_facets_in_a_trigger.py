@@ -0,0 +1,38 @@
+"""Count audit filter facets in an audit_log trigger
+
+Revision ID: 7b4e2f9c6a15
+Revises: f6a2d9c1e3b8
+Create Date: 2026-10-18 16:42:10.583127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b4e2f9c6a15'
+down_revision = 'f6a2d9c1e3b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite counts each new audit row into audit_facet inside the INSERT, so logging an event
+    # (e.g. an accepted ticket scan) takes no extra statement; other databases count in the app.
+    # Rebuilding audit_log in batch mode drops the trigger - recreate it after such a migration.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_count_facets AFTER INSERT ON audit_log
+        BEGIN
+            INSERT INTO audit_facet (facet, value, count) VALUES
+                ('action', NEW.action_type, 1), ('entity', NEW.entity_type, 1), ('user', NEW.user_identifier, 1)
+            ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;
+        END
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS audit_log_count_facets")
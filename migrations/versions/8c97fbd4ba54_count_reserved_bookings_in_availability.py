@@ -0,0 +1,35 @@
+"""Count reserved bookings in show availability
+
+Revision ID: 8c97fbd4ba54
+Revises: 45d55bfc4c70
+Create Date: 2026-10-17 09:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c97fbd4ba54'
+down_revision = '45d55bfc4c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tickets are now taken from the show when a booking is made, not when it is confirmed
+    op.execute("""
+        UPDATE show SET available_tickets = CASE
+            WHEN total_tickets - COALESCE((SELECT SUM(adult_tickets + student_tickets) FROM booking WHERE booking.show_id = show.id), 0) < 0 THEN 0
+            ELSE total_tickets - COALESCE((SELECT SUM(adult_tickets + student_tickets) FROM booking WHERE booking.show_id = show.id), 0)
+        END
+    """)
+
+
+def downgrade():
+    op.execute("""
+        UPDATE show SET available_tickets = CASE
+            WHEN total_tickets - COALESCE((SELECT SUM(adult_tickets + student_tickets) FROM booking WHERE booking.show_id = show.id AND booking.status = 'confirmed'), 0) < 0 THEN 0
+            ELSE total_tickets - COALESCE((SELECT SUM(adult_tickets + student_tickets) FROM booking WHERE booking.show_id = show.id AND booking.status = 'confirmed'), 0)
+        END
+    """)
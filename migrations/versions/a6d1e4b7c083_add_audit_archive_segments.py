@@ -0,0 +1,36 @@
+"""Add audit archive segments
+
+Revision ID: a6d1e4b7c083
+Revises: f3c8d2a6b914
+Create Date: 2026-10-18 00:32:51.118340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d1e4b7c083'
+down_revision = 'f3c8d2a6b914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_archive_segment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=100), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('first_id', sa.Integer(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('first_timestamp', sa.DateTime(), nullable=False),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+    sa.Column('facets', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('filename')
+    )
+
+
+def downgrade():
+    op.drop_table('audit_archive_segment')
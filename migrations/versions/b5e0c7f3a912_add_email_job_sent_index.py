@@ -0,0 +1,24 @@
+"""Index sent email jobs for the shared sending limits
+
+Revision ID: b5e0c7f3a912
+Revises: c2f7a9d4e618
+Create Date: 2026-10-18 09:42:11.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e0c7f3a912'
+down_revision = 'c2f7a9d4e618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_email_job_status_finished_at', 'email_job', ['status', 'finished_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_email_job_status_finished_at', table_name='email_job')
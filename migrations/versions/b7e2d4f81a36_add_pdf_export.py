@@ -0,0 +1,39 @@
+"""Add pdf export
+
+Revision ID: b7e2d4f81a36
+Revises: 3f1a6c2d9e07
+Create Date: 2026-10-17 12:21:09.442871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4f81a36'
+down_revision = '3f1a6c2d9e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pdf_export',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('show_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('parts_total', sa.Integer(), nullable=False),
+    sa.Column('parts_done', sa.Integer(), nullable=False),
+    sa.Column('tickets_total', sa.Integer(), nullable=False),
+    sa.Column('tickets_done', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_by', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['show_id'], ['show.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('pdf_export')
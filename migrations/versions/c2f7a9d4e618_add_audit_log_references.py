@@ -0,0 +1,58 @@
+"""Add booking and ticket references to the audit log
+
+Revision ID: c2f7a9d4e618
+Revises: a6d1e4b7c083
+Create Date: 2026-10-18 01:14:26.640952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a9d4e618'
+down_revision = 'a6d1e4b7c083'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audit_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('booking_reference', sa.String(length=10), nullable=True))
+        batch_op.add_column(sa.Column('ticket_reference', sa.String(length=20), nullable=True))
+
+    # Fill the new columns from the JSON details, then ticket events from the ticket's booking
+    op.execute("""
+        UPDATE audit_log
+        SET booking_reference = json_extract(details, '$.booking_reference'),
+            ticket_reference = json_extract(details, '$.ticket_reference')
+        WHERE details IS NOT NULL AND json_valid(details)
+    """)
+    op.execute("""
+        UPDATE audit_log
+        SET booking_reference = (
+            SELECT booking.booking_reference FROM ticket JOIN booking ON booking.id = ticket.booking_id
+            WHERE ticket.ticket_reference = audit_log.ticket_reference
+        )
+        WHERE booking_reference IS NULL AND ticket_reference IS NOT NULL
+    """)
+
+    op.create_index('ix_audit_log_booking_reference_timestamp', 'audit_log', ['booking_reference', 'timestamp'], unique=False)
+    op.create_index('ix_audit_log_ticket_reference', 'audit_log', ['ticket_reference'], unique=False)
+
+    op.create_table('audit_archive_reference',
+    sa.Column('booking_reference', sa.String(length=10), nullable=False),
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['segment_id'], ['audit_archive_segment.id'], ),
+    sa.PrimaryKeyConstraint('booking_reference', 'segment_id')
+    )
+
+
+def downgrade():
+    op.drop_table('audit_archive_reference')
+    op.drop_index('ix_audit_log_ticket_reference', table_name='audit_log')
+    op.drop_index('ix_audit_log_booking_reference_timestamp', table_name='audit_log')
+
+    with op.batch_alter_table('audit_log', schema=None) as batch_op:
+        batch_op.drop_column('ticket_reference')
+        batch_op.drop_column('booking_reference')
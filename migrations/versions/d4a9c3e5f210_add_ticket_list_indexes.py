@@ -0,0 +1,36 @@
+"""Add ticket list indexes
+
+Revision ID: d4a9c3e5f210
+Revises: b7e2d4f81a36
+Create Date: 2026-10-17 22:05:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a9c3e5f210'
+down_revision = 'b7e2d4f81a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_ticket_show_id', 'ticket', ['show_id'], unique=False)
+    op.create_index('ix_ticket_is_used', 'ticket', ['is_used'], unique=False)
+    op.create_index('ix_ticket_booking_id', 'ticket', ['booking_id'], unique=False)
+    op.create_index('ix_ticket_reference_nocase', 'ticket', [sa.text('ticket_reference COLLATE NOCASE')], unique=False)
+    op.create_index('ix_booking_reference_nocase', 'booking', [sa.text('booking_reference COLLATE NOCASE')], unique=False)
+    op.create_index('ix_booking_first_name_nocase', 'booking', [sa.text('first_name COLLATE NOCASE')], unique=False)
+    op.create_index('ix_booking_last_name_nocase', 'booking', [sa.text('last_name COLLATE NOCASE')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_booking_last_name_nocase', table_name='booking')
+    op.drop_index('ix_booking_first_name_nocase', table_name='booking')
+    op.drop_index('ix_booking_reference_nocase', table_name='booking')
+    op.drop_index('ix_ticket_reference_nocase', table_name='ticket')
+    op.drop_index('ix_ticket_booking_id', table_name='ticket')
+    op.drop_index('ix_ticket_is_used', table_name='ticket')
+    op.drop_index('ix_ticket_show_id', table_name='ticket')
@@ -0,0 +1,111 @@
+"""Index audit archive segments written before the reference columns
+
+Revision ID: e1c4b8a2f5d7
+Revises: b5e0c7f3a912
+Create Date: 2026-10-18 10:27:53.504617
+
+"""
+import gzip
+import json
+import os
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1c4b8a2f5d7'
+down_revision = 'b5e0c7f3a912'
+branch_labels = None
+depends_on = None
+
+# Tables as they are at this revision, so the migration does not depend on the app's models
+audit_archive_segment = sa.table('audit_archive_segment', sa.column('id', sa.Integer), sa.column('filename', sa.String))
+audit_archive_reference = sa.table('audit_archive_reference', sa.column('booking_reference', sa.String),
+                                   sa.column('segment_id', sa.Integer))
+ticket = sa.table('ticket', sa.column('ticket_reference', sa.String), sa.column('booking_id', sa.Integer))
+booking = sa.table('booking', sa.column('id', sa.Integer), sa.column('booking_reference', sa.String))
+
+
+def _archive_dir():
+    """-x audit_archive_dir=..., else AUDIT_ARCHIVE_DIR, else instance/audit_archive like the app"""
+    path = context.get_x_argument(as_dictionary=True).get('audit_archive_dir') or os.environ.get('AUDIT_ARCHIVE_DIR')
+    if not path:
+        project = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        path = os.path.join(project, 'instance', 'audit_archive')
+    return path
+
+
+def _read_segment(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _rewrite_segment(path, rows):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+
+def upgrade():
+    # Segments archived before c2f7a9d4e618 have no references in their rows or in
+    # audit_archive_reference, so booking history would leave their events out. Their rows get
+    # booking_reference/ticket_reference from details (ticket events from the ticket's booking),
+    # the file is rewritten with them and the segment is indexed.
+    connection = op.get_bind()
+    archive_dir = _archive_dir()
+    indexed = sa.select(audit_archive_reference.c.segment_id)
+    segments = connection.execute(
+        sa.select(audit_archive_segment.c.id, audit_archive_segment.c.filename)
+        .where(audit_archive_segment.c.id.not_in(indexed))
+    ).all()
+
+    count = 0
+    for segment_id, filename in segments:
+        path = os.path.join(archive_dir, filename)
+        if not os.path.exists(path):
+            print(f"Audit archive segment {filename} is missing, not indexed")
+            continue
+        rows = _read_segment(path)
+        old = [row for row in rows if 'booking_reference' not in row]
+        for row in old:
+            try:
+                details = json.loads(row['details']) if row.get('details') else {}
+            except ValueError:
+                details = {}
+            if not isinstance(details, dict):
+                details = {}
+            row['booking_reference'] = details.get('booking_reference')
+            row['ticket_reference'] = details.get('ticket_reference')
+
+        tickets = {row['ticket_reference'] for row in old if row['ticket_reference'] and not row['booking_reference']}
+        if tickets:
+            bookings = dict(connection.execute(
+                sa.select(ticket.c.ticket_reference, booking.c.booking_reference)
+                .join(booking, ticket.c.booking_id == booking.c.id)
+                .where(ticket.c.ticket_reference.in_(tickets))
+            ).all())
+            for row in old:
+                if not row['booking_reference']:
+                    row['booking_reference'] = bookings.get(row['ticket_reference'])
+
+        if old:
+            _rewrite_segment(path, rows)
+        references = {row['booking_reference'] for row in rows if row['booking_reference']}
+        if references:
+            connection.execute(sa.insert(audit_archive_reference), [
+                dict(booking_reference=reference, segment_id=segment_id) for reference in sorted(references)
+            ])
+            count += 1
+    if count:
+        print(f"Indexed {count} audit archive segments")
+
+
+def downgrade():
+    # The references stay valid for the previous revision, nothing to undo
+    pass
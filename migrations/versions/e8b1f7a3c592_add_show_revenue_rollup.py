@@ -0,0 +1,51 @@
+"""Add show revenue rollup
+
+Revision ID: e8b1f7a3c592
+Revises: d4a9c3e5f210
+Create Date: 2026-10-17 22:48:17.530662
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b1f7a3c592'
+down_revision = 'd4a9c3e5f210'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_revenue',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('confirmed_revenue', sa.Integer(), nullable=False),
+    sa.Column('potential_revenue', sa.Integer(), nullable=False),
+    sa.Column('confirmed_bookings', sa.Integer(), nullable=False),
+    sa.Column('reserved_bookings', sa.Integer(), nullable=False),
+    sa.Column('adult_tickets_sold', sa.Integer(), nullable=False),
+    sa.Column('student_tickets_sold', sa.Integer(), nullable=False),
+    sa.Column('total_tickets', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['show_id'], ['show.id'], ),
+    sa.PrimaryKeyConstraint('show_id')
+    )
+
+    # Fill the rollup from the existing bookings
+    op.execute("""
+        INSERT INTO show_revenue (show_id, confirmed_revenue, potential_revenue, confirmed_bookings,
+                                  reserved_bookings, adult_tickets_sold, student_tickets_sold, total_tickets)
+        SELECT show.id,
+               COALESCE(SUM(CASE WHEN booking.status = 'confirmed' THEN booking.total_amount ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN booking.status = 'confirmed' THEN 0 ELSE booking.total_amount END), 0),
+               COUNT(CASE WHEN booking.status = 'confirmed' THEN booking.id END),
+               COUNT(CASE WHEN booking.status != 'confirmed' THEN booking.id END),
+               COALESCE(SUM(CASE WHEN booking.status = 'confirmed' THEN booking.adult_tickets ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN booking.status = 'confirmed' THEN booking.student_tickets ELSE 0 END), 0),
+               COALESCE(SUM(booking.adult_tickets + booking.student_tickets), 0)
+        FROM show LEFT JOIN booking ON booking.show_id = show.id
+        GROUP BY show.id
+    """)
+
+
+def downgrade():
+    op.drop_table('show_revenue')
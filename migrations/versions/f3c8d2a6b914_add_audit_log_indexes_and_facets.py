@@ -0,0 +1,45 @@
+"""Add audit log indexes and filter facets
+
+Revision ID: f3c8d2a6b914
+Revises: e8b1f7a3c592
+Create Date: 2026-10-17 23:41:09.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d2a6b914'
+down_revision = 'e8b1f7a3c592'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_audit_log_timestamp', 'audit_log', ['timestamp'], unique=False)
+    op.create_index('ix_audit_log_action_type_timestamp', 'audit_log', ['action_type', 'timestamp'], unique=False)
+    op.create_index('ix_audit_log_user_identifier_timestamp', 'audit_log', ['user_identifier', 'timestamp'], unique=False)
+    op.create_index('ix_audit_log_entity', 'audit_log', ['entity_type', 'entity_id'], unique=False)
+
+    op.create_table('audit_facet',
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value')
+    )
+
+    # Fill the facets from the existing audit log
+    for facet, column in (('action', 'action_type'), ('entity', 'entity_type'), ('user', 'user_identifier')):
+        op.execute(f"""
+            INSERT INTO audit_facet (facet, value, count)
+            SELECT '{facet}', {column}, COUNT(*) FROM audit_log GROUP BY {column}
+        """)
+
+
+def downgrade():
+    op.drop_table('audit_facet')
+    op.drop_index('ix_audit_log_entity', table_name='audit_log')
+    op.drop_index('ix_audit_log_user_identifier_timestamp', table_name='audit_log')
+    op.drop_index('ix_audit_log_action_type_timestamp', table_name='audit_log')
+    op.drop_index('ix_audit_log_timestamp', table_name='audit_log')
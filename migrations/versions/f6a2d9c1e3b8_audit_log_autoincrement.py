@@ -0,0 +1,49 @@
+"""Never reuse audit_log ids
+
+Revision ID: f6a2d9c1e3b8
+Revises: e1c4b8a2f5d7
+Create Date: 2026-10-18 14:05:37.912406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a2d9c1e3b8'
+down_revision = 'e1c4b8a2f5d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A plain SQLite INTEGER PRIMARY KEY hands out the ids of deleted (archived) rows again;
+    # AUTOINCREMENT needs the table rebuilt. Other databases never reuse sequence values.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('audit_log', recreate='always', table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+    # Continue after the highest id ever used, archived ones included
+    op.execute("""
+        UPDATE sqlite_sequence SET seq = max(
+            seq,
+            COALESCE((SELECT MAX(id) FROM audit_log), 0),
+            COALESCE((SELECT MAX(last_id) FROM audit_archive_segment), 0)
+        ) WHERE name = 'audit_log'
+    """)
+    op.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'audit_log', max(
+            COALESCE((SELECT MAX(id) FROM audit_log), 0),
+            COALESCE((SELECT MAX(last_id) FROM audit_archive_segment), 0)
+        )
+        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'audit_log')
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('audit_log', recreate='always', table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
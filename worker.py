@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Background worker for queued emails, PDF exports and audit archiving
+Sends the emails the web app queues in the email_job table, with retries,
+renders bulk ticket PDF exports requested from the admin panel
+and moves old audit events to the audit archive every few hours
+
+Usage:
+    python worker.py            # Process jobs until stopped
+    python worker.py --once     # Process all due jobs and exit
+"""
+
+import sys
+import threading
+from app import create_app
+from app.utils.jobs import run_worker
+from app.utils.pdf_export import run_export_worker
+from app.utils.audit_archive import run_archive_worker
+
+app = create_app()
+
+if __name__ == '__main__':
+    try:
+        if '--once' not in sys.argv:
+            threading.Thread(target=run_export_worker, args=(app,), daemon=True).start()
+            threading.Thread(target=run_archive_worker, args=(app,), daemon=True).start()
+        run_worker(app, once='--once' in sys.argv)
+    except KeyboardInterrupt:
+        print("\n🛑 Email worker stopped by user")